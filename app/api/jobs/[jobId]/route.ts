@@ -0,0 +1,31 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+export const dynamic = 'force-dynamic';
+
+// Proxy: trạng thái job (client poll đến khi status là succeeded / failed)
+export async function GET(
+  _request: NextRequest,
+  { params }: { params: { jobId: string } },
+) {
+  try {
+    const backendUrl = process.env.BACKEND_URL || 'http://localhost:8000';
+    const response = await fetch(`${backendUrl}/jobs/${encodeURIComponent(params.jobId)}`, {
+      cache: 'no-store',
+    });
+
+    const data = await response.json().catch(() => ({}));
+    if (!response.ok) {
+      return NextResponse.json(
+        { error: data.detail || `Backend error: ${response.statusText}` },
+        { status: response.status },
+      );
+    }
+    return NextResponse.json(data);
+  } catch (error) {
+    console.error('Error fetching job:', error);
+    return NextResponse.json(
+      { error: 'Không thể lấy trạng thái yêu cầu' },
+      { status: 500 },
+    );
+  }
+}
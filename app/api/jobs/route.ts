@@ -0,0 +1,51 @@
+import { NextRequest, NextResponse } from 'next/server';
+import { clientHeaders, overloadResponse } from '@/lib/backend';
+
+// Proxy: tạo job giải bài, trả về job id ngay (không giữ kết nối trong lúc sinh lời giải)
+export async function POST(request: NextRequest) {
+  try {
+    const backendUrl = process.env.BACKEND_URL || 'http://localhost:8000';
+    const { subject, problem, image_base64, image_mime_type, profile, mode } = await request.json();
+
+    if (!problem && !image_base64) {
+      return NextResponse.json(
+        { error: 'Problem text or image is required' },
+        { status: 400 },
+      );
+    }
+
+    const response = await fetch(`${backendUrl}/jobs`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        ...clientHeaders(request),
+      },
+      body: JSON.stringify({
+        subject: subject || 'math',
+        problem: problem || undefined,
+        image_base64: image_base64 || undefined,
+        image_mime_type: image_mime_type || undefined,
+        profile: profile || undefined,
+        mode: mode || undefined,
+      }),
+    });
+
+    const overloaded = overloadResponse(response);
+    if (overloaded) return overloaded;
+
+    const data = await response.json().catch(() => ({}));
+    if (!response.ok) {
+      return NextResponse.json(
+        { error: data.detail || `Backend error: ${response.statusText}` },
+        { status: response.status },
+      );
+    }
+    return NextResponse.json(data, { status: 202 });
+  } catch (error) {
+    console.error('Error creating job:', error);
+    return NextResponse.json(
+      { error: 'Không thể tạo yêu cầu giải bài' },
+      { status: 500 },
+    );
+  }
+}
@@ -1,10 +1,11 @@
 import { NextRequest, NextResponse } from 'next/server';
+import { clientHeaders, overloadResponse } from '@/lib/backend';
 import { SATEnglishSolutionOutput } from '@/types/schemas';
 
 // Proxy to Python FastAPI backend for SAT English
 export async function POST(request: NextRequest) {
   try {
-    const { problem } = await request.json();
+    const { problem, profile } = await request.json();
 
     if (!problem) {
       return NextResponse.json(
@@ -24,12 +25,17 @@ export async function POST(request: NextRequest) {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          ...clientHeaders(request),
         },
         body: JSON.stringify({
           problem: problem || undefined,
+          profile: profile || undefined,
         }),
       });
 
+      const overloaded = overloadResponse(response);
+      if (overloaded) return overloaded;
+
       if (!response.ok) {
         throw new Error(`Backend error: ${response.statusText}`);
       }
@@ -0,0 +1,54 @@
+import { NextRequest, NextResponse } from 'next/server';
+import { clientHeaders, overloadResponse } from '@/lib/backend';
+
+export const dynamic = 'force-dynamic';
+
+// Proxy Server-Sent Events stream from Python FastAPI backend for SAT English
+export async function POST(request: NextRequest) {
+  try {
+    const { problem, profile } = await request.json();
+
+    if (!problem) {
+      return NextResponse.json(
+        { error: 'Problem text is required for SAT English' },
+        { status: 400 },
+      );
+    }
+
+    const backendUrl = process.env.BACKEND_URL || 'http://localhost:8000';
+
+    const response = await fetch(`${backendUrl}/solve-english/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        ...clientHeaders(request),
+        Accept: 'text/event-stream',
+      },
+      body: JSON.stringify({ problem, profile: profile || undefined }),
+    });
+
+    const overloaded = overloadResponse(response);
+    if (overloaded) return overloaded;
+
+    if (!response.ok || !response.body) {
+      throw new Error(`Backend error: ${response.statusText}`);
+    }
+
+    return new Response(response.body, {
+      headers: {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        Connection: 'keep-alive',
+      },
+    });
+  } catch (error) {
+    console.error('Error streaming SAT English solution:', error);
+    return NextResponse.json(
+      {
+        error: error instanceof Error ? error.message : 'Internal server error',
+        details: process.env.NODE_ENV === 'development' ? String(error) : undefined,
+      },
+      { status: 502 },
+    );
+  }
+}
@@ -0,0 +1,37 @@
+import { NextRequest, NextResponse } from 'next/server';
+import { clientHeaders, overloadResponse } from '@/lib/backend';
+import { SolutionPath } from '@/types/schemas';
+
+// Proxy: sinh một hướng giải còn lại của lời giải lazy khi người dùng mở
+export async function POST(
+  request: NextRequest,
+  { params }: { params: { solutionId: string; pathId: string } },
+) {
+  try {
+    const backendUrl = process.env.BACKEND_URL || 'http://localhost:8000';
+    const response = await fetch(
+      `${backendUrl}/solve/${encodeURIComponent(params.solutionId)}/paths/${encodeURIComponent(params.pathId)}`,
+      { method: 'POST', headers: clientHeaders(request) },
+    );
+
+    const overloaded = overloadResponse(response);
+    if (overloaded) return overloaded;
+
+    if (!response.ok) {
+      const errorData = await response.json().catch(() => ({}));
+      return NextResponse.json(
+        { error: errorData.detail || `Backend error: ${response.statusText}` },
+        { status: response.status },
+      );
+    }
+
+    const path: SolutionPath = await response.json();
+    return NextResponse.json(path);
+  } catch (error) {
+    console.error('Error expanding solution path:', error);
+    return NextResponse.json(
+      { error: error instanceof Error ? error.message : 'Internal server error' },
+      { status: 500 },
+    );
+  }
+}
@@ -1,38 +1,63 @@
 import { NextRequest, NextResponse } from 'next/server';
+import { clientHeaders, overloadResponse } from '@/lib/backend';
 import { SATMathSolutionOutput } from '@/types/schemas';
 
 // Proxy to Python FastAPI backend
 export async function POST(request: NextRequest) {
   try {
-    const { problem, image_base64, image_mime_type } = await request.json();
-
-    if (!problem && !image_base64) {
-      return NextResponse.json(
-        { error: 'Problem text or image is required' },
-        { status: 400 }
-      );
-    }
-
     // Get backend URL from environment variable
     // Fallback to localhost:8000 for local development
     // Format: https://backend-app.vercel.app (without trailing slash)
     const backendUrl = process.env.BACKEND_URL || 'http://localhost:8000';
+    const contentType = request.headers.get('content-type') || '';
+    const isUpload = contentType.startsWith('multipart/form-data');
+
+    let problem: string | undefined;
+    let image_base64: string | undefined;
+    let image_mime_type: string | undefined;
+    let profile: string | undefined;
+    let mode: string | undefined;
+    if (!isUpload) {
+      ({ problem, image_base64, image_mime_type, profile, mode } = await request.json());
+
+      if (!problem && !image_base64) {
+        return NextResponse.json(
+          { error: 'Problem text or image is required' },
+          { status: 400 }
+        );
+      }
+    }
     
     try {
       // Call external backend
-      const apiUrl = `${backendUrl}/solve`;
-      
-      const response = await fetch(apiUrl, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({ 
-        problem: problem || undefined,
-        image_base64: image_base64 || undefined,
-        image_mime_type: image_mime_type || undefined,
-      }),
-      });
+      // Ảnh upload dạng binary (multipart) được chuyển nguyên body sang /solve/upload
+      const response = isUpload
+        ? await fetch(`${backendUrl}/solve/upload`, {
+            method: 'POST',
+            headers: {
+              'Content-Type': contentType,
+              ...clientHeaders(request),
+            },
+            body: request.body,
+            duplex: 'half',
+          } as RequestInit)
+        : await fetch(`${backendUrl}/solve`, {
+            method: 'POST',
+            headers: {
+              'Content-Type': 'application/json',
+              ...clientHeaders(request),
+            },
+            body: JSON.stringify({ 
+            problem: problem || undefined,
+            image_base64: image_base64 || undefined,
+            image_mime_type: image_mime_type || undefined,
+            profile: profile || undefined,
+            mode: mode || undefined,
+          }),
+          });
+
+      const overloaded = overloadResponse(response);
+      if (overloaded) return overloaded;
 
       if (!response.ok) {
         throw new Error(`Backend error: ${response.statusText}`);
@@ -53,7 +78,7 @@ export async function POST(request: NextRequest) {
             time_target_seconds: 120,
           },
           summary: {
-            givens: [problem],
+            givens: [problem || 'Đề bài từ ảnh upload'],
             goal: 'Find the solution',
             required_knowledge: [
               {
@@ -0,0 +1,77 @@
+import { NextRequest, NextResponse } from 'next/server';
+import { clientHeaders, overloadResponse } from '@/lib/backend';
+
+export const dynamic = 'force-dynamic';
+
+// Proxy Server-Sent Events stream from Python FastAPI backend
+export async function POST(request: NextRequest) {
+  try {
+    const backendUrl = process.env.BACKEND_URL || 'http://localhost:8000';
+    const contentType = request.headers.get('content-type') || '';
+
+    let response: Response;
+    if (contentType.startsWith('multipart/form-data')) {
+      // Ảnh upload dạng binary: chuyển nguyên body sang backend, không parse lại
+      response = await fetch(`${backendUrl}/solve/upload/stream`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': contentType,
+          ...clientHeaders(request),
+          Accept: 'text/event-stream',
+        },
+        body: request.body,
+        duplex: 'half',
+      } as RequestInit);
+    } else {
+      const { problem, image_base64, image_mime_type, profile, mode } = await request.json();
+
+      if (!problem && !image_base64) {
+        return NextResponse.json(
+          { error: 'Problem text or image is required' },
+          { status: 400 }
+        );
+      }
+
+      response = await fetch(`${backendUrl}/solve/stream`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          ...clientHeaders(request),
+          Accept: 'text/event-stream',
+        },
+        body: JSON.stringify({
+          problem: problem || undefined,
+          image_base64: image_base64 || undefined,
+          image_mime_type: image_mime_type || undefined,
+          profile: profile || undefined,
+          mode: mode || undefined,
+        }),
+      });
+    }
+
+    const overloaded = overloadResponse(response);
+    if (overloaded) return overloaded;
+
+    if (!response.ok || !response.body) {
+      throw new Error(`Backend error: ${response.statusText}`);
+    }
+
+    // Pass the event stream through without buffering
+    return new Response(response.body, {
+      headers: {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        Connection: 'keep-alive',
+      },
+    });
+  } catch (error) {
+    console.error('Error streaming solution:', error);
+    return NextResponse.json(
+      {
+        error: error instanceof Error ? error.message : 'Internal server error',
+        details: process.env.NODE_ENV === 'development' ? String(error) : undefined
+      },
+      { status: 502 }
+    );
+  }
+}
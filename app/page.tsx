@@ -10,6 +10,16 @@ import SolutionViewer from '@/components/SolutionViewer';
 import EnglishSolutionViewer from '@/components/EnglishSolutionViewer';
 import LoadingState from '@/components/LoadingState';
 import LatexRenderer from '@/components/LatexRenderer';
+import { readSSE } from '@/lib/sse';
+import { solveWithJob } from '@/lib/jobs';
+
+type PartialSolution = Record<string, unknown> & { solution_paths: unknown[] };
+
+// Chỉ hiển thị lời giải từng phần khi đã có đủ các phần viewer bắt buộc
+function isRenderable(partial: PartialSolution, subject: 'math' | 'english') {
+  if (!partial.sat_meta || !partial.summary) return false;
+  return subject === 'english' || !!partial.answer_spec;
+}
 
 export default function Home() {
   const [problem, setProblem] = useState('');
@@ -19,8 +29,11 @@ export default function Home() {
     SATMathSolutionOutput | SATEnglishSolutionOutput | null
   >(null);
   const [loading, setLoading] = useState(false);
+  const [streaming, setStreaming] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [subject, setSubject] = useState<'math' | 'english'>('math');
+  // Mức chi tiết: "quick" nhanh nhất (1 hướng giải, ít bước), "full" đầy đủ nhất
+  const [profile, setProfile] = useState<'full' | 'standard' | 'quick'>('full');
 
   const handleImageChange = (e: React.ChangeEvent<HTMLInputElement>) => {
     const file = e.target.files?.[0];
@@ -61,39 +74,98 @@ export default function Home() {
     setSolution(null);
 
     try {
-      // Convert image to base64 if exists (Math only)
-      let imageBase64: string | null = null;
+      // Ảnh (chỉ Math) được gửi dạng binary qua multipart, không chuyển sang base64
+      const apiPath = subject === 'math' ? '/api/solve' : '/api/solve-english';
+      let body: BodyInit;
+      let headers: HeadersInit = { 'Content-Type': 'application/json' };
       if (subject === 'math' && image) {
-        imageBase64 = await new Promise<string>((resolve, reject) => {
-          const reader = new FileReader();
-          reader.onloadend = () => {
-            const result = reader.result as string;
-            // Remove data:image/...;base64, prefix
-            const base64 = result.split(',')[1];
-            resolve(base64);
-          };
-          reader.onerror = reject;
-          reader.readAsDataURL(image);
+        const form = new FormData();
+        if (problem.trim()) {
+          form.append('problem', problem.trim());
+        }
+        form.append('image', image, image.name);
+        form.append('profile', profile);
+        form.append('mode', 'lazy');
+        body = form;
+        // Trình duyệt tự đặt Content-Type kèm boundary
+        headers = {};
+      } else {
+        body = JSON.stringify({
+          problem: problem.trim() || undefined,
+          profile,
+          // Math: chỉ sinh hướng giải khuyến nghị, các hướng khác sinh khi mở
+          mode: subject === 'math' ? 'lazy' : undefined,
         });
       }
 
-      const apiPath = subject === 'math' ? '/api/solve' : '/api/solve-english';
+      // Ưu tiên stream (SSE) để hiển thị từng phần lời giải ngay khi có
+      const streamResponse = await fetch(`${apiPath}/stream`, {
+        method: 'POST',
+        headers,
+        body,
+      });
+
+      // Quá tải / vượt rate limit: báo lỗi, không gửi lại qua endpoint không stream
+      if (streamResponse.status === 429 || streamResponse.status === 503) {
+        const errorData = await streamResponse.json().catch(() => ({}));
+        throw new Error(errorData.error || 'Hệ thống đang quá tải, vui lòng thử lại sau.');
+      }
+
+      if (streamResponse.ok && streamResponse.body) {
+        setStreaming(true);
+        let partial: PartialSolution = { solution_paths: [] };
+        let done = false;
+
+        await readSSE(streamResponse, (event, data) => {
+          if (event === 'error') {
+            throw new Error(
+              (data as { detail?: string }).detail || 'Không thể giải bài toán',
+            );
+          }
+          if (event === 'solution') {
+            done = true;
+            setSolution(
+              data as SATMathSolutionOutput | SATEnglishSolutionOutput,
+            );
+            return;
+          }
+          if (event === 'solution_path') {
+            const { index, path } = data as { index: number; path: unknown };
+            const paths = [...partial.solution_paths];
+            paths[index] = path;
+            partial = { ...partial, solution_paths: paths };
+          } else {
+            partial = { ...partial, [event]: data };
+          }
+          if (isRenderable(partial, subject)) {
+            setSolution(
+              partial as unknown as
+                | SATMathSolutionOutput
+                | SATEnglishSolutionOutput,
+            );
+          }
+        });
+
+        if (!done) {
+          throw new Error('Kết nối bị gián đoạn trước khi có lời giải đầy đủ');
+        }
+        return;
+      }
+
+      // Fallback không stream (ví dụ serverless không giữ được kết nối lâu):
+      // bài chỉ có text đi qua job API + poll, không giữ request trong lúc sinh lời giải
+      if (typeof body === 'string') {
+        const data = await solveWithJob<
+          SATMathSolutionOutput | SATEnglishSolutionOutput
+        >({ ...JSON.parse(body), subject });
+        setSolution(data);
+        return;
+      }
 
       const response = await fetch(apiPath, {
         method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body:
-          subject === 'math'
-            ? JSON.stringify({
-                problem: problem.trim() || undefined,
-                image_base64: imageBase64,
-                image_mime_type: image?.type || undefined,
-              })
-            : JSON.stringify({
-                problem: problem.trim(),
-              }),
+        headers,
+        body,
       });
 
       if (!response.ok) {
@@ -112,6 +184,7 @@ export default function Home() {
       setError(err instanceof Error ? err.message : 'Đã xảy ra lỗi');
     } finally {
       setLoading(false);
+      setStreaming(false);
     }
   };
 
@@ -166,6 +239,21 @@ export default function Home() {
                 SAT English
               </button>
             </div>
+            <label htmlFor="profile" className="ml-4 text-sm text-gray-700">
+              Mức chi tiết:
+            </label>
+            <select
+              id="profile"
+              value={profile}
+              onChange={(e) =>
+                setProfile(e.target.value as 'full' | 'standard' | 'quick')
+              }
+              className="ml-2 px-3 py-2 text-sm border border-gray-300 rounded-lg"
+            >
+              <option value="full">Đầy đủ</option>
+              <option value="standard">Tiêu chuẩn</option>
+              <option value="quick">Nhanh</option>
+            </select>
           </div>
 
           <div className="mb-4">
@@ -293,7 +381,7 @@ export default function Home() {
           )}
         </div>
 
-        {loading && (
+        {loading && !solution && (
           <LoadingState message="Đang giải bài toán..." />
         )}
 
@@ -310,16 +398,17 @@ export default function Home() {
           </div>
         )}
 
-        {solution && !loading && subject === 'math' && 'answer_spec' in solution && (
+        {solution && subject === 'math' && 'answer_spec' in solution && (
           <div className="bg-white rounded-lg shadow-lg p-6 animate-fade-in">
             <SolutionViewer
               solution={solution as SATMathSolutionOutput}
               originalProblem={problem || undefined}
+              streaming={streaming}
             />
           </div>
         )}
 
-        {solution && !loading && subject === 'english' && !('answer_spec' in solution) && (
+        {solution && subject === 'english' && !('answer_spec' in solution) && (
           <div className="bg-white rounded-lg shadow-lg p-6 animate-fade-in">
             <EnglishSolutionViewer
               solution={solution as SATEnglishSolutionOutput}
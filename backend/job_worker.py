@@ -0,0 +1,53 @@
+"""
+Standalone worker for the /jobs queue
+
+Runs job workers without serving HTTP, so solve capacity scales separately
+from web processes. Point every process at the same queue file
+(JOB_QUEUE_DB_PATH); web processes can then run with JOB_WORKERS=0.
+
+Usage:
+    python job_worker.py --workers 4
+"""
+import argparse
+import asyncio
+import signal
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+from services.jobs import create_worker_pool
+from services.llm_client import close_llm_client, open_llm_client
+from services.verification import get_verifier
+
+
+async def run(workers: int) -> None:
+    client = await open_llm_client()
+    pool = create_worker_pool(client, workers=workers)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    pool.start()
+    print(f"Job worker {pool.worker_id}: {workers} workers on {pool.queue.path}")
+    try:
+        await stop.wait()
+    finally:
+        # Job đang chạy được trả lại hàng đợi cho worker khác
+        await pool.stop()
+        get_verifier().close()
+        await close_llm_client()
+        print(f"Job worker stopped: {pool.snapshot()}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run /jobs queue workers")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent jobs in this process")
+    args = parser.parse_args()
+    asyncio.run(run(args.workers))
+
+
+if __name__ == "__main__":
+    main()
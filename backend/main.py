@@ -1,18 +1,92 @@
 """
 FastAPI Backend for SAT Math Problem Solver
 """
-from fastapi import FastAPI, HTTPException
+import os
+import asyncio
+import hashlib
+import json
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.datastructures import UploadFile
+from pydantic import BaseModel, Field
+from typing import Optional, Any, AsyncIterator, Literal, List, Tuple, Union, get_args
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-from services.schemas import SATMathSolutionOutput, SATEnglishSolutionOutput
+from services.schemas import (
+    SATMathSolutionOutput,
+    SATMathLazySolution,
+    SATEnglishSolutionOutput,
+    SolutionPath,
+)
+from services.cache import get_solution_cache
+from services.singleflight import get_single_flight
+from services.batch import run_bounded
+from services.metrics import get_metrics_registry, get_usage_metrics
+from services.tracing import TracingMiddleware
+from services.routing import get_model_router
+from services.resilience import CircuitOpenError, get_hedged_executor
+from services.admission import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    AdmissionRejected,
+    get_admission_controller,
+    get_rate_limiter,
+    retry_after_header,
+    set_call_priority,
+)
+from services.repair import get_repair_stats
+from services.image_pipeline import ImageError
+from services.serialization import FastJSONResponse, dumps
+from services.profiles import PROFILE_NAMES, ProfileName
+from services.solution_store import get_similarity_index, get_solution_store
+from services.llm_client import LLMClient, open_llm_client, close_llm_client
+from services.jobs import create_worker_pool, get_job_queue
+from services.shared_state import get_shared_state, worker_count
+from services.verification import get_verifier
+from services.fast_path import fast_path_snapshot
+from services.voting import vote_snapshot
+# Import một lần khi khởi động (load prompt registry + schema prefixes),
+# không import lại trong từng request
+from services.llm_service import (
+    solve_sat_problem,
+    solve_sat_english_problem,
+    stream_sat_problem,
+    stream_sat_english_problem,
+    solve_pending_path,
+    SolutionNotFoundError,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # LLM client dùng chung: connection pool keep-alive sống suốt vòng đời app
+    app.state.llm_client = await open_llm_client()
+    # Worker /jobs chạy trong process web; JOB_WORKERS=0 khi dùng job_worker.py riêng
+    app.state.job_pool = None
+    if int(os.getenv("JOB_WORKERS", "2")) > 0:
+        app.state.job_pool = create_worker_pool(app.state.llm_client)
+        app.state.job_pool.start()
+    try:
+        yield
+    finally:
+        if app.state.job_pool is not None:
+            await app.state.job_pool.stop()
+        get_verifier().close()
+        await close_llm_client()
 
-app = FastAPI(title="SAT Math & English Solver API (local)")
+
+app = FastAPI(
+    title="SAT Math & English Solver API (local)",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,17 +97,109 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "Server-Timing"],
 )
+# Thêm sau CORS để đo cả thời gian của các middleware bên trong
+app.add_middleware(TracingMiddleware)
+
+
+# "single": một lần gọi LLM; "pipeline": phân tích trước rồi sinh các path song song;
+# "lazy": chỉ sinh path khuyến nghị, các path khác sinh khi người dùng mở;
+# "vote": bài khó lấy nhiều mẫu đáp án song song, bỏ phiếu rồi mới sinh lời giải đầy đủ
+SolveMode = Literal["single", "pipeline", "lazy", "vote"]
+
+# Lazy mode trả về SATMathLazySolution (thêm solution_id, pending_paths)
+MathSolutionResponse = Union[SATMathLazySolution, SATMathSolutionOutput]
 
 
 class ProblemRequest(BaseModel):
     problem: Optional[str] = None
     image_base64: Optional[str] = None
     image_mime_type: Optional[str] = None
+    mode: Optional[SolveMode] = None
+    # "full" | "standard" | "quick": schema gọn hơn + giới hạn path/step/token để trả lời nhanh hơn
+    profile: Optional[ProfileName] = None
 
 
 class EnglishProblemRequest(BaseModel):
     problem: str
+    profile: Optional[ProfileName] = None
+
+
+class BatchItem(BaseModel):
+    id: Optional[str] = None  # ID phía client (ví dụ số câu trong module)
+    subject: Literal["math", "english"] = "math"
+    problem: Optional[str] = None
+    image_base64: Optional[str] = None
+    image_mime_type: Optional[str] = None
+    mode: Optional[SolveMode] = None
+    profile: Optional[ProfileName] = None
+
+
+# POST /jobs nhận cùng các trường với một item của batch
+JobRequest = BatchItem
+
+
+class BatchSolveRequest(BaseModel):
+    items: List[BatchItem] = Field(..., min_length=1, max_length=200)
+    # True: trả về NDJSON, mỗi dòng là một kết quả theo thứ tự hoàn thành
+    stream: bool = False
+
+
+def get_llm(request: Request) -> LLMClient:
+    """Dependency: the shared LLM client created in lifespan."""
+    return request.app.state.llm_client
+
+
+def _unavailable(e: CircuitOpenError) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(max(1, int(e.retry_after + 0.999)))},
+    )
+
+
+# Backend chạy sau Next.js proxy: IP client thật nằm trong X-Forwarded-For.
+# Đặt 0 nếu backend được mở trực tiếp ra internet (header có thể bị giả mạo).
+TRUST_PROXY_HEADERS = os.getenv("TRUST_PROXY_HEADERS", "1").lower() not in ("0", "false", "no")
+
+
+def _client_key(request: Request) -> str:
+    """Rate-limit identity: the API key when sent, otherwise the client IP."""
+    api_key = request.headers.get("x-api-key")
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    forwarded_for = request.headers.get("x-forwarded-for") if TRUST_PROXY_HEADERS else None
+    if forwarded_for:
+        return "ip:" + forwarded_for.split(",")[0].strip()
+    return "ip:" + (request.client.host if request.client else "unknown")
+
+
+def _rejected(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(status_code=e.status_code, detail=str(e), headers=retry_after_header(e.retry_after))
+
+
+def _admission(priority: int, rate_limited: bool = True):
+    """
+    Dependency applying the per-client rate limit (429) and setting the
+    priority of the request's LLM calls. Admission slots are taken per LLM
+    call (services/admission.py), so cache hits do not queue; a call that
+    cannot start in time surfaces as 503 from the handler.
+    """
+    async def _admit(request: Request) -> None:
+        if rate_limited:
+            try:
+                await get_rate_limiter().acheck(_client_key(request))
+            except AdmissionRejected as e:
+                raise _rejected(e)
+        set_call_priority(priority)
+
+    return _admit
+
+
+admit_interactive = _admission(PRIORITY_INTERACTIVE)
+# Batch: rate limit tính theo số item trong handler
+admit_batch = _admission(PRIORITY_BATCH, rate_limited=False)
 
 
 @app.get("/")
@@ -46,8 +212,22 @@ async def health():
     return {"status": "healthy"}
 
 
-@app.post("/solve", response_model=SATMathSolutionOutput)
-async def solve_problem(request: ProblemRequest):
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Hit/miss counters and size of the solution cache, in-flight request
+    coalescing counters and near-duplicate matching counters.
+    """
+    similarity = await asyncio.to_thread(get_similarity_index)
+    return {
+        **get_solution_cache().snapshot(),
+        "single_flight": get_single_flight().snapshot(),
+        "near_duplicate": similarity.snapshot(),
+    }
+
+
+@app.post("/solve", response_model=MathSolutionResponse, dependencies=[Depends(admit_interactive)])
+async def solve_problem(request: ProblemRequest, llm: LLMClient = Depends(get_llm)):
     """
     Solve SAT Math problem using LLM (local backend in web repo).
     """
@@ -58,15 +238,23 @@ async def solve_problem(request: ProblemRequest):
         )
 
     try:
-        from services.llm_service import solve_sat_problem
-
         solution = await solve_sat_problem(
             problem=request.problem,
             image_base64=request.image_base64,
             image_mime_type=request.image_mime_type,
+            mode=request.mode,
+            client=llm,
+            profile=request.profile,
         )
 
-        return solution
+        # Lời giải đã được validate: trả thẳng, không qua response_model lần nữa
+        return FastJSONResponse(solution)
+    except ImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except CircuitOpenError as e:
+        raise _unavailable(e)
+    except AdmissionRejected as e:
+        raise _rejected(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -74,8 +262,147 @@ async def solve_problem(request: ProblemRequest):
         )
 
 
-@app.post("/solve-english", response_model=SATEnglishSolutionOutput)
-async def solve_english_problem(request: EnglishProblemRequest):
+# Giới hạn kích thước ảnh upload (khớp với giới hạn 10MB phía frontend)
+MAX_IMAGE_UPLOAD_BYTES = int(os.getenv("MAX_IMAGE_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+# Dư cho các field text và boundary của multipart
+_UPLOAD_FORM_OVERHEAD = 64 * 1024
+_UPLOAD_CHUNK_SIZE = 64 * 1024
+_SOLVE_MODES = get_args(SolveMode)
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Image exceeds {MAX_IMAGE_UPLOAD_BYTES / (1024 * 1024):g}MB upload limit",
+    )
+
+
+async def _read_bounded(chunks: AsyncIterator[bytes]) -> bytes:
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer += chunk
+        if len(buffer) > MAX_IMAGE_UPLOAD_BYTES:
+            raise _too_large()
+    return bytes(buffer)
+
+
+async def _upload_chunks(upload: UploadFile) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await upload.read(_UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def _read_upload(
+    request: Request,
+) -> Tuple[Optional[str], Optional[bytes], Optional[str], Optional[str], Optional[str]]:
+    """
+    Parse a binary image upload: either multipart/form-data (fields "problem",
+    "mode", "profile", file "image") or a raw image/* body with
+    problem/mode/profile as query parameters.
+    Returns (problem, image_bytes, image_mime_type, mode, profile).
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        if int(content_length) > MAX_IMAGE_UPLOAD_BYTES + _UPLOAD_FORM_OVERHEAD:
+            raise _too_large()
+
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith(("multipart/form-data", "application/x-www-form-urlencoded")):
+        form = await request.form(max_files=1, max_fields=8)
+        try:
+            problem = form.get("problem")
+            mode = form.get("mode")
+            profile = form.get("profile")
+            upload = form.get("image")
+            image_bytes: Optional[bytes] = None
+            image_mime_type: Optional[str] = None
+            if isinstance(upload, UploadFile):
+                image_bytes = await _read_bounded(_upload_chunks(upload)) or None
+                image_mime_type = upload.content_type
+        finally:
+            await form.close()
+    elif content_type.startswith("image/"):
+        problem = request.query_params.get("problem")
+        mode = request.query_params.get("mode")
+        profile = request.query_params.get("profile")
+        image_bytes = await _read_bounded(request.stream()) or None
+        image_mime_type = content_type.split(";", 1)[0].strip()
+    else:
+        raise HTTPException(
+            status_code=415,
+            detail="Expected multipart/form-data or an image/* body",
+        )
+
+    if not isinstance(problem, str) or not problem.strip():
+        problem = None
+    if mode is not None and mode not in _SOLVE_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid mode: {mode}")
+    if profile is not None and profile not in PROFILE_NAMES:
+        raise HTTPException(status_code=400, detail=f"Invalid profile: {profile}")
+    if not problem and not image_bytes:
+        raise HTTPException(
+            status_code=400,
+            detail="Either problem text or image must be provided",
+        )
+    return problem, image_bytes, image_mime_type, mode, profile
+
+
+@app.post("/solve/upload", response_model=MathSolutionResponse, dependencies=[Depends(admit_interactive)])
+async def solve_problem_upload(request: Request, llm: LLMClient = Depends(get_llm)):
+    """
+    Same as /solve, but the image is sent as binary (multipart or raw body)
+    instead of base64 inside JSON, so it is never base64-decoded/copied again.
+    """
+    problem, image_bytes, image_mime_type, mode, profile = await _read_upload(request)
+
+    try:
+        solution = await solve_sat_problem(
+            problem=problem,
+            image_mime_type=image_mime_type,
+            mode=mode,
+            image_bytes=image_bytes,
+            client=llm,
+            profile=profile,
+        )
+        return FastJSONResponse(solution)
+    except ImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except CircuitOpenError as e:
+        raise _unavailable(e)
+    except AdmissionRejected as e:
+        raise _rejected(e)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error solving SAT Math problem: {str(e)}",
+        )
+
+
+@app.post("/solve/{solution_id}/paths/{path_id}", response_model=SolutionPath, dependencies=[Depends(admit_interactive)])
+async def expand_solution_path(solution_id: str, path_id: str, llm: LLMClient = Depends(get_llm)):
+    """
+    Generate one pending path of a lazy-mode solution (cached after the
+    first call).
+    """
+    try:
+        return FastJSONResponse(await solve_pending_path(solution_id, path_id, client=llm))
+    except SolutionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except CircuitOpenError as e:
+        raise _unavailable(e)
+    except AdmissionRejected as e:
+        raise _rejected(e)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error generating solution path: {str(e)}",
+        )
+
+
+@app.post("/solve-english", response_model=SATEnglishSolutionOutput, dependencies=[Depends(admit_interactive)])
+async def solve_english_problem(request: EnglishProblemRequest, llm: LLMClient = Depends(get_llm)):
     """
     Solve SAT English problem using LLM (local backend in web repo).
     """
@@ -86,10 +413,16 @@ async def solve_english_problem(request: EnglishProblemRequest):
         )
 
     try:
-        from services.llm_service import solve_sat_english_problem
-
-        solution = await solve_sat_english_problem(problem=request.problem)
-        return solution
+        solution = await solve_sat_english_problem(
+            problem=request.problem,
+            client=llm,
+            profile=request.profile,
+        )
+        return FastJSONResponse(solution)
+    except CircuitOpenError as e:
+        raise _unavailable(e)
+    except AdmissionRejected as e:
+        raise _rejected(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -97,7 +430,378 @@ async def solve_english_problem(request: EnglishProblemRequest):
         )
 
 
-if __name__ == "__main__":
+@app.get("/stats/usage")
+async def usage_stats():
+    """
+    LLM token usage, including provider prompt-cache hits (cached_tokens),
+    and how requests were routed across model tiers.
+    """
+    return {
+        **get_usage_metrics().snapshot(),
+        "routing": get_model_router().snapshot(),
+        "resilience": get_hedged_executor().snapshot(),
+        "repair": asdict(get_repair_stats()),
+        "verification": get_verifier().snapshot(),
+        "fast_path": fast_path_snapshot(),
+        "vote": vote_snapshot(),
+        "jobs": {
+            **get_job_queue().counts(),
+            "pool": app.state.job_pool.snapshot() if app.state.job_pool is not None else None,
+        },
+        "admission": {
+            **get_admission_controller().snapshot(),
+            "rate_limit": get_rate_limiter().snapshot(),
+        },
+        "workers": _workers_snapshot(),
+    }
+
+
+def _workers_snapshot() -> dict:
+    shared = get_shared_state()
+    if shared is None:
+        return {"workers": worker_count(), "shared_state": None}
+    return shared.snapshot()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus metrics: request / stage / upstream LLM latency histograms
+    (time to first token for streams) and token / cost counters, labelled
+    by endpoint and model.
+    """
+    return PlainTextResponse(
+        get_metrics_registry().render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+def _batch_job(item: BatchItem, llm: LLMClient):
+    async def _job():
+        if item.subject == "english":
+            if not item.problem:
+                raise ValueError("Problem text must be provided for SAT English")
+            return await solve_sat_english_problem(
+                problem=item.problem,
+                client=llm,
+                profile=item.profile,
+            )
+
+        if not item.problem and not item.image_base64:
+            raise ValueError("Either problem text or image must be provided")
+        return await solve_sat_problem(
+            problem=item.problem,
+            image_base64=item.image_base64,
+            image_mime_type=item.image_mime_type,
+            mode=item.mode,
+            client=llm,
+            profile=item.profile,
+        )
+
+    return _job
+
+
+def _batch_result(item: BatchItem, index: int, solution: Any, error: Optional[BaseException]) -> dict:
+    if error is not None:
+        return {"index": index, "id": item.id, "status": "error", "error": str(error)}
+    return {
+        "index": index,
+        "id": item.id,
+        "status": "ok",
+        "solution": solution.model_dump(mode="json"),
+    }
+
+
+@app.post("/solve/batch", dependencies=[Depends(admit_batch)])
+async def solve_batch(request: BatchSolveRequest, http_request: Request, llm: LLMClient = Depends(get_llm)):
+    """
+    Solve many SAT Math/English problems in one call (a whole module/worksheet).
+
+    Items run through a bounded-concurrency scheduler; their LLM calls are
+    limited to BATCH_MAX_CONCURRENCY in flight across all batches, and they
+    share the cache and in-flight dedup of /solve. Each item gets its own
+    result or error. With "stream": true, results are returned as NDJSON in
+    completion order.
+    """
+    try:
+        await get_rate_limiter().acheck(_client_key(http_request), cost=len(request.items))
+    except AdmissionRejected as e:
+        raise _rejected(e)
+
+    jobs = [_batch_job(item, llm) for item in request.items]
+
+    if request.stream:
+        async def ndjson() -> AsyncIterator[str]:
+            async for outcome in run_bounded(jobs):
+                item = request.items[outcome.index]
+                line = _batch_result(item, outcome.index, outcome.result, outcome.error)
+                yield dumps(line) + "\n"
+
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+    results: List[Optional[dict]] = [None] * len(jobs)
+    async for outcome in run_bounded(jobs):
+        item = request.items[outcome.index]
+        results[outcome.index] = _batch_result(item, outcome.index, outcome.result, outcome.error)
+
+    failed = sum(1 for result in results if result["status"] == "error")
+    return FastJSONResponse({
+        "results": results,
+        "succeeded": len(results) - failed,
+        "failed": failed,
+    })
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {dumps(data)}\n\n"
+
+
+async def _sse_stream(events: AsyncIterator, error_prefix: str) -> AsyncIterator[str]:
+    try:
+        async for event, data in events:
+            yield _sse(event, data)
+    except CircuitOpenError as e:
+        # Stream đã mở (200) nên không trả 503 được; client tự retry sau retry_after
+        yield _sse("error", {"detail": f"{error_prefix}: {str(e)}", "retry_after": e.retry_after})
+    except Exception as e:
+        yield _sse("error", {"detail": f"{error_prefix}: {str(e)}"})
+
+
+_SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # Tắt buffering của nginx/proxy
+}
+
+
+@app.post("/solve/stream", dependencies=[Depends(admit_interactive)])
+async def solve_problem_stream(request: ProblemRequest, llm: LLMClient = Depends(get_llm)):
+    """
+    Solve SAT Math problem, streaming partial results as Server-Sent Events.
+
+    Events: sat_meta, summary, answer_spec, localization, recommended_path_id,
+    solution_path (one per finished path), then solution (validated output)
+    or error.
+    """
+    if not request.problem and not request.image_base64:
+        raise HTTPException(
+            status_code=400,
+            detail="Either problem text or image must be provided",
+        )
+
+    events = stream_sat_problem(
+        problem=request.problem,
+        image_base64=request.image_base64,
+        image_mime_type=request.image_mime_type,
+        mode=request.mode,
+        client=llm,
+        profile=request.profile,
+    )
+    return StreamingResponse(
+        _sse_stream(events, "Error solving SAT Math problem"),
+        media_type="text/event-stream",
+        headers=_SSE_HEADERS,
+    )
+
+
+@app.post("/solve/upload/stream", dependencies=[Depends(admit_interactive)])
+async def solve_problem_upload_stream(request: Request, llm: LLMClient = Depends(get_llm)):
+    """
+    Binary-upload variant of /solve/stream (see /solve/upload).
+    """
+    problem, image_bytes, image_mime_type, mode, profile = await _read_upload(request)
+
+    events = stream_sat_problem(
+        problem=problem,
+        image_mime_type=image_mime_type,
+        mode=mode,
+        image_bytes=image_bytes,
+        client=llm,
+        profile=profile,
+    )
+    return StreamingResponse(
+        _sse_stream(events, "Error solving SAT Math problem"),
+        media_type="text/event-stream",
+        headers=_SSE_HEADERS,
+    )
+
+
+@app.post("/solve-english/stream", dependencies=[Depends(admit_interactive)])
+async def solve_english_problem_stream(request: EnglishProblemRequest, llm: LLMClient = Depends(get_llm)):
+    """
+    Solve SAT English problem, streaming partial results as Server-Sent Events.
+    """
+    if not request.problem:
+        raise HTTPException(
+            status_code=400,
+            detail="Problem text must be provided for SAT English",
+        )
+
+    events = stream_sat_english_problem(
+        problem=request.problem,
+        client=llm,
+        profile=request.profile,
+    )
+    return StreamingResponse(
+        _sse_stream(events, "Error solving SAT English problem"),
+        media_type="text/event-stream",
+        headers=_SSE_HEADERS,
+    )
+
+
+def _job_links(job_id: str) -> dict:
+    return {"status_url": f"/jobs/{job_id}", "events_url": f"/jobs/{job_id}/events"}
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: JobRequest, http_request: Request):
+    """
+    Queue a solve and return its job id immediately. The solve runs on the
+    job workers; poll GET /jobs/{id} or follow GET /jobs/{id}/events (SSE).
+    """
+    try:
+        await get_rate_limiter().acheck(_client_key(http_request))
+    except AdmissionRejected as e:
+        raise _rejected(e)
+
+    if request.subject == "english" and not request.problem:
+        raise HTTPException(status_code=400, detail="Problem text must be provided for SAT English")
+    if request.subject == "math" and not request.problem and not request.image_base64:
+        raise HTTPException(status_code=400, detail="Either problem text or image must be provided")
+
+    payload = request.model_dump(exclude={"subject"}, exclude_none=True)
+    job = await asyncio.to_thread(get_job_queue().submit, request.subject, payload)
+    if http_request.app.state.job_pool is not None:
+        http_request.app.state.job_pool.notify()
+    return {"job_id": job.id, "status": job.status, **_job_links(job.id)}
+
+
+async def _get_job(job_id: str):
+    job = await asyncio.to_thread(get_job_queue().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Job status; "result" holds the solution once status is "succeeded"."""
+    job = await _get_job(job_id)
+    return {**job.public(), **_job_links(job.id)}
+
+
+# Giữ kết nối SSE qua proxy khi job chờ lâu
+_JOB_EVENTS_KEEPALIVE_SECONDS = 15.0
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """
+    Server-Sent Events for one job: "status" on every status change, then
+    "solution" (the result) or "error", after which the stream ends.
+    """
+    job = await _get_job(job_id)
+    pool = request.app.state.job_pool
+
+    async def events() -> AsyncIterator[str]:
+        nonlocal job
+        last_status = None
+        idle = 0.0
+        while True:
+            if job.status != last_status:
+                last_status = job.status
+                idle = 0.0
+                yield _sse("status", job.public(include_result=False))
+            if job.status == "succeeded":
+                yield _sse("solution", json.loads(job.result_json))
+                return
+            if job.status == "failed":
+                yield _sse("error", {"detail": job.error or "Job failed"})
+                return
+            if idle >= _JOB_EVENTS_KEEPALIVE_SECONDS:
+                idle = 0.0
+                yield ": keep-alive\n\n"
+            started = time.monotonic()
+            if pool is not None:
+                await pool.wait_for_change(1.0)
+            else:
+                await asyncio.sleep(1.0)
+            idle += time.monotonic() - started
+            job = await _get_job(job_id)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=_SSE_HEADERS)
+
+
+@app.get("/solutions")
+async def list_solutions(
+    subject: Optional[Literal["math", "english"]] = None,
+    kind: Optional[str] = None,
+    fingerprint: Optional[str] = None,
+    skill_domain: Optional[str] = None,
+    topic: Optional[str] = None,
+    difficulty_band: Optional[str] = None,
+    question_type: Optional[str] = None,
+    model: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    """
+    Stored solutions (newest first) filtered by fingerprint / SAT metadata,
+    without the solution body. Use /solutions/{id} for the full record.
+    """
+    filters = {
+        "subject": subject,
+        "kind": kind,
+        "fingerprint": fingerprint,
+        "skill_domain": skill_domain,
+        "topic": topic,
+        "difficulty_band": difficulty_band,
+        "question_type": question_type,
+        "model": model,
+    }
+    items, total = await asyncio.to_thread(get_solution_store().query, filters, limit, offset)
+    return {
+        "items": [item.summary() for item in items],
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+    }
+
+
+@app.get("/solutions/{solution_id}")
+async def get_stored_solution(solution_id: int):
+    record = await asyncio.to_thread(get_solution_store().get, solution_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Solution {solution_id} not found")
+    return {**record.summary(), "solution": json.loads(record.solution_json)}
+
+
+def run_server() -> None:
+    """
+    python main.py [--workers N] [--host H] [--port P]
+
+    N > 1 starts N uvicorn worker processes on one port. WEB_WORKERS is
+    exported before they are spawned so every worker runs in multi-worker
+    mode (services/shared_state.py): shared cache, single-flight and rate
+    limits, admission limits split between workers.
+    """
+    import argparse
+
     import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    parser = argparse.ArgumentParser(description="Run the SAT solver API")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=worker_count(), help="worker processes (WEB_WORKERS)")
+    args = parser.parse_args()
+
+    workers = max(1, args.workers)
+    if workers == 1:
+        uvicorn.run(app, host=args.host, port=args.port)
+        return
+    os.environ["WEB_WORKERS"] = str(workers)
+    # Nhiều worker cần import string để mỗi process tự tạo app
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=workers)
+
+
+if __name__ == "__main__":
+    run_server()
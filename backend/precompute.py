@@ -0,0 +1,404 @@
+"""
+Offline bulk precompute of SAT solutions via the provider Batch API
+
+Reads problems from a JSONL or CSV file, submits them as batch jobs (LiteLLM
+batch-file interface, or a local stand-in), polls for completion, validates
+every result and writes it into the solution cache so live traffic for known
+questions is served without an LLM call.
+
+Progress is checkpointed after every step, so re-running the same command
+resumes where it stopped (already-submitted batches are polled, not re-sent).
+
+Usage:
+    python precompute.py questions.jsonl --cache-db .cache/solutions.sqlite3
+    python precompute.py questions.csv --backend local --chunk-size 200
+
+Input fields (JSONL keys or CSV columns):
+    id (optional), subject ("math" | "english", default "math"),
+    problem, image_base64 (optional), image_mime_type (optional)
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+
+@dataclass
+class PrecomputeItem:
+    id: str
+    subject: str
+    problem: Optional[str]
+    image_base64: Optional[str] = None
+    image_mime_type: Optional[str] = None
+
+
+def load_items(path: str) -> List[PrecomputeItem]:
+    """Read problems from a .jsonl or .csv file."""
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    items = []
+    for line_no, row in enumerate(rows, start=1):
+        items.append(PrecomputeItem(
+            id=str(row.get("id") or line_no),
+            subject=row.get("subject") or "math",
+            problem=row.get("problem") or None,
+            image_base64=row.get("image_base64") or None,
+            image_mime_type=row.get("image_mime_type") or None,
+        ))
+    return items
+
+
+# ==================================================
+# CHECKPOINT
+# ==================================================
+
+class Checkpoint:
+    """
+    JSON checkpoint: submitted batches, finished and failed item ids.
+    Written atomically after every change.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self.done: Dict[str, str] = {}  # item id -> cache key
+        self.failed: Dict[str, str] = {}  # item id -> error
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.batches = data.get("batches", {})
+            self.done = data.get("done", {})
+            self.failed = data.get("failed", {})
+
+    def save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"batches": self.batches, "done": self.done, "failed": self.failed},
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+        os.replace(tmp_path, self.path)
+
+
+# ==================================================
+# BATCH BACKENDS
+# ==================================================
+
+class BatchBackend:
+    """
+    Minimal batch interface (OpenAI batch-file format for input and output lines).
+    """
+
+    async def submit(self, requests_path: str) -> str:
+        raise NotImplementedError
+
+    async def status(self, batch_id: str) -> str:
+        """One of: in_progress, completed, failed, expired, cancelled."""
+        raise NotImplementedError
+
+    async def results(self, batch_id: str) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+
+class LiteLLMBatchBackend(BatchBackend):
+    """Provider Batch API through LiteLLM's file/batch helpers."""
+
+    def __init__(self, provider: str = "openai"):
+        self.provider = provider
+
+    async def submit(self, requests_path: str) -> str:
+        import litellm
+
+        with open(requests_path, "rb") as f:
+            file_obj = await litellm.acreate_file(
+                file=f, purpose="batch", custom_llm_provider=self.provider
+            )
+        batch = await litellm.acreate_batch(
+            completion_window="24h",
+            endpoint="/v1/chat/completions",
+            input_file_id=file_obj.id,
+            custom_llm_provider=self.provider,
+        )
+        return batch.id
+
+    async def _retrieve(self, batch_id: str) -> Any:
+        import litellm
+
+        return await litellm.aretrieve_batch(
+            batch_id=batch_id, custom_llm_provider=self.provider
+        )
+
+    async def status(self, batch_id: str) -> str:
+        batch = await self._retrieve(batch_id)
+        if batch.status in ("validating", "in_progress", "finalizing", "cancelling"):
+            return "in_progress"
+        return batch.status
+
+    async def results(self, batch_id: str) -> List[Dict[str, Any]]:
+        import litellm
+
+        batch = await self._retrieve(batch_id)
+        lines: List[Dict[str, Any]] = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            content = await litellm.afile_content(
+                file_id=file_id, custom_llm_provider=self.provider
+            )
+            lines.extend(json.loads(line) for line in content.text.splitlines() if line.strip())
+        return lines
+
+
+class LocalBatchBackend(BatchBackend):
+    """
+    Local stand-in: executes each request line with acompletion (bounded
+    concurrency) and writes provider-style output lines to work_dir.
+    Useful for tests and for providers without a Batch API.
+    """
+
+    def __init__(self, work_dir: str, max_concurrency: int = 4):
+        self.work_dir = work_dir
+        self.max_concurrency = max_concurrency
+        os.makedirs(work_dir, exist_ok=True)
+
+    def _output_path(self, batch_id: str) -> str:
+        return os.path.join(self.work_dir, f"{batch_id}.output.jsonl")
+
+    async def submit(self, requests_path: str) -> str:
+        from litellm import acompletion
+
+        batch_id = f"local_{uuid.uuid4().hex[:12]}"
+        with open(requests_path, encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+
+        limiter = asyncio.Semaphore(self.max_concurrency)
+
+        async def _run(request: Dict[str, Any]) -> Dict[str, Any]:
+            async with limiter:
+                try:
+                    response = await acompletion(**request["body"])
+                    content = response.choices[0].message.content
+                    return {
+                        "custom_id": request["custom_id"],
+                        "response": {
+                            "status_code": 200,
+                            "body": {"choices": [{"message": {"content": content}}]},
+                        },
+                        "error": None,
+                    }
+                except Exception as e:
+                    return {
+                        "custom_id": request["custom_id"],
+                        "response": None,
+                        "error": {"message": str(e)},
+                    }
+
+        lines = await asyncio.gather(*[_run(request) for request in requests])
+        with open(self._output_path(batch_id), "w", encoding="utf-8") as f:
+            for line in lines:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        return batch_id
+
+    async def status(self, batch_id: str) -> str:
+        return "completed" if os.path.exists(self._output_path(batch_id)) else "failed"
+
+    async def results(self, batch_id: str) -> List[Dict[str, Any]]:
+        with open(self._output_path(batch_id), encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+# ==================================================
+# PRECOMPUTE
+# ==================================================
+
+def _batch_request_line(
+    custom_id: str,
+    messages: List[Dict[str, Any]],
+    output_model: Any,
+    tier: Any,
+) -> Dict[str, Any]:
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": tier.model,
+            "reasoning_effort": tier.reasoning_effort,
+            "messages": messages,
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": output_model.__name__,
+                    "schema": output_model.model_json_schema(),
+                },
+            },
+        },
+    }
+
+
+def _result_content(line: Dict[str, Any]) -> str:
+    if line.get("error"):
+        raise ValueError(line["error"].get("message") or str(line["error"]))
+    response = line.get("response") or {}
+    if response.get("status_code") != 200:
+        raise ValueError(f"HTTP {response.get('status_code')}: {response.get('body')}")
+    return response["body"]["choices"][0]["message"]["content"]
+
+
+async def precompute(
+    items: List[PrecomputeItem],
+    backend: BatchBackend,
+    checkpoint: Checkpoint,
+    work_dir: str,
+    chunk_size: int = 500,
+    poll_interval: float = 60.0,
+) -> None:
+    from services.cache import get_solution_cache
+    from services.llm_service import build_solve_request
+
+    cache = get_solution_cache()
+    os.makedirs(work_dir, exist_ok=True)
+
+    # 1. Chuẩn bị request, bỏ qua câu đã xong hoặc đã có trong cache
+    pending: Dict[str, Dict[str, Any]] = {}
+    for item in items:
+        if item.id in checkpoint.done:
+            continue
+        if not item.problem and not item.image_base64:
+            checkpoint.failed[item.id] = "Either problem text or image must be provided"
+            continue
+        cache_key, messages, output_model, tier = build_solve_request(
+            item.subject, item.problem, item.image_base64, item.image_mime_type
+        )
+        if await cache.get(cache_key) is not None:
+            checkpoint.done[item.id] = cache_key
+            continue
+        pending[item.id] = {
+            "cache_key": cache_key,
+            "output_model": output_model,
+            "line": _batch_request_line(item.id, messages, output_model, tier),
+        }
+    checkpoint.save()
+
+    # 2. Submit các item chưa thuộc batch nào (batch cũ được resume)
+    submitted_ids = {
+        custom_id
+        for batch in checkpoint.batches.values()
+        if batch["status"] == "in_progress"
+        for custom_id in batch["custom_ids"]
+    }
+    to_submit = [item_id for item_id in pending if item_id not in submitted_ids]
+    for start in range(0, len(to_submit), chunk_size):
+        chunk = to_submit[start:start + chunk_size]
+        requests_path = os.path.join(work_dir, f"requests_{int(time.time())}_{start}.jsonl")
+        with open(requests_path, "w", encoding="utf-8") as f:
+            for item_id in chunk:
+                f.write(json.dumps(pending[item_id]["line"], ensure_ascii=False) + "\n")
+        batch_id = await backend.submit(requests_path)
+        checkpoint.batches[batch_id] = {"status": "in_progress", "custom_ids": chunk}
+        checkpoint.save()
+        print(f"Submitted batch {batch_id} ({len(chunk)} items)")
+
+    # 3. Poll và ghi kết quả vào cache
+    while True:
+        active = [
+            batch_id for batch_id, batch in checkpoint.batches.items()
+            if batch["status"] == "in_progress"
+        ]
+        if not active:
+            break
+
+        for batch_id in active:
+            status = await backend.status(batch_id)
+            if status == "in_progress":
+                continue
+
+            batch = checkpoint.batches[batch_id]
+            if status == "completed":
+                for line in await backend.results(batch_id):
+                    item_id = line.get("custom_id")
+                    entry = pending.get(item_id)
+                    if entry is None:
+                        continue
+                    try:
+                        solution = entry["output_model"].model_validate_json(_result_content(line))
+                    except Exception as e:
+                        checkpoint.failed[item_id] = str(e)
+                        continue
+                    await cache.set(entry["cache_key"], solution.model_dump_json())
+                    checkpoint.done[item_id] = entry["cache_key"]
+                    checkpoint.failed.pop(item_id, None)
+
+            for item_id in batch["custom_ids"]:
+                if item_id not in checkpoint.done and item_id not in checkpoint.failed:
+                    checkpoint.failed[item_id] = f"Batch {batch_id} ended with status {status}"
+            batch["status"] = status
+            checkpoint.save()
+            print(f"Batch {batch_id}: {status}")
+
+        if any(batch["status"] == "in_progress" for batch in checkpoint.batches.values()):
+            await asyncio.sleep(poll_interval)
+
+    print(f"Done: {len(checkpoint.done)} cached, {len(checkpoint.failed)} failed")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Precompute SAT solutions into the solution cache")
+    parser.add_argument("input", help="Problems file (.jsonl or .csv)")
+    parser.add_argument(
+        "--backend", choices=["litellm", "local"], default="litellm",
+        help="litellm: provider Batch API; local: run requests directly (stand-in)",
+    )
+    parser.add_argument("--provider", default="openai", help="LiteLLM provider for the Batch API")
+    parser.add_argument("--cache-db", help="SQLite cache path (overrides SOLUTION_CACHE_DB_PATH)")
+    parser.add_argument("--work-dir", default=".cache/precompute", help="Batch files and checkpoint directory")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Items per submitted batch")
+    parser.add_argument("--poll-interval", type=float, default=60.0, help="Seconds between status polls")
+    parser.add_argument("--local-concurrency", type=int, default=4, help="Concurrency of the local backend")
+    args = parser.parse_args()
+
+    if args.cache_db:
+        os.environ["SOLUTION_CACHE_DB_PATH"] = args.cache_db
+    if not os.getenv("SOLUTION_CACHE_DB_PATH"):
+        parser.error("A persistent cache is required: pass --cache-db or set SOLUTION_CACHE_DB_PATH")
+
+    if args.backend == "local":
+        backend: BatchBackend = LocalBatchBackend(
+            os.path.join(args.work_dir, "local"), max_concurrency=args.local_concurrency
+        )
+    else:
+        backend = LiteLLMBatchBackend(provider=args.provider)
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    input_name = os.path.splitext(os.path.basename(args.input))[0]
+    checkpoint = Checkpoint(os.path.join(args.work_dir, f"{input_name}.checkpoint.json"))
+
+    asyncio.run(precompute(
+        load_items(args.input),
+        backend,
+        checkpoint,
+        work_dir=args.work_dir,
+        chunk_size=args.chunk_size,
+        poll_interval=args.poll_interval,
+    ))
+
+
+if __name__ == "__main__":
+    main()
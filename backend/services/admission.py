@@ -0,0 +1,356 @@
+"""
+Admission control for LLM-backed requests
+
+Under a spike every /solve would open its own upstream call, hit provider
+rate limits and fail together. Instead:
+
+- a global limit on LLM calls in progress, taken around each upstream call
+  (llm_call_slot), so cache hits cost nothing and every batch item, pipeline
+  stage or job worker call counts,
+- a bounded priority queue in front of it: calls of interactive requests go
+  before batch items and background jobs (priority follows the request via
+  set_call_priority); an interactive/batch call that cannot start within its
+  max wait is rejected with 503 + Retry-After instead of hanging, background
+  calls wait for their turn,
+- a token bucket per client (API key or IP) answering 429 + Retry-After.
+
+In multi-worker mode the token buckets live in SharedState, and the global
+limits are split between the WEB_WORKERS processes.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from services.batch import get_batch_limiter
+from services.shared_state import SharedState, get_shared_state, worker_count
+from services.tracing import record_stage
+
+# Số nhỏ = ưu tiên cao
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_BACKGROUND = 2
+
+
+class AdmissionRejected(RuntimeError):
+    """Request not admitted; status_code is 429 (client over its rate) or 503 (server busy)."""
+
+    def __init__(self, message: str, status_code: int, retry_after: float):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _env_float(name: str, default: float) -> float:
+    raw = os.getenv(name)
+    return float(raw) if raw else default
+
+
+# ==================================================
+# PER-CLIENT RATE LIMIT
+# ==================================================
+
+class TokenBucket:
+    """rate tokens per second, up to burst tokens."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1.0) -> float:
+        """Take cost tokens; return 0 on success, else seconds until they are available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+class ClientRateLimiter:
+    """
+    Token bucket per client key, least recently seen clients evicted first.
+    With shared set, buckets are kept in SharedState for all worker processes.
+    """
+
+    def __init__(
+        self,
+        per_minute: float,
+        burst: float,
+        max_clients: int = 10_000,
+        shared: Optional[SharedState] = None,
+    ):
+        self.rate = per_minute / 60.0
+        self.burst = max(1.0, burst)
+        self.max_clients = max_clients
+        self.shared = shared
+        self.limited = 0
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def check(self, client: str, cost: float = 1.0) -> None:
+        """Raise AdmissionRejected(429) when client is over its rate."""
+        if not self.enabled:
+            return
+        # Batch lớn hơn burst vẫn phải qua được khi bucket đầy
+        cost = min(cost, self.burst)
+        if self.shared is not None:
+            wait = self.shared.take_tokens(client, self.rate, self.burst, cost)
+        else:
+            wait = self._take_local(client, cost)
+        if wait > 0:
+            self.limited += 1
+            raise AdmissionRejected(f"Rate limit exceeded for {client}", 429, wait)
+
+    async def acheck(self, client: str, cost: float = 1.0) -> None:
+        """check() for request handlers; the shared bucket is updated off the event loop."""
+        if self.shared is not None and self.enabled:
+            await asyncio.to_thread(self.check, client, cost)
+        else:
+            self.check(client, cost)
+
+    def _take_local(self, client: str, cost: float) -> float:
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+            self._buckets[client] = bucket
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        return bucket.take(cost)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "per_minute": self.rate * 60.0,
+            "burst": self.burst,
+            "clients": len(self._buckets),
+            "shared": self.shared is not None,
+            "limited": self.limited,
+        }
+
+
+# ==================================================
+# CONCURRENCY LIMIT + PRIORITY QUEUE
+# ==================================================
+
+@dataclass
+class AdmissionStats:
+    admitted: int = 0
+    queued: int = 0
+    rejected_queue_full: int = 0
+    rejected_timeout: int = 0
+
+
+def _granted(future: asyncio.Future) -> bool:
+    return future.done() and not future.cancelled() and future.exception() is None
+
+
+class AdmissionController:
+    """
+    At most max_concurrency LLM calls run at once; up to max_queue wait in
+    priority order (FIFO within a priority) for at most max_wait seconds.
+    """
+
+    def __init__(self, max_concurrency: int = 16, max_queue: int = 64, max_wait: float = 10.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        self.stats = AdmissionStats()
+        self.active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        # Thời gian xử lý trung bình (EWMA) để ước lượng Retry-After
+        self._service_time = 5.0
+
+    def queue_length(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def retry_after(self) -> float:
+        """Estimated seconds until a new request could start."""
+        backlog = self.queue_length() + 1
+        return max(1.0, self._service_time * backlog / self.max_concurrency)
+
+    def _wake_next(self) -> None:
+        while self._waiters and self.active < self.max_concurrency:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue  # đã timeout / bị hủy
+            self.active += 1
+            future.set_result(None)
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE, max_wait: Optional[float] = None) -> None:
+        if self.active < self.max_concurrency and not self.queue_length():
+            self.active += 1
+            self.stats.admitted += 1
+            return
+        if self.queue_length() >= self.max_queue and not self._evict_lower(priority):
+            self.stats.rejected_queue_full += 1
+            raise AdmissionRejected("Server busy: admission queue is full", 503, self.retry_after())
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self.stats.queued += 1
+        queued_at = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait if max_wait is None else max_wait)
+        except asyncio.TimeoutError:
+            if _granted(future):
+                # Được cấp slot đúng lúc hết hạn: trả lại slot
+                self.release(0.0)
+            future.cancel()
+            self.stats.rejected_timeout += 1
+            raise AdmissionRejected("Server busy: queue wait deadline exceeded", 503, self.retry_after())
+        except BaseException:
+            if _granted(future):
+                self.release(0.0)
+            future.cancel()
+            raise
+        finally:
+            record_stage("queue_wait", time.perf_counter() - queued_at)
+        self.stats.admitted += 1
+
+    def _evict_lower(self, priority: int) -> bool:
+        """Queue full: reject the newest waiter of a lower priority to make room."""
+        pending = [entry for entry in self._waiters if not entry[2].done()]
+        if not pending:
+            return False
+        worst = max(pending, key=lambda entry: (entry[0], entry[1]))
+        if worst[0] <= priority:
+            return False
+        self.stats.rejected_queue_full += 1
+        worst[2].set_exception(
+            AdmissionRejected("Server busy: preempted by higher-priority requests", 503, self.retry_after())
+        )
+        return True
+
+    def release(self, service_seconds: Optional[float] = None) -> None:
+        self.active -= 1
+        if service_seconds:
+            self._service_time = 0.8 * self._service_time + 0.2 * service_seconds
+        self._wake_next()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_INTERACTIVE) -> AsyncIterator[None]:
+        await self.acquire(priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "max_wait_seconds": self.max_wait,
+            "active": self.active,
+            "queued": self.queue_length(),
+            "estimated_service_seconds": round(self._service_time, 3),
+            "admitted": self.stats.admitted,
+            "queued_total": self.stats.queued,
+            "rejected_queue_full": self.stats.rejected_queue_full,
+            "rejected_timeout": self.stats.rejected_timeout,
+        }
+
+
+# Ưu tiên cho các lời gọi LLM của request / job hiện tại (task con kế thừa qua context)
+_call_priority: ContextVar[int] = ContextVar("llm_call_priority", default=PRIORITY_INTERACTIVE)
+
+
+def set_call_priority(priority: int) -> None:
+    """Priority of the LLM calls made from the current request or job."""
+    _call_priority.set(priority)
+
+
+@asynccontextmanager
+async def llm_call_slot() -> AsyncIterator[None]:
+    """
+    Hold one admission slot for an upstream LLM call. Background jobs retry
+    after Retry-After instead of failing when the queue rejects them. Batch
+    calls first take a permit of the batch limiter (BATCH_MAX_CONCURRENCY).
+    """
+    controller = get_admission_controller()
+    priority = _call_priority.get()
+    # Lấy permit batch trước khi vào hàng đợi chung để không chiếm chỗ trong hàng đợi khi chờ
+    batch_limiter = get_batch_limiter() if priority == PRIORITY_BATCH else None
+    if batch_limiter is not None:
+        queued = time.perf_counter()
+        await batch_limiter.acquire()
+        record_stage("batch_wait", time.perf_counter() - queued)
+    try:
+        while True:
+            try:
+                await controller.acquire(priority)
+                break
+            except AdmissionRejected as e:
+                if priority < PRIORITY_BACKGROUND:
+                    raise
+                await asyncio.sleep(e.retry_after)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            controller.release(time.monotonic() - started)
+    finally:
+        if batch_limiter is not None:
+            batch_limiter.release()
+
+
+def retry_after_header(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+_admission_controller: Optional[AdmissionController] = None
+_rate_limiter: Optional[ClientRateLimiter] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """
+    Process-wide controller configured from environment:
+
+    - ADMISSION_MAX_CONCURRENCY (default 16 concurrent LLM calls)
+    - ADMISSION_MAX_QUEUE (default 64)
+    - ADMISSION_MAX_WAIT_SECONDS (default 10)
+
+    Concurrency and queue limits are for the whole server: with WEB_WORKERS
+    processes each one gets its share (rounded up).
+    """
+    global _admission_controller
+    if _admission_controller is None:
+        workers = worker_count()
+        _admission_controller = AdmissionController(
+            max_concurrency=math.ceil(int(os.getenv("ADMISSION_MAX_CONCURRENCY", "16")) / workers),
+            max_queue=math.ceil(int(os.getenv("ADMISSION_MAX_QUEUE", "64")) / workers),
+            max_wait=_env_float("ADMISSION_MAX_WAIT_SECONDS", 10.0),
+        )
+    return _admission_controller
+
+
+def get_rate_limiter() -> ClientRateLimiter:
+    """
+    Per-client limiter: RATE_LIMIT_PER_MINUTE (default 30, 0 disables) and
+    RATE_LIMIT_BURST (default 10). Shared across worker processes in
+    multi-worker mode.
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = ClientRateLimiter(
+            per_minute=_env_float("RATE_LIMIT_PER_MINUTE", 30.0),
+            burst=_env_float("RATE_LIMIT_BURST", 10.0),
+            shared=get_shared_state(),
+        )
+    return _rate_limiter
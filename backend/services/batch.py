@@ -0,0 +1,74 @@
+"""
+Bounded-concurrency scheduler for batch solving (worksheets, practice modules)
+"""
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional
+
+from services.tracing import record_stage
+
+
+@dataclass
+class BatchOutcome:
+    index: int
+    result: Any = None
+    error: Optional[BaseException] = None
+
+
+_batch_limiter: Optional[asyncio.Semaphore] = None
+
+
+def batch_max_concurrency() -> int:
+    return max(1, int(os.getenv("BATCH_MAX_CONCURRENCY", "4")))
+
+
+def get_batch_limiter() -> asyncio.Semaphore:
+    """
+    Process-wide limit on LLM calls in flight for batch work
+    (BATCH_MAX_CONCURRENCY, default 4), shared by all concurrent batches so
+    two worksheets cannot double the upstream load. Taken around each
+    upstream call of batch priority (admission.llm_call_slot), so a pipeline
+    or vote item counts once per call, not once per item.
+    """
+    global _batch_limiter
+    if _batch_limiter is None:
+        _batch_limiter = asyncio.Semaphore(batch_max_concurrency())
+    return _batch_limiter
+
+
+async def run_bounded(
+    jobs: List[Callable[[], Awaitable[Any]]],
+    limiter: Optional[asyncio.Semaphore] = None,
+) -> AsyncIterator[BatchOutcome]:
+    """
+    Run jobs with at most `limiter` of them active at once (default: a
+    semaphore of BATCH_MAX_CONCURRENCY for this batch; LLM calls are bounded
+    separately by get_batch_limiter) and yield their outcomes in completion
+    order. A failing job yields an outcome with `error` set instead of
+    aborting the batch.
+
+    Closing the iterator early (e.g. client disconnected while streaming)
+    cancels every job that has not finished yet.
+    """
+    # Không dùng get_batch_limiter() ở đây: item đang giữ permit sẽ chờ chính permit đó cho lời gọi LLM
+    limiter = limiter or asyncio.Semaphore(batch_max_concurrency())
+
+    async def _run(index: int, job: Callable[[], Awaitable[Any]]) -> BatchOutcome:
+        queued = time.perf_counter()
+        async with limiter:
+            record_stage("queue_wait", time.perf_counter() - queued)
+            try:
+                return BatchOutcome(index=index, result=await job())
+            except Exception as e:
+                return BatchOutcome(index=index, error=e)
+
+    tasks = [asyncio.ensure_future(_run(index, job)) for index, job in enumerate(jobs)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
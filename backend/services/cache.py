@@ -0,0 +1,351 @@
+"""
+Content-addressed cache for validated SAT solutions
+
+Two tiers:
+- In-process LRU (fast, per worker)
+- Optional on-disk tier (SQLite by default, pluggable via DiskCacheTier)
+
+Values are stored as the JSON dump of the validated pydantic output so that
+both SATMathSolutionOutput and SATEnglishSolutionOutput can share one cache.
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Optional, Dict, Any, Tuple
+
+from services.shared_state import DEFAULT_SHARED_CACHE_PATH, shared_state_enabled
+
+
+def normalize_problem_text(problem: Optional[str]) -> str:
+    """
+    Normalize problem text so trivially different submissions share a key
+    (unicode form, line endings, repeated whitespace).
+    """
+    if not problem:
+        return ""
+    text = unicodedata.normalize("NFC", problem)
+    return " ".join(text.split())
+
+
+def _image_digest(image_base64: Optional[str]) -> str:
+    if not image_base64:
+        return ""
+    try:
+        raw = base64.b64decode(image_base64, validate=False)
+    except (binascii.Error, ValueError):
+        raw = image_base64.encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+def make_cache_key(
+    kind: str,
+    problem: Optional[str],
+    model: str,
+    reasoning_effort: Optional[str],
+    prompt_version: str,
+    image_base64: Optional[str] = None,
+    image_fingerprint: Optional[str] = None,
+) -> str:
+    """
+    Build a content-addressed key from everything that influences the output.
+
+    Args:
+        kind: "math" or "english"
+        problem: Problem text (normalized before hashing)
+        model: LLM model name
+        reasoning_effort: Reasoning effort passed to the model
+        prompt_version: Version tag of the system prompt
+        image_base64: Base64 image payload (hashed on decoded bytes)
+        image_fingerprint: Precomputed image hash (e.g. pixel digest from
+            the image pipeline); takes precedence over image_base64
+    """
+    payload = json.dumps(
+        {
+            "kind": kind,
+            "problem": normalize_problem_text(problem),
+            "image": image_fingerprint or _image_digest(image_base64),
+            "model": model,
+            "reasoning_effort": reasoning_effort or "",
+            "prompt_version": prompt_version,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return f"{kind}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+@dataclass
+class CacheStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    sets: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+
+# ==================================================
+# DISK TIER
+# ==================================================
+
+class DiskCacheTier:
+    """
+    Interface for a persistent cache tier. Implementations are synchronous;
+    SolutionCache runs them in a worker thread.
+    """
+
+    def get(self, key: str, ttl_seconds: Optional[float]) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str) -> int:
+        """Store value, return number of evicted entries."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+
+class SQLiteCacheTier(DiskCacheTier):
+    """
+    SQLite-backed tier with TTL and size-based (least recently accessed) eviction.
+    """
+
+    def __init__(self, path: str, max_entries: int = 50_000):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # WAL + busy timeout: nhiều worker process đọc/ghi cùng một file
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS solution_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_solution_cache_accessed "
+            "ON solution_cache(accessed_at)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str, ttl_seconds: Optional[float]) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM solution_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if ttl_seconds is not None and now - created_at > ttl_seconds:
+                self._conn.execute("DELETE FROM solution_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE solution_cache SET accessed_at = ? WHERE key = ?",
+                (now, key),
+            )
+            self._conn.commit()
+            return value
+
+    def set(self, key: str, value: str) -> int:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO solution_cache (key, value, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            (total,) = self._conn.execute("SELECT COUNT(*) FROM solution_cache").fetchone()
+            evicted = max(0, total - self.max_entries)
+            if evicted:
+                self._conn.execute(
+                    "DELETE FROM solution_cache WHERE key IN ("
+                    "SELECT key FROM solution_cache ORDER BY accessed_at ASC LIMIT ?)",
+                    (evicted,),
+                )
+            self._conn.commit()
+            return evicted
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM solution_cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            (total,) = self._conn.execute("SELECT COUNT(*) FROM solution_cache").fetchone()
+            return total
+
+
+# ==================================================
+# TWO-TIER CACHE
+# ==================================================
+
+class SolutionCache:
+    """
+    LRU memory tier in front of an optional disk tier.
+
+    Disk hits are promoted into memory. Entries older than ttl_seconds are
+    treated as misses in both tiers.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl_seconds: Optional[float] = 7 * 24 * 3600,
+        disk: Optional[DiskCacheTier] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk = disk
+        self.stats = CacheStats()
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        created_at, value = entry
+        if self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds:
+            del self._memory[key]
+            self.stats.expirations += 1
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_set(self, key: str, value: str) -> None:
+        self._memory[key] = (time.time(), value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats.evictions += 1
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self._memory_get(key)
+        if value is not None:
+            self.stats.memory_hits += 1
+            return value
+
+        if self.disk is not None:
+            try:
+                value = await asyncio.to_thread(self.disk.get, key, self.ttl_seconds)
+            except sqlite3.Error as e:
+                print(f"Solution cache disk read failed: {e}")
+                value = None
+            if value is not None:
+                self.stats.disk_hits += 1
+                self._memory_set(key, value)
+                return value
+
+        self.stats.misses += 1
+        return None
+
+    async def set(self, key: str, value: str) -> None:
+        self.stats.sets += 1
+        self._memory_set(key, value)
+        if self.disk is not None:
+            try:
+                self.stats.evictions += await asyncio.to_thread(self.disk.set, key, value)
+            except sqlite3.Error as e:
+                print(f"Solution cache disk write failed: {e}")
+
+    async def delete(self, key: str) -> None:
+        self._memory.pop(key, None)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.delete, key)
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats.memory_hits + self.stats.disk_hits + self.stats.misses
+        hits = self.stats.memory_hits + self.stats.disk_hits
+        return {
+            **asdict(self.stats),
+            "hit_rate": (hits / lookups) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "disk_enabled": self.disk is not None,
+        }
+
+
+class NullCache(SolutionCache):
+    """Cache that never stores anything (SOLUTION_CACHE_ENABLED=0)."""
+
+    def __init__(self):
+        super().__init__(max_entries=0, ttl_seconds=None, disk=None)
+
+    async def get(self, key: str) -> Optional[str]:
+        self.stats.misses += 1
+        return None
+
+    async def set(self, key: str, value: str) -> None:
+        return None
+
+
+_solution_cache: Optional[SolutionCache] = None
+
+
+def _env_float(name: str, default: Optional[float]) -> Optional[float]:
+    raw = os.getenv(name)
+    if raw is None or raw == "":
+        return default
+    value = float(raw)
+    return value if value > 0 else None
+
+
+def get_solution_cache() -> SolutionCache:
+    """
+    Return the process-wide solution cache, configured from environment:
+
+    - SOLUTION_CACHE_ENABLED (default "1")
+    - SOLUTION_CACHE_MAX_ENTRIES (memory tier size, default 512)
+    - SOLUTION_CACHE_TTL_SECONDS (default 7 days, <= 0 disables TTL)
+    - SOLUTION_CACHE_DB_PATH (enables SQLite disk tier when set; in
+      multi-worker mode it defaults to .cache/solution_cache.sqlite3 so all
+      workers share one cache)
+    - SOLUTION_CACHE_DISK_MAX_ENTRIES (default 50000)
+    """
+    global _solution_cache
+    if _solution_cache is not None:
+        return _solution_cache
+
+    if os.getenv("SOLUTION_CACHE_ENABLED", "1").lower() in ("0", "false", "no"):
+        _solution_cache = NullCache()
+        return _solution_cache
+
+    disk: Optional[DiskCacheTier] = None
+    db_path = os.getenv("SOLUTION_CACHE_DB_PATH")
+    if not db_path and shared_state_enabled():
+        db_path = DEFAULT_SHARED_CACHE_PATH
+    if db_path:
+        disk = SQLiteCacheTier(
+            db_path,
+            max_entries=int(os.getenv("SOLUTION_CACHE_DISK_MAX_ENTRIES", "50000")),
+        )
+
+    _solution_cache = SolutionCache(
+        max_entries=int(os.getenv("SOLUTION_CACHE_MAX_ENTRIES", "512")),
+        ttl_seconds=_env_float("SOLUTION_CACHE_TTL_SECONDS", 7 * 24 * 3600),
+        disk=disk,
+    )
+    return _solution_cache
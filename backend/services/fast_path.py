@@ -0,0 +1,607 @@
+"""
+Local fast path for routine SAT Math problems
+
+A large share of /solve traffic is a single linear equation, a system of two
+linear equations or a one-line percent question. These are recognized from
+the problem text, solved exactly with SymPy and returned as a complete
+SATMathSolutionOutput (templated Vietnamese steps, AnswerSpec, Desmos
+expressions) without any LLM call.
+
+Recognition is deliberately strict: anything unusual (inequalities, powers,
+function notation, graphs/tables, "how many", more unknowns than equations,
+a non-linear target such as ax, a requested unit or answer form, a
+percent outside the recognized percent sentences, an equation that does not
+stand as its own clause, a multiple-choice question where no single choice
+matches) falls through to the LLM. The output then goes through the same
+substitution and answer checks as LLM solutions before it is returned.
+"""
+import asyncio
+import os
+import re
+import unicodedata
+from dataclasses import asdict, dataclass
+from fractions import Fraction
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.schemas import (
+    AnswerSpec,
+    Conclusion,
+    DesmosConfig,
+    KnowledgeItem,
+    Planning,
+    SATMathSolutionOutput,
+    SATMeta,
+    SolutionPath,
+    SolutionStep,
+    Summary,
+)
+from services.similarity import CHOICE_LETTERS, split_choices
+from services.tracing import stage
+from services.verification import (
+    FAILED,
+    answer_value,
+    check_answer,
+    check_substitution,
+    latex_to_expression,
+    parse_side,
+    sympy_available,
+)
+
+LINEAR_EQUATION = "linear_equation"
+LINEAR_SYSTEM = "linear_system"
+PERCENT = "percent"
+
+
+class _NotRoutine(ValueError):
+    """Problem is not one the fast path handles; use the LLM."""
+
+
+@dataclass
+class FastPathStats:
+    attempted: int = 0
+    solved: int = 0
+    linear_equation: int = 0
+    linear_system: int = 0
+    percent: int = 0
+    # Lời giải mẫu không qua được kiểm tra thay nghiệm / đáp án
+    verification_failed: int = 0
+
+
+_stats = FastPathStats()
+
+
+def get_fast_path_stats() -> FastPathStats:
+    return _stats
+
+
+def fast_path_enabled() -> bool:
+    """FAST_PATH_ENABLED (default 1) and SymPy installed."""
+    return os.getenv("FAST_PATH_ENABLED", "1").lower() not in ("0", "false", "no") and sympy_available()
+
+
+# ==================================================
+# RECOGNITION
+# ==================================================
+
+_MAX_STEM_CHARS = 400
+_SYMBOLS = str.maketrans({"−": "-", "–": "-", "×": "*", "·": "*", "⋅": "*", "÷": "/"})
+_THOUSANDS = re.compile(r"(?<=\d),(?=\d{3}(?!\d))")
+_INLINE_LATEX = re.compile(r"\$([^$]+)\$|\\\((.+?)\\\)")
+# Dãy ký tự toán: số, toán tử, ngoặc, dấu "=" và biến một chữ cái đứng riêng
+_MATH_RUN = re.compile(r"(?:[\d.+\-*/()= \t]|(?<![A-Za-z])[a-z](?![A-Za-z]))+")
+_NUM = r"(-?\d+(?:\.\d+)?)"
+_BAIL_WORDS = (
+    "how many", " not ", "graph", "table", "figure", "shown", "inequal", "greatest", "least",
+    "maximum", "minimum", "approximately", "nearest", "integer", "no solution", "infinitely",
+    "ordered pair", "(x, y)", "(x,y)", "function", "slope", "average", "mean",
+)
+# Đề yêu cầu đơn vị hoặc dạng đáp án cụ thể: lời giải mẫu chỉ trả về một con số
+_ANSWER_FORM_WORDS = (
+    "your answer", "express", "in terms of", "as a fraction", "as a decimal", "simplest form",
+    "rounded", "units", "dollars", "cents", "meters", "inches", "feet", "miles", "grams",
+    "liters", "hours", "minutes", "seconds", "degrees",
+)
+_BAIL_SYMBOLS = ("<", ">", "≤", "≥", "^", "**", "|", "√", "sqrt", "\\", "±")
+# Phương trình phải là một mệnh đề riêng: trước nó là đầu câu / "if" / "and" / dấu câu
+# ("25% of n = 40", "3 times x = 12" thì hệ số nằm ngoài dãy ký tự toán -> bỏ qua)
+_CLAUSE_BEFORE = re.compile(r"(?:^|[,;:.?]|\b(?:if|and|to|equation|equations|given|where|that))\s*$")
+_CLAUSE_AFTER = re.compile(r"^\s*(?:$|[,;:?]|(?:and|then|what|which|for)\b)")
+_VALUE_OF = re.compile(r"value of\s+(?:the expression\s+)?(.+?)\s*\?")
+_SOLVE_FOR = re.compile(r"solve (?:the equation )?for\s+([a-z])\b")
+_SOLUTION_TO = re.compile(r"(?:what is the|what value of [a-z] is the) solution")
+
+_PERCENT_PATTERNS: Tuple[Tuple[str, "re.Pattern[str]"], ...] = (
+    ("of", re.compile(rf"what is {_NUM}\s*% of {_NUM}\s*\?")),
+    ("what_percent", re.compile(rf"{_NUM} is what percent(?:age)? of {_NUM}\s*\?")),
+    ("whole", re.compile(rf"{_NUM} is {_NUM}\s*% of what(?: number)?\s*\?")),
+    ("whole_rate_first", re.compile(rf"{_NUM}\s*% of what(?: number)? is {_NUM}\s*\?")),
+    ("increase", re.compile(rf"if {_NUM} is increased by {_NUM}\s*%, what is the (?:new|resulting) (?:value|number)\s*\?")),
+    ("decrease", re.compile(rf"if {_NUM} is decreased by {_NUM}\s*%, what is the (?:new|resulting) (?:value|number)\s*\?")),
+)
+
+
+def _normalize(text: str) -> str:
+    text = _THOUSANDS.sub("", unicodedata.normalize("NFKC", text).translate(_SYMBOLS))
+    # Giữ xuống dòng: mỗi phương trình của hệ thường nằm trên một dòng
+    return "\n".join(" ".join(line.split()) for line in text.splitlines() if line.strip())
+
+
+def _inline_latex(text: str) -> str:
+    """$...$ / \\(...\\) segments -> plain expressions (3x+5=20)."""
+    def _convert(match: "re.Match[str]") -> str:
+        try:
+            return " " + latex_to_expression(match.group(1) or match.group(2)) + " "
+        except ValueError:
+            raise _NotRoutine("unsupported LaTeX") from None
+
+    return _INLINE_LATEX.sub(_convert, text)
+
+
+def _check_bail(text: str) -> None:
+    lowered = f" {text.lower()} "
+    if len(text) > _MAX_STEM_CHARS:
+        raise _NotRoutine("long problem")
+    for word in _BAIL_WORDS + _ANSWER_FORM_WORDS:
+        if word in lowered:
+            raise _NotRoutine(f"contains {word.strip()!r}")
+    for symbol in _BAIL_SYMBOLS:
+        if symbol in text:
+            raise _NotRoutine(f"contains {symbol!r}")
+
+
+def _sides(run: str) -> Tuple[str, str]:
+    left, right = (side.strip().rstrip(".") for side in run.split("="))
+    if not left or not right:
+        raise _NotRoutine("incomplete equation")
+    return left, right
+
+
+def _equations(text: str) -> List[Tuple[str, str]]:
+    equations = []
+    for line in text.splitlines():
+        for match in _MATH_RUN.finditer(line):
+            run = match.group()
+            if run.count("=") == 0:
+                continue
+            if run.count("=") > 1:
+                raise _NotRoutine("chained equation")
+            if not _CLAUSE_BEFORE.search(line[:match.start()].lower()) or not _CLAUSE_AFTER.match(line[match.end():].lower()):
+                raise _NotRoutine("equation inside a phrase")
+            equations.append(_sides(run))
+    return equations
+
+
+def _target(text: str) -> Optional[str]:
+    lowered = text.lower()
+    match = _VALUE_OF.search(lowered)
+    if match:
+        expression = text[match.start(1):match.end(1)]
+        if not _MATH_RUN.fullmatch(expression) or "=" in expression:
+            raise _NotRoutine("target is not an expression")
+        return expression.strip()
+    match = _SOLVE_FOR.search(lowered)
+    if match:
+        return match.group(1)
+    if _SOLUTION_TO.search(lowered):
+        return ""  # ẩn duy nhất của phương trình
+    raise _NotRoutine("no recognizable question")
+
+
+# ==================================================
+# SOLVING
+# ==================================================
+
+@dataclass
+class _Solved:
+    kind: str
+    value: Any  # sympy Rational
+    target_latex: str
+    steps: List[SolutionStep]
+    givens: List[str]
+    desmos: DesmosConfig
+    units: Optional[str] = None
+
+
+def _sympy() -> Any:
+    import sympy
+
+    return sympy
+
+
+def _fmt(value: Any) -> str:
+    """Exact number as SAT would write it: 5, 3.5, -7/2."""
+    fraction = Fraction(int(value.p), int(value.q))
+    if fraction.denominator == 1:
+        return str(fraction.numerator)
+    denominator = fraction.denominator
+    for prime in (2, 5):
+        while denominator % prime == 0:
+            denominator //= prime
+    if denominator == 1:
+        return format(float(fraction), ".6f").rstrip("0").rstrip(".")
+    return f"{fraction.numerator}/{fraction.denominator}"
+
+
+def _tex(value: Any) -> str:
+    return _sympy().latex(value)
+
+
+def _knowledge(kind: str) -> List[KnowledgeItem]:
+    if kind == PERCENT:
+        return [KnowledgeItem(topic="Phần trăm (percent)", category="Problem Solving & Data Analysis")]
+    if kind == LINEAR_SYSTEM:
+        return [KnowledgeItem(topic="Hệ hai phương trình bậc nhất hai ẩn", category="Algebra")]
+    return [KnowledgeItem(topic="Phương trình bậc nhất một ẩn", category="Algebra")]
+
+
+def _target_step(step_id: int, target: Any, solution: Dict[Any, Any], kind: str) -> SolutionStep:
+    value = target.subs(solution)
+    return SolutionStep(
+        step_id=step_id,
+        description="Thay giá trị vừa tìm vào biểu thức đề bài hỏi.",
+        derivation="Đề hỏi giá trị của biểu thức chứ không phải của ẩn, nên cần tính thêm một bước.",
+        formulas=[f"{_tex(target)} = {_tex(value)}"],
+        intermediate_result=f"{_tex(target)} = {_tex(value)}",
+        required_knowledge=_knowledge(kind),
+        common_traps=["Dừng lại ở giá trị của ẩn và chọn nhầm đáp án bằng giá trị đó."],
+    )
+
+
+def _solve_linear(equation: Any, symbol: Any, target: Any) -> _Solved:
+    sympy = _sympy()
+    expression = sympy.expand(equation.lhs - equation.rhs)
+    coefficient = expression.coeff(symbol)
+    constant = -(expression - coefficient * symbol)
+    solution = {symbol: constant / coefficient}
+    value = solution[symbol]
+
+    steps = [
+        SolutionStep(
+            step_id=1,
+            description=f"Chuyển các hạng tử chứa ${_tex(symbol)}$ về vế trái, hằng số về vế phải.",
+            derivation="Phương trình bậc nhất một ẩn: gom ẩn về một vế để đưa về dạng ax = b.",
+            formulas=[_tex(equation), f"{_tex(coefficient * symbol)} = {_tex(constant)}"],
+            intermediate_result=f"{_tex(coefficient * symbol)} = {_tex(constant)}",
+            required_knowledge=_knowledge(LINEAR_EQUATION),
+            common_traps=["Đổi dấu sai khi chuyển hạng tử sang vế bên kia."],
+        ),
+        SolutionStep(
+            step_id=2,
+            description=f"Chia hai vế cho ${_tex(coefficient)}$.",
+            derivation="Hệ số của ẩn khác 0 nên phương trình có đúng một nghiệm.",
+            formulas=[f"{_tex(symbol)} = {_tex(value)}"],
+            intermediate_result=f"{_tex(symbol)} = {_tex(value)}",
+            required_knowledge=_knowledge(LINEAR_EQUATION),
+            quick_check=(
+                f"Thay ${_tex(symbol)} = {_tex(value)}$: vế trái = {_tex(equation.lhs.subs(solution))}, "
+                f"vế phải = {_tex(equation.rhs.subs(solution))}."
+            ),
+        ),
+    ]
+    if target != symbol:
+        steps.append(_target_step(3, target, solution, LINEAR_EQUATION))
+    return _Solved(
+        kind=LINEAR_EQUATION,
+        value=target.subs(solution),
+        target_latex=_tex(target),
+        steps=steps,
+        givens=[f"${_tex(equation)}$"],
+        desmos=DesmosConfig(
+            expressions=[f"y={_tex(equation.lhs)}", f"y={_tex(equation.rhs)}"],
+            purpose="solve_equation",
+        ),
+    )
+
+
+def _solve_system(equations: List[Any], symbols: List[Any], target: Any) -> _Solved:
+    sympy = _sympy()
+    x, y = symbols
+    rows = []
+    for equation in equations:
+        expression = sympy.expand(equation.lhs - equation.rhs)
+        a, b = expression.coeff(x), expression.coeff(y)
+        rows.append((a, b, -(expression - a * x - b * y)))
+    (a1, b1, c1), (a2, b2, c2) = rows
+    determinant = a1 * b2 - a2 * b1
+    if determinant == 0:
+        raise _NotRoutine("system without a unique solution")
+    x_value = (c1 * b2 - c2 * b1) / determinant
+
+    if b1 == 0 or b2 == 0:
+        # Một phương trình chỉ chứa x: giải trực tiếp
+        a, c = (a1, c1) if b1 == 0 else (a2, c2)
+        eliminate = f"{_tex(a * x)} = {_tex(c)}"
+        eliminate_description = f"Một phương trình chỉ chứa ${_tex(x)}$: giải trực tiếp."
+    else:
+        eliminate = f"{_tex(determinant * x)} = {_tex(c1 * b2 - c2 * b1)}"
+        eliminate_description = (
+            f"Khử ${_tex(y)}$: nhân phương trình (1) với ${_tex(b2)}$, phương trình (2) với ${_tex(b1)}$ rồi trừ vế theo vế."
+        )
+    back_index = 0 if rows[0][1] != 0 else 1
+    back = equations[back_index]
+    y_value = sympy.solve(back.subs(x, x_value), y)[0]
+    solution = {x: x_value, y: y_value}
+
+    steps = [
+        SolutionStep(
+            step_id=1,
+            description="Viết hệ phương trình từ đề bài.",
+            derivation="Hai phương trình bậc nhất, hai ẩn: dùng phương pháp khử (cộng/trừ) để còn một ẩn.",
+            formulas=[_tex(equation) for equation in equations],
+            required_knowledge=_knowledge(LINEAR_SYSTEM),
+        ),
+        SolutionStep(
+            step_id=2,
+            description=eliminate_description,
+            derivation="Hệ số của một ẩn triệt tiêu nên chỉ còn phương trình bậc nhất một ẩn.",
+            formulas=[eliminate, f"{_tex(x)} = {_tex(x_value)}"],
+            intermediate_result=f"{_tex(x)} = {_tex(x_value)}",
+            required_knowledge=_knowledge(LINEAR_SYSTEM),
+            common_traps=["Quên nhân hằng số ở vế phải khi nhân cả phương trình."],
+        ),
+        SolutionStep(
+            step_id=3,
+            description=f"Thay ${_tex(x)} = {_tex(x_value)}$ vào phương trình ({back_index + 1}) để tìm ${_tex(y)}$.",
+            derivation="Khi đã biết một ẩn, phương trình còn lại chỉ còn một ẩn.",
+            formulas=[_tex(sympy.Eq(back.lhs.subs(x, x_value), back.rhs.subs(x, x_value), evaluate=False)), f"{_tex(y)} = {_tex(y_value)}"],
+            intermediate_result=f"{_tex(y)} = {_tex(y_value)}",
+            required_knowledge=_knowledge(LINEAR_SYSTEM),
+            quick_check="Thay cặp nghiệm vào cả hai phương trình ban đầu, cả hai phải đúng.",
+        ),
+    ]
+    if target not in (x, y):
+        steps.append(_target_step(4, target, solution, LINEAR_SYSTEM))
+    return _Solved(
+        kind=LINEAR_SYSTEM,
+        value=target.subs(solution),
+        target_latex=_tex(target),
+        steps=steps,
+        givens=[f"${_tex(equation)}$" for equation in equations],
+        desmos=DesmosConfig(expressions=[_tex(equation) for equation in equations], purpose="solve_equation"),
+    )
+
+
+def _solve_equations(text: str) -> Optional[_Solved]:
+    sympy = _sympy()
+    prepared = _inline_latex(text)
+    _check_bail(prepared)
+    lowered = prepared.lower()
+    # Câu phần trăm không khớp mẫu nào ở _solve_percent: "25% of n = 40" không phải phương trình n = 40
+    if "%" in lowered or "percent" in lowered:
+        raise _NotRoutine("percent outside a recognized pattern")
+    pairs = _equations(prepared)
+    if not pairs:
+        return None
+    target_text = _target(prepared)
+    try:
+        equations = [sympy.Eq(parse_side(left), parse_side(right)) for left, right in pairs]
+        target = parse_side(target_text) if target_text else None
+    except ValueError:
+        raise _NotRoutine("unparsable equation") from None
+
+    symbols = sorted(set().union(*(equation.free_symbols for equation in equations)), key=str)
+    if len(symbols) not in (1, 2) or len(equations) != len(symbols):
+        raise _NotRoutine("not a square linear system")
+    for equation in equations:
+        if equation in (sympy.true, sympy.false):
+            raise _NotRoutine("equation without unknowns")
+        if sympy.Poly(equation.lhs - equation.rhs, *symbols).total_degree() != 1:
+            raise _NotRoutine("not linear")
+    if target is None:
+        if len(symbols) != 1:
+            raise _NotRoutine("ambiguous target")
+        target = symbols[0]
+    if not target.free_symbols or not target.free_symbols.issubset(symbols):
+        raise _NotRoutine("target is not in the unknowns")
+    # Mẫu lời giải chỉ cho biểu thức bậc nhất (6x - 1, x + y), không cho ax, x/y, x^2
+    if not target.is_polynomial(*symbols) or sympy.Poly(target, *symbols).total_degree() > 1:
+        raise _NotRoutine("target is not linear")
+
+    if len(symbols) == 1:
+        solved = _solve_linear(equations[0], symbols[0], target)
+    else:
+        solved = _solve_system(equations, symbols, target)
+    if not solved.value.is_rational:
+        raise _NotRoutine("non-rational answer")
+    return solved
+
+
+def _solve_percent(text: str) -> Optional[_Solved]:
+    sympy = _sympy()
+    lowered = text.lower().replace("\\%", "%").replace("$", "")
+    for kind, pattern in _PERCENT_PATTERNS:
+        match = pattern.search(lowered)
+        if match is None:
+            continue
+        _check_bail(lowered)
+        first, second = (sympy.Rational(group) for group in match.groups())
+        units = None
+        if kind == "of":
+            rate, base = first / 100, second
+            value = rate * base
+            formulas = [f"{first}\\% = {_tex(rate)}", f"{_tex(rate)} \\cdot {second} = {_tex(value)}"]
+            givens = [f"{first}% của {second}"]
+            description = f"Đổi {first}% sang số rồi nhân với {second}."
+        elif kind == "what_percent":
+            if second == 0:
+                raise _NotRoutine("division by zero")
+            value = first / second * 100
+            formulas = [f"\\frac{{{first}}}{{{second}}} \\cdot 100 = {_tex(value)}"]
+            givens = [f"{first} là một phần của {second}"]
+            description = f"Lấy {first} chia cho {second} rồi nhân 100 để ra phần trăm."
+            units = "%"
+        elif kind in ("whole", "whole_rate_first"):
+            part, rate = (first, second / 100) if kind == "whole" else (second, first / 100)
+            if rate == 0:
+                raise _NotRoutine("division by zero")
+            value = part / rate
+            formulas = [f"{_tex(rate)} n = {part}", f"\\frac{{{part}}}{{{_tex(rate)}}} = {_tex(value)}"]
+            givens = [f"{_tex(rate * 100)}% của một số n bằng {part}"]
+            description = "Gọi số cần tìm là n, lập phương trình phần trăm rồi chia."
+        else:
+            sign = 1 if kind == "increase" else -1
+            base, rate = first, second / 100
+            value = base * (1 + sign * rate)
+            factor = 1 + sign * rate
+            formulas = [f"1 {'+' if sign > 0 else '-'} {_tex(rate)} = {_tex(factor)}", f"{base} \\cdot {_tex(factor)} = {_tex(value)}"]
+            givens = [f"{base} {'tăng' if sign > 0 else 'giảm'} {second}%"]
+            description = f"Nhân {base} với hệ số {'tăng' if sign > 0 else 'giảm'} {_tex(factor)}."
+
+        step = SolutionStep(
+            step_id=1,
+            description=description,
+            derivation="p% của một số bằng (p/100) nhân với số đó.",
+            formulas=formulas,
+            intermediate_result=_tex(value),
+            required_knowledge=_knowledge(PERCENT),
+            common_traps=["Nhầm phần (part) với tổng (whole) khi lập phép chia."],
+        )
+        return _Solved(
+            kind=PERCENT,
+            value=value,
+            target_latex="kết quả",
+            steps=[step],
+            givens=givens,
+            desmos=DesmosConfig(expressions=[formulas[-1].split(" = ")[0]], purpose="verify_solution"),
+            units=units,
+        )
+    return None
+
+
+# ==================================================
+# OUTPUT
+# ==================================================
+
+def _answer_spec(solved: _Solved, choices: List[str]) -> Tuple[AnswerSpec, str]:
+    answer = _fmt(solved.value)
+    if not choices:
+        fraction = Fraction(answer) if "/" in answer else None
+        answer_format = "integer" if solved.value.is_integer else ("fraction" if fraction else "decimal")
+        return AnswerSpec(answer_format=answer_format, rounding="none", units=solved.units), answer + (solved.units or "")
+
+    target = float(solved.value)
+    matches = []
+    for letter, choice in zip(CHOICE_LETTERS, choices):
+        _, _, value = answer_value(choice, solved.units or "%")
+        if value is not None and abs(value - target) <= 1e-9 * max(1.0, abs(target)):
+            matches.append(letter)
+    if len(matches) != 1:
+        raise _NotRoutine("no unique matching choice")
+    letter = matches[0]
+    labelled = [f"{option}) {choice}" for option, choice in zip(CHOICE_LETTERS, choices)]
+    return (
+        AnswerSpec(choices=labelled, correct_choice=letter, units=solved.units),
+        labelled[CHOICE_LETTERS.index(letter)],
+    )
+
+
+def _build_output(solved: _Solved, choices: List[str]) -> SATMathSolutionOutput:
+    spec, final_answer = _answer_spec(solved, choices)
+    domain = "Problem Solving & Data Analysis" if solved.kind == PERCENT else "Algebra"
+    topic = {
+        LINEAR_EQUATION: "Linear equations in one variable",
+        LINEAR_SYSTEM: "Systems of two linear equations in two variables",
+        PERCENT: "Percentages",
+    }[solved.kind]
+    why_others_wrong = None
+    if spec.correct_choice:
+        why_others_wrong = [
+            f"{choice}: không bằng giá trị đúng {_fmt(solved.value)}{solved.units or ''}."
+            for choice in spec.choices or []
+            if not choice.startswith(spec.correct_choice + ")")
+        ]
+    path = SolutionPath(
+        path_id="p1",
+        approach_type="formula_based" if solved.kind == PERCENT else "algebraic",
+        title="Giải trực tiếp" if solved.kind == PERCENT else "Giải đại số",
+        planning=Planning(
+            strategy="Lập phép tính phần trăm và tính trực tiếp." if solved.kind == PERCENT
+            else "Biến đổi tương đương để cô lập ẩn, sau đó tính giá trị đề bài hỏi.",
+            reasoning_flow=[step.description for step in solved.steps],
+            sat_tips=["Đọc kỹ đề hỏi giá trị của ẩn hay của một biểu thức trước khi chọn đáp án."],
+        ),
+        steps=solved.steps,
+        conclusion=Conclusion(
+            final_answer=final_answer,
+            answer_spec=spec,
+            verification=[solved.steps[-1].quick_check or "Thay kết quả vào dữ kiện ban đầu để kiểm tra."],
+            why_others_wrong=why_others_wrong,
+        ),
+        required_knowledge=_knowledge(solved.kind),
+        pros="Nhanh, chính xác, không cần máy tính.",
+        best_when="Đề cho sẵn phương trình/tỉ lệ rõ ràng.",
+        desmos_overview=solved.desmos,
+    )
+    return SATMathSolutionOutput(
+        sat_meta=SATMeta(
+            question_type="multiple_choice" if choices else "grid_in",
+            calculator_policy="calculator",
+            skill_domain=domain,
+            topic=topic,
+            difficulty_band="easy",
+            time_target_seconds=60,
+        ),
+        summary=Summary(
+            givens=solved.givens,
+            goal=f"Tìm giá trị của ${solved.target_latex}$" if solved.kind != PERCENT else "Tính giá trị phần trăm đề bài hỏi",
+            required_knowledge=_knowledge(solved.kind),
+        ),
+        answer_spec=spec,
+        solution_paths=[path],
+        recommended_path_id="p1",
+    )
+
+
+def _verify(output: SATMathSolutionOutput) -> bool:
+    """Substitution and answer checks, as for LLM solutions (verification.py)."""
+    spec = output.answer_spec.model_dump(mode="json")
+    for path in output.solution_paths:
+        data = path.model_dump(mode="json")
+        for result in check_substitution(data) + check_answer(data, spec):
+            if result.status == FAILED:
+                print(f"Fast path solution failed {result.check}: {result.detail}")
+                return False
+    return True
+
+
+def _solve(problem: str) -> Optional[Tuple[str, SATMathSolutionOutput]]:
+    stem, choices = split_choices(_normalize(problem))
+    try:
+        solved = _solve_percent(stem) or _solve_equations(stem)
+        if solved is None:
+            return None
+        output = _build_output(solved, choices)
+        if not _verify(output):
+            _stats.verification_failed += 1
+            return None
+        return solved.kind, output
+    except _NotRoutine:
+        return None
+    except Exception as e:
+        print(f"Fast path failed, using LLM: {e}")
+        return None
+
+
+def solve_routine(problem: Optional[str]) -> Optional[SATMathSolutionOutput]:
+    """Solve a routine problem locally; None when it is not one (use the LLM)."""
+    result = _solve(problem) if problem else None
+    return result[1] if result is not None else None
+
+
+async def solve_locally(problem: Optional[str]) -> Optional[SATMathSolutionOutput]:
+    """solve_routine off the event loop, with stats and the fast_path stage."""
+    if not problem or not fast_path_enabled():
+        return None
+    _stats.attempted += 1
+    with stage("fast_path"):
+        result = await asyncio.to_thread(_solve, problem)
+    if result is None:
+        return None
+    kind, solution = result
+    _stats.solved += 1
+    setattr(_stats, kind, getattr(_stats, kind) + 1)
+    return solution
+
+
+def fast_path_snapshot() -> Dict[str, Any]:
+    return {"enabled": fast_path_enabled(), **asdict(_stats)}
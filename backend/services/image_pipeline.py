@@ -0,0 +1,206 @@
+"""
+Image preprocessing for uploaded problem images
+
+Decode once, fix orientation, trim uniform borders, downscale to what the
+vision model actually uses, re-encode compactly, fingerprint the image for
+cache/store keys and pick the `detail` level adaptively.
+
+The fingerprint is a SHA-256 of the decoded, normalized pixels: identical
+across re-encodings of the same pixels (PNG vs WebP, EXIF rotation, uniform
+borders) but never shared by two different images. The perceptual hash
+(dHash) is kept separately; images that differ in one digit can share it, so
+it only nominates near-duplicate candidates, which must be confirmed before
+any result is reused.
+
+Pillow is optional: without it images are forwarded unchanged (fingerprint
+falls back to SHA-256 of the bytes).
+"""
+import base64
+import binascii
+import hashlib
+import io
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+try:
+    from PIL import Image, ImageChops, ImageOps
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+
+# Vision models (OpenAI "high" detail) scale images to fit 2048x2048 and then
+# to 768px on the short side; anything larger is wasted bandwidth.
+MAX_LONG_SIDE = int(os.getenv("IMAGE_MAX_LONG_SIDE", "2048"))
+MAX_SHORT_SIDE = int(os.getenv("IMAGE_MAX_SHORT_SIDE", "768"))
+# Images this small are read in a single 512px tile, "low" detail is enough
+LOW_DETAIL_MAX_SIDE = int(os.getenv("IMAGE_LOW_DETAIL_MAX_SIDE", "512"))
+JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+
+# Crop margin (px) kept around detected content, and background tolerance
+_CROP_MARGIN = 12
+_CROP_THRESHOLD = 24
+_HASH_SIZE = 16  # 16x16 dHash = 256 bits
+
+
+class ImageError(ValueError):
+    """Uploaded image cannot be decoded."""
+
+
+@dataclass
+class PreparedImage:
+    data: bytes
+    mime_type: str
+    detail: str  # "low" | "high"
+    fingerprint: str  # SHA-256 of the normalized pixels, used in cache/store keys
+    width: Optional[int] = None
+    height: Optional[int] = None
+    original_size: int = 0
+    # dHash: chỉ dùng để tìm ứng viên gần trùng, không dùng làm key
+    perceptual_hash: Optional[str] = None
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{base64.b64encode(self.data).decode('ascii')}"
+
+
+def decode_base64_image(image_base64: str) -> bytes:
+    """Decode a base64 payload, tolerating a leading data: URL prefix."""
+    if image_base64.startswith("data:") and "," in image_base64:
+        image_base64 = image_base64.split(",", 1)[1]
+    try:
+        return base64.b64decode(image_base64, validate=False)
+    except (binascii.Error, ValueError) as e:
+        raise ImageError(f"Invalid base64 image: {e}")
+
+
+def _dhash(img: "Image.Image", size: int = _HASH_SIZE) -> str:
+    """Difference hash: robust to re-encoding, scaling and small brightness changes."""
+    gray = img.convert("L").resize((size + 1, size), Image.LANCZOS)
+    pixels = list(gray.getdata())
+    bits = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{bits:0{size * size // 4}x}"
+
+
+def _pixel_digest(img: "Image.Image") -> str:
+    """SHA-256 of mode, size and raw pixels (independent of the container format)."""
+    digest = hashlib.sha256(f"{img.mode}:{img.width}x{img.height}:".encode("ascii"))
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
+def _flatten(img: "Image.Image") -> "Image.Image":
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.split()[-1])
+        return background
+    if img.mode not in ("RGB", "L"):
+        return img.convert("RGB")
+    return img
+
+
+def _autocrop(img: "Image.Image") -> "Image.Image":
+    """Trim borders that match the top-left corner color (scan margins, screenshots)."""
+    gray = img.convert("L")
+    background = Image.new("L", gray.size, gray.getpixel((0, 0)))
+    diff = ImageChops.difference(gray, background).point(
+        lambda p: 255 if p > _CROP_THRESHOLD else 0
+    )
+    bbox = diff.getbbox()
+    if not bbox:
+        return img
+    left, top, right, bottom = bbox
+    left = max(0, left - _CROP_MARGIN)
+    top = max(0, top - _CROP_MARGIN)
+    right = min(img.width, right + _CROP_MARGIN)
+    bottom = min(img.height, bottom + _CROP_MARGIN)
+    # Chỉ crop khi bỏ được phần đáng kể
+    if (right - left) * (bottom - top) > 0.9 * img.width * img.height:
+        return img
+    return img.crop((left, top, right, bottom))
+
+
+def _target_size(width: int, height: int) -> Tuple[int, int]:
+    scale = min(
+        1.0,
+        MAX_LONG_SIDE / max(width, height),
+        MAX_SHORT_SIDE / min(width, height),
+    )
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _encode(img: "Image.Image") -> Tuple[bytes, str]:
+    """
+    Diagrams/screenshots (few colors) compress best as PNG; photos as JPEG.
+    """
+    out = io.BytesIO()
+    if img.getcolors(maxcolors=256) is not None:
+        img.save(out, format="PNG", optimize=True)
+        return out.getvalue(), "image/png"
+    img.convert("RGB").save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    return out.getvalue(), "image/jpeg"
+
+
+def _choose_detail(width: int, height: int) -> str:
+    forced = os.getenv("IMAGE_DETAIL", "auto")
+    if forced in ("low", "high"):
+        return forced
+    return "low" if max(width, height) <= LOW_DETAIL_MAX_SIDE else "high"
+
+
+def prepare_image(image_bytes: bytes, mime_type: Optional[str] = None) -> PreparedImage:
+    """
+    Run the preprocessing pipeline on raw image bytes (CPU-bound; call it via
+    asyncio.to_thread from async code).
+    """
+    if Image is None:
+        return PreparedImage(
+            data=image_bytes,
+            mime_type=mime_type or "image/jpeg",
+            detail="high",
+            fingerprint=hashlib.sha256(image_bytes).hexdigest(),
+            original_size=len(image_bytes),
+        )
+
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        img = ImageOps.exif_transpose(img)
+        img.load()
+    except Exception as e:
+        raise ImageError(f"Cannot decode image: {e}")
+
+    flat = _flatten(img)
+    img = _autocrop(flat)
+    changed = img is not flat
+    fingerprint = _pixel_digest(img)
+    perceptual_hash = _dhash(img)
+
+    size = _target_size(img.width, img.height)
+    if size != (img.width, img.height):
+        img = img.resize(size, Image.LANCZOS)
+        changed = True
+
+    data, out_mime = _encode(img)
+    # Ảnh gốc đã nhỏ gọn và không cần crop/resize: giữ nguyên bytes gốc
+    if not changed and len(data) >= len(image_bytes) and mime_type in ("image/png", "image/jpeg", "image/webp"):
+        data, out_mime = image_bytes, mime_type
+
+    return PreparedImage(
+        data=data,
+        mime_type=out_mime,
+        detail=_choose_detail(img.width, img.height),
+        fingerprint=fingerprint,
+        width=img.width,
+        height=img.height,
+        original_size=len(image_bytes),
+        perceptual_hash=perceptual_hash,
+    )
+
+
+def prepare_image_base64(image_base64: str, mime_type: Optional[str] = None) -> PreparedImage:
+    return prepare_image(decode_base64_image(image_base64), mime_type)
@@ -0,0 +1,422 @@
+"""
+Durable job queue for long-running solves
+
+POST /jobs stores the request in a SQLite queue and returns immediately; a
+pool of asyncio workers claims jobs, runs the solve and stores the result,
+which clients poll (GET /jobs/{id}) or follow over SSE. Claims are leases,
+renewed while the job runs: a job whose worker died (process restart, crash)
+is picked up again once the lease expires, up to max_attempts. Several processes can share one queue
+file, so workers scale independently of web processes.
+"""
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from services.admission import PRIORITY_BACKGROUND, set_call_priority
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+FINISHED_STATUSES = ("succeeded", "failed")
+
+_DEFAULT_DB_PATH = ".cache/jobs.sqlite3"
+
+
+@dataclass
+class Job:
+    id: str
+    subject: str
+    payload: Dict[str, Any]
+    status: str = "queued"
+    priority: int = 0
+    attempts: int = 0
+    result_json: Optional[str] = None
+    error: Optional[str] = None
+    worker: Optional[str] = None
+    created_at: Optional[float] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def public(self, include_result: bool = True) -> Dict[str, Any]:
+        """API view (no payload / worker); result parsed when present."""
+        data = asdict(self)
+        for name in ("payload", "result_json", "worker"):
+            del data[name]
+        if include_result:
+            data["result"] = json.loads(self.result_json) if self.result_json else None
+        return data
+
+
+_COLUMNS = (
+    "id, subject, payload, status, priority, attempts, result, error, worker, "
+    "created_at, started_at, finished_at"
+)
+
+
+class SQLiteJobQueue:
+    """Job table with atomic claim (BEGIN IMMEDIATE), safe across processes."""
+
+    def __init__(self, path: str, lease_seconds: float = 300.0, max_attempts: int = 2):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                subject TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                worker TEXT,
+                lease_until REAL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(status, priority, created_at);
+            CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs(finished_at);
+            """
+        )
+
+    @staticmethod
+    def _row(row: Any) -> Job:
+        (
+            job_id, subject, payload, status, priority, attempts, result, error,
+            worker, created_at, started_at, finished_at,
+        ) = row
+        return Job(
+            id=job_id,
+            subject=subject,
+            payload=json.loads(payload),
+            status=status,
+            priority=priority,
+            attempts=attempts,
+            result_json=result,
+            error=error,
+            worker=worker,
+            created_at=created_at,
+            started_at=started_at,
+            finished_at=finished_at,
+        )
+
+    def submit(self, subject: str, payload: Dict[str, Any], priority: int = 0) -> Job:
+        job = Job(
+            id=uuid.uuid4().hex,
+            subject=subject,
+            payload=payload,
+            priority=priority,
+            created_at=time.time(),
+        )
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, subject, payload, status, priority, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job.id, subject, json.dumps(payload, ensure_ascii=False), job.status, priority, job.created_at),
+            )
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def claim(self, worker: str) -> Optional[Job]:
+        """
+        Take the next queued job (or one whose lease expired) and lease it to
+        worker. Jobs out of attempts are marked failed instead.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    row = self._conn.execute(
+                        f"SELECT {_COLUMNS} FROM jobs "
+                        "WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                        "ORDER BY priority, created_at LIMIT 1",
+                        (now,),
+                    ).fetchone()
+                    if row is None:
+                        self._conn.execute("COMMIT")
+                        return None
+                    job = self._row(row)
+                    if job.attempts >= self.max_attempts:
+                        # Worker trước chết giữa chừng quá số lần cho phép
+                        self._conn.execute(
+                            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, lease_until = NULL "
+                            "WHERE id = ?",
+                            (job.error or "Job abandoned by its worker too many times", now, job.id),
+                        )
+                        continue
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, "
+                        "lease_until = ?, started_at = ? WHERE id = ?",
+                        (worker, now + self.lease_seconds, now, job.id),
+                    )
+                    self._conn.execute("COMMIT")
+                    job.status, job.worker, job.attempts, job.started_at = "running", worker, job.attempts + 1, now
+                    return job
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def renew(self, job_id: str, worker: str) -> bool:
+        """Extend worker's lease on a running job; False if the job is no longer its own."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time() + self.lease_seconds, job_id, worker),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id: str, worker: str, result_json: str) -> None:
+        self._finish(job_id, worker, "succeeded", result_json, None)
+
+    def fail(self, job_id: str, worker: str, error: str) -> None:
+        self._finish(job_id, worker, "failed", None, error)
+
+    def _finish(self, job_id: str, worker: str, status: str, result_json: Optional[str], error: Optional[str]) -> None:
+        with self._lock:
+            # Chỉ worker đang giữ lease mới được ghi kết quả
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (status, result_json, error, time.time(), job_id, worker),
+            )
+
+    def requeue(self, worker: str) -> int:
+        """Return this worker's running jobs to the queue (graceful shutdown)."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL, lease_until = NULL, "
+                "attempts = MAX(attempts - 1, 0) WHERE worker = ? AND status = 'running'",
+                (worker,),
+            )
+            return cursor.rowcount
+
+    def purge(self, older_than_seconds: float) -> int:
+        """Delete finished jobs older than the retention period."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                (time.time() - older_than_seconds,),
+            )
+            return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {**{status: 0 for status in JOB_STATUSES}, **dict(rows)}
+
+
+# ==================================================
+# WORKER POOL
+# ==================================================
+
+JobRunner = Callable[[Job], Awaitable[str]]
+
+
+class LeaseLost(RuntimeError):
+    """The job's lease was taken over (expired or requeued); another worker owns it."""
+
+
+@dataclass
+class JobStats:
+    succeeded: int = 0
+    failed: int = 0
+    requeued: int = 0
+    lease_lost: int = 0
+
+
+class JobWorkerPool:
+    """
+    workers asyncio tasks claiming jobs from the queue. runner executes one
+    job and returns the result JSON; an exception marks the job failed.
+    Idle workers wake on notify() (same process) or after poll_interval
+    (jobs submitted by other processes).
+    """
+
+    def __init__(
+        self,
+        queue: SQLiteJobQueue,
+        runner: JobRunner,
+        workers: int = 2,
+        poll_interval: float = 1.0,
+        retention_seconds: float = 24 * 3600,
+    ):
+        self.queue = queue
+        self.runner = runner
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self._last_purge = 0.0
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.stats = JobStats()
+        self.busy = 0
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        # Job hoàn thành trong process này: báo cho SSE không phải chờ poll
+        self._finished = asyncio.Condition()
+
+    def start(self) -> None:
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._work()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.stats.requeued += await asyncio.to_thread(self.queue.requeue, self.worker_id)
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    async def wait_for_change(self, timeout: float) -> None:
+        """Sleep until a job finishes in this process or timeout passes."""
+        async with self._finished:
+            try:
+                await asyncio.wait_for(self._finished.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _work(self) -> None:
+        # Lời gọi LLM của job xếp sau request tương tác và batch trong admission control
+        set_call_priority(PRIORITY_BACKGROUND)
+        while True:
+            job = await asyncio.to_thread(self.queue.claim, self.worker_id)
+            if job is None:
+                if time.monotonic() - self._last_purge > 3600:
+                    self._last_purge = time.monotonic()
+                    await asyncio.to_thread(self.queue.purge, self.retention_seconds)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self.busy += 1
+            try:
+                result_json = await self._run_with_lease(job)
+            except asyncio.CancelledError:
+                raise
+            except LeaseLost as e:
+                # Worker khác đã nhận job: không ghi kết quả/lỗi đè lên
+                print(f"Job {job.id} abandoned: {e}")
+                self.stats.lease_lost += 1
+            except Exception as e:
+                print(f"Job {job.id} failed: {e}")
+                await asyncio.to_thread(self.queue.fail, job.id, self.worker_id, str(e))
+                self.stats.failed += 1
+            else:
+                await asyncio.to_thread(self.queue.complete, job.id, self.worker_id, result_json)
+                self.stats.succeeded += 1
+            finally:
+                self.busy -= 1
+            async with self._finished:
+                self._finished.notify_all()
+
+    async def _run_with_lease(self, job: Job) -> str:
+        """Run job, renewing its lease every lease/3 so a long solve is not re-claimed."""
+        task = asyncio.ensure_future(self.runner(job))
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=self.queue.lease_seconds / 3)
+                if done:
+                    return task.result()
+                if not await asyncio.to_thread(self.queue.renew, job.id, self.worker_id):
+                    raise LeaseLost(f"lease on job {job.id} lost while running")
+        finally:
+            if not task.done():
+                task.cancel()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "worker_id": self.worker_id,
+            "workers": self.workers,
+            "busy": self.busy,
+            **asdict(self.stats),
+        }
+
+
+def make_solve_runner(client: Any) -> JobRunner:
+    """
+    Runner solving the job payload (same fields as a /solve/batch item) with
+    solve_sat_problem / solve_sat_english_problem on the shared LLM client.
+    """
+    from services.llm_service import solve_sat_english_problem, solve_sat_problem
+
+    async def _run(job: Job) -> str:
+        payload = job.payload
+        if job.subject == "english":
+            solution = await solve_sat_english_problem(
+                problem=payload["problem"],
+                client=client,
+                profile=payload.get("profile"),
+            )
+        else:
+            solution = await solve_sat_problem(
+                problem=payload.get("problem"),
+                image_base64=payload.get("image_base64"),
+                image_mime_type=payload.get("image_mime_type"),
+                mode=payload.get("mode"),
+                client=client,
+                profile=payload.get("profile"),
+            )
+        return solution.model_dump_json()
+
+    return _run
+
+
+def create_worker_pool(client: Any, workers: Optional[int] = None) -> JobWorkerPool:
+    """
+    Pool over the process-wide queue: JOB_WORKERS (default 2),
+    JOB_POLL_INTERVAL (seconds, default 1), JOB_RETENTION_SECONDS (default 1 day).
+    """
+    return JobWorkerPool(
+        get_job_queue(),
+        make_solve_runner(client),
+        workers=int(os.getenv("JOB_WORKERS", "2")) if workers is None else workers,
+        poll_interval=float(os.getenv("JOB_POLL_INTERVAL", "1")),
+        retention_seconds=float(os.getenv("JOB_RETENTION_SECONDS", str(24 * 3600))),
+    )
+
+
+_job_queue: Optional[SQLiteJobQueue] = None
+
+
+def get_job_queue() -> SQLiteJobQueue:
+    """
+    Process-wide queue configured from environment:
+
+    - JOB_QUEUE_DB_PATH (default .cache/jobs.sqlite3)
+    - JOB_LEASE_SECONDS (default 300): renewed every third of it while a job
+      runs; a job whose worker stopped renewing is re-claimed after this
+    - JOB_MAX_ATTEMPTS (default 2)
+    """
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = SQLiteJobQueue(
+            os.getenv("JOB_QUEUE_DB_PATH") or _DEFAULT_DB_PATH,
+            lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "300")),
+            max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "2")),
+        )
+    return _job_queue
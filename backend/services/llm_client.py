@@ -0,0 +1,167 @@
+"""
+Shared LLM client
+
+One instance per process, created at application startup (FastAPI lifespan)
+and injected into the solve functions. It owns a keep-alive httpx connection
+pool that LiteLLM reuses for every provider call, so TLS handshakes and the
+LiteLLM import happen once instead of on the request path.
+"""
+import os
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:  # pragma: no cover - optional dependency
+    HTTP2_AVAILABLE = False
+
+
+def _env_float(name: str, default: float) -> float:
+    raw = os.getenv(name)
+    return float(raw) if raw else default
+
+
+@dataclass(frozen=True)
+class LLMTimeouts:
+    """
+    Per-phase timeouts (seconds). read bounds a whole non-streamed response;
+    stream_read bounds the gap between chunks of a streamed response.
+    """
+    connect: float = 5.0
+    read: float = 180.0
+    stream_read: float = 60.0
+    write: float = 30.0
+    pool: float = 10.0
+
+    @classmethod
+    def from_env(cls) -> "LLMTimeouts":
+        return cls(
+            connect=_env_float("LLM_CONNECT_TIMEOUT", cls.connect),
+            read=_env_float("LLM_READ_TIMEOUT", cls.read),
+            stream_read=_env_float("LLM_STREAM_READ_TIMEOUT", cls.stream_read),
+            write=_env_float("LLM_WRITE_TIMEOUT", cls.write),
+            pool=_env_float("LLM_POOL_TIMEOUT", cls.pool),
+        )
+
+    def as_httpx(self, stream: bool = False) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=self.connect,
+            read=self.stream_read if stream else self.read,
+            write=self.write,
+            pool=self.pool,
+        )
+
+
+class LLMClient:
+    """
+    Thin wrapper around litellm.acompletion bound to a pooled HTTP client.
+    """
+
+    def __init__(
+        self,
+        timeouts: Optional[LLMTimeouts] = None,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 60.0,
+        http2: Optional[bool] = None,
+    ):
+        self.timeouts = timeouts or LLMTimeouts()
+        self.http2 = HTTP2_AVAILABLE if http2 is None else (http2 and HTTP2_AVAILABLE)
+        self.http = httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=self.timeouts.as_httpx(),
+        )
+        self._acompletion: Optional[Callable[..., Any]] = None
+
+    def start(self) -> None:
+        """Import LiteLLM and route its async provider calls through the pool."""
+        if self._acompletion is not None:
+            return
+        import litellm
+
+        litellm.aclient_session = self.http
+        self._acompletion = litellm.acompletion
+
+    async def acompletion(self, *, stream: bool = False, **kwargs: Any) -> Any:
+        if self._acompletion is None:
+            self.start()
+        kwargs.setdefault("timeout", self.timeouts.as_httpx(stream))
+        if stream:
+            kwargs["stream"] = True
+        return await self._acompletion(**kwargs)
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "http2": self.http2,
+            "started": self._acompletion is not None,
+            "timeouts": {
+                "connect": self.timeouts.connect,
+                "read": self.timeouts.read,
+                "stream_read": self.timeouts.stream_read,
+                "write": self.timeouts.write,
+                "pool": self.timeouts.pool,
+            },
+        }
+
+
+_llm_client: Optional[LLMClient] = None
+
+
+def create_llm_client() -> LLMClient:
+    """
+    Build a client configured from environment:
+
+    - LLM_MAX_CONNECTIONS (default 100)
+    - LLM_MAX_KEEPALIVE_CONNECTIONS (default 20)
+    - LLM_KEEPALIVE_EXPIRY (seconds, default 60)
+    - LLM_HTTP2 (default "1"; used only when the h2 package is installed)
+    - LLM_CONNECT_TIMEOUT / LLM_READ_TIMEOUT / LLM_STREAM_READ_TIMEOUT /
+      LLM_WRITE_TIMEOUT / LLM_POOL_TIMEOUT
+    """
+    return LLMClient(
+        timeouts=LLMTimeouts.from_env(),
+        max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        keepalive_expiry=_env_float("LLM_KEEPALIVE_EXPIRY", 60.0),
+        http2=os.getenv("LLM_HTTP2", "1").lower() not in ("0", "false", "no"),
+    )
+
+
+async def open_llm_client() -> LLMClient:
+    """Create and start the process-wide client (application startup)."""
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = create_llm_client()
+    _llm_client.start()
+    return _llm_client
+
+
+async def close_llm_client() -> None:
+    """Close the process-wide client and its connection pool (application shutdown)."""
+    global _llm_client
+    if _llm_client is not None:
+        await _llm_client.aclose()
+        _llm_client = None
+
+
+def get_llm_client() -> LLMClient:
+    """
+    Return the process-wide client, creating it lazily when used outside the
+    web app (CLI scripts, precompute).
+    """
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = create_llm_client()
+    return _llm_client
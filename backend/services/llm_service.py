@@ -4,7 +4,13 @@ LLM Service for generating SAT math solutions
 import sys
 import os
 import json
-from typing import Optional, List, Dict, Any
+import base64
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Any, AsyncIterator, Awaitable, Callable, Tuple, Type, Sequence
+
+from pydantic import ValidationError
 
 # Add parent directory to path to import schemas
 from services.schemas import (
@@ -18,16 +24,352 @@ from services.schemas import (
     Conclusion,
     KnowledgeItem,
     DesmosConfig,
+    ProblemLocalization,
+    SATMathAnalysis,
+    PlannedPath,
+    SATMathLazySolution,
+    SATMathAnswerSample,
     SATEnglishSolutionOutput,
+    EnglishSolutionPath,
+)
+
+from services.cache import SolutionCache, get_solution_cache, make_cache_key
+from services.singleflight import get_single_flight
+from services.streaming import IncrementalJSONParser
+from services.prompt_registry import get_prompt_registry
+from services.metrics import track_usage
+from services.tracing import record_llm_call, record_stage, stage, traced_stage
+from services.image_pipeline import PreparedImage, prepare_image, prepare_image_base64
+from services.llm_client import LLMClient, get_llm_client
+from services.routing import ModelTier, get_model_router
+from services.resilience import get_hedged_executor
+from services.admission import llm_call_slot
+from services.profiles import ResponseProfile, get_profile, with_reasoning_budget
+from services.serialization import validate_json
+from services.solution_store import (
+    StoredSolution,
+    find_similar,
+    lookup_solution,
+    problem_fingerprint,
+    record_solution,
 )
+from services.similarity import remap_choices
+from services.fast_path import solve_locally
+from services.verification import VerificationReport, build_verification_feedback, get_verifier, verification_enabled
+from services.voting import (
+    Ballot,
+    get_vote_stats,
+    record_agreement,
+    vote_bands,
+    vote_key,
+    vote_params,
+    vote_quorum,
+    vote_samples,
+)
+from services.repair import (
+    OutputValidationError,
+    RepairResponse,
+    TruncatedOutputError,
+    apply_fix,
+    build_fix_instruction,
+    get_repair_stats,
+    validate_or_repair,
+)
+
+
+# System prompt nằm trong services/prompts/<name>.<version>.txt, load một lần khi import.
+# Tag (name:version:hash) thay đổi khi sửa file nên cache lời giải cũ tự hết hiệu lực.
+_prompt_registry = get_prompt_registry()
+MATH_PROMPT = _prompt_registry.get("sat_math_system", os.getenv("MATH_PROMPT_VERSION", "v1"))
+ENGLISH_PROMPT = _prompt_registry.get("sat_english_system", os.getenv("ENGLISH_PROMPT_VERSION", "v1"))
+MATH_PROMPT_VERSION = MATH_PROMPT.tag
+ENGLISH_PROMPT_VERSION = ENGLISH_PROMPT.tag
+
+# (event name, payload) cho chế độ stream / pipeline
+StreamEvent = Tuple[str, Any]
+
+# Output sai schema: sửa đúng chỗ lỗi bằng một lời gọi nhỏ trước khi escalate/gen lại
+LLM_REPAIR_CALL_ENABLED = os.getenv("LLM_REPAIR_CALL_ENABLED", "1").lower() not in ("0", "false", "no")
+# Cache miss: trả lời giải đã lưu trong solution store (cùng đề, kind, prompt version) thay vì gọi LLM
+SOLUTION_STORE_SERVE = os.getenv("SOLUTION_STORE_SERVE", "1").lower() not in ("0", "false", "no")
+# Kiểm tra đáp án bằng SymPy (services/verification.py); chỉ check lỗi mới sinh lại
+MATH_VERIFY_REGENERATE = os.getenv("MATH_VERIFY_REGENERATE", "1").lower() not in ("0", "false", "no")
+
+
+MATH_FULL_SOLUTION_INSTRUCTION = "Trả về solution đầy đủ bằng JSON theo SATMathSolutionOutput schema. TẤT CẢ giải thích phải bằng TIẾNG VIỆT."
+
+
+@traced_stage("prompt_build")
+def _build_math_messages(
+    problem: Optional[str] = None,
+    image: Optional[PreparedImage] = None,
+    instruction: str = MATH_FULL_SOLUTION_INSTRUCTION,
+    output_model: Type[Any] = SATMathSolutionOutput,
+) -> List[Dict[str, Any]]:
+    """
+    Build chat messages for a SAT Math request (text and/or image)
+
+    Layout is cache-friendly: the developer message (system prompt + output
+    schema) is byte-identical across requests, and the user turn starts with
+    the static instruction; the problem text/image always comes last.
+
+    Args:
+        instruction: What to return for this call (full solution by default,
+            pipeline stages pass their own instruction)
+        output_model: Schema embedded in the static prefix
+    """
+    user_content: List[Dict[str, Any]] = [{"type": "text", "text": instruction}]
+    
+    # Add image if provided (already downscaled/re-encoded by the image pipeline)
+    if image is not None:
+        user_content.append({
+            "type": "image_url",
+            "image_url": {
+                "url": image.data_url,
+                "detail": image.detail,  # "high" cho ảnh lớn có hình vẽ, "low" cho ảnh nhỏ
+            }
+        })
+    
+    # Add problem text
+    if problem:
+        text_prompt = f"""Giải bài toán SAT sau:
+
+{problem}"""
+    else:
+        text_prompt = """Giải bài toán SAT trong hình ảnh trên.
+Nếu hình ảnh chứa bài toán với hình vẽ, mô tả chi tiết các thông tin từ hình vẽ trong summary.givens."""
+    
+    user_content.append({
+        "type": "text",
+        "text": text_prompt
+    })
+
+    return [
+        _prompt_registry.system_message(MATH_PROMPT, output_model),
+        {"role": "user", "content": user_content},
+    ]
+
+
+ENGLISH_SOLUTION_INSTRUCTION = """Trả về lời giải CHỈ dưới dạng JSON đúng theo schema SATEnglishSolutionOutput.
+Mọi giải thích, planning, steps, answer_analysis đều phải bằng TIẾNG VIỆT (ngoại trừ câu/cụm từ tiếng Anh được trích dẫn từ bài)."""
+
+
+@traced_stage("prompt_build")
+def _build_english_messages(
+    problem: str,
+    instruction: str = ENGLISH_SOLUTION_INSTRUCTION,
+    output_model: Type[Any] = SATEnglishSolutionOutput,
+) -> List[Dict[str, Any]]:
+    """
+    Build chat messages for a SAT English request (static prefix first, question last)
+    """
+    user_content: List[Dict[str, Any]] = [
+        {"type": "text", "text": instruction},
+        {
+            "type": "text",
+            "text": f"""Giải câu hỏi SAT English sau:
+
+{problem}""",
+        },
+    ]
+
+    return [
+        _prompt_registry.system_message(ENGLISH_PROMPT, output_model),
+        {"role": "user", "content": user_content},
+    ]
+
+
+def _profile_kind(kind: str, profile: Optional[ResponseProfile]) -> str:
+    # Profile "full" giữ nguyên key cũ để không mất cache đã có
+    if profile is None or profile.name == "full":
+        return kind
+    return f"{kind}:{profile.name}"
+
+
+def _math_cache_key(
+    problem: Optional[str],
+    image: Optional[PreparedImage],
+    tier: ModelTier,
+    profile: Optional[ResponseProfile] = None,
+    kind: str = "math",
+) -> str:
+    return make_cache_key(
+        kind=_profile_kind(kind, profile),
+        problem=problem,
+        image_fingerprint=image.fingerprint if image is not None else None,
+        model=tier.model,
+        reasoning_effort=tier.reasoning_effort,
+        prompt_version=MATH_PROMPT_VERSION,
+    )
+
+
+def _english_cache_key(problem: str, tier: ModelTier, profile: Optional[ResponseProfile] = None) -> str:
+    return make_cache_key(
+        kind=_profile_kind("english", profile),
+        problem=problem,
+        model=tier.model,
+        reasoning_effort=tier.reasoning_effort,
+        prompt_version=ENGLISH_PROMPT_VERSION,
+    )
+
+
+@dataclass(frozen=True)
+class _StoreTarget:
+    """Where a freshly generated solution goes in the solution store."""
+
+    subject: str
+    kind: str
+    fingerprint: str
+    problem: Optional[str]
+    tier: ModelTier
+    prompt_version: str
+    has_image: bool = False
+
+    def record(self, solution: Any, usage: Dict[str, int]) -> StoredSolution:
+        meta = solution.sat_meta
+        return StoredSolution(
+            subject=self.subject,
+            kind=self.kind,
+            fingerprint=self.fingerprint,
+            solution_json=solution.model_dump_json(),
+            problem=self.problem,
+            skill_domain=getattr(meta, "skill_domain", None),
+            # English không có topic: dùng text_type
+            topic=getattr(meta, "topic", None) or getattr(meta, "text_type", None),
+            difficulty_band=meta.difficulty_band,
+            question_type=meta.question_type,
+            model=self.tier.model,
+            reasoning_effort=self.tier.reasoning_effort,
+            prompt_version=self.prompt_version,
+            usage=dict(usage),
+        )
+
+
+def _math_store_target(
+    problem: Optional[str],
+    image: Optional[PreparedImage],
+    tier: ModelTier,
+    profile: Optional[ResponseProfile] = None,
+) -> _StoreTarget:
+    return _StoreTarget(
+        subject="math",
+        kind=_profile_kind("math", profile),
+        fingerprint=problem_fingerprint(problem, image.fingerprint if image is not None else None),
+        problem=problem,
+        tier=tier,
+        prompt_version=MATH_PROMPT_VERSION,
+        has_image=image is not None,
+    )
+
+
+def _english_store_target(problem: str, tier: ModelTier, profile: Optional[ResponseProfile] = None) -> _StoreTarget:
+    return _StoreTarget(
+        subject="english",
+        kind=_profile_kind("english", profile),
+        fingerprint=problem_fingerprint(problem),
+        problem=problem,
+        tier=tier,
+        prompt_version=ENGLISH_PROMPT_VERSION,
+    )
+
+
+def _cache_loader(cache: SolutionCache, key: str, output_model: Type[Any]) -> Callable[[], Awaitable[Optional[Any]]]:
+    """Cache read used by single-flight when another worker process generated the value."""
+    async def _load() -> Optional[Any]:
+        cached = await cache.get(key)
+        return validate_json(output_model, cached) if cached is not None else None
+
+    return _load
+
+
+async def _load_stored(target: _StoreTarget, output_model: Type[Any]) -> Optional[Any]:
+    """
+    Known question: validated solution from the store (exact fingerprint, then
+    near-duplicate with choice letters re-mapped), or None.
+    """
+    if not SOLUTION_STORE_SERVE:
+        return None
+    stored = await lookup_solution(target.fingerprint, target.kind, target.prompt_version)
+    choice_map: Dict[str, str] = {}
+    if stored is None and not target.has_image:
+        similar = await find_similar(target.problem, target.kind, target.prompt_version)
+        if similar is not None:
+            stored, match = similar
+            choice_map = match.choice_map
+    if stored is None:
+        return None
+    try:
+        if choice_map:
+            return output_model.model_validate(remap_choices(json.loads(stored.solution_json), choice_map))
+        return validate_json(output_model, stored.solution_json)
+    except ValidationError as e:
+        # Schema đã đổi từ lúc lưu: coi như miss
+        print(f"Ignoring stored solution {stored.id}: {e}")
+        return None
+
+
+async def _load_known(target: _StoreTarget, output_model: Type[Any]) -> Optional[Any]:
+    """
+    _load_stored, then for routine text-only math (linear equation, 2x2
+    system, percent) a solution computed locally without an LLM call.
+    """
+    solution = await _load_stored(target, output_model)
+    if solution is None and target.subject == "math" and not target.has_image and output_model is SATMathSolutionOutput:
+        solution = await solve_locally(target.problem)
+    return solution
+
+
+def build_solve_request(
+    subject: str,
+    problem: Optional[str] = None,
+    image_base64: Optional[str] = None,
+    image_mime_type: Optional[str] = None,
+) -> Tuple[str, List[Dict[str, Any]], Type[Any], ModelTier]:
+    """
+    Return (cache_key, messages, output_model, tier) for one problem, exactly
+    as the live solve path would build them. Used by offline batch precompute.
+    """
+    router = get_model_router()
+    if subject == "english":
+        tier = router.route_english(problem or "")[0]
+        return (
+            _english_cache_key(problem or "", tier),
+            _build_english_messages(problem or ""),
+            SATEnglishSolutionOutput,
+            tier,
+        )
+    image = prepare_image_base64(image_base64, image_mime_type) if image_base64 else None
+    tier = router.route_math(problem, image)[0]
+    return (
+        _math_cache_key(problem, image, tier),
+        _build_math_messages(problem, image),
+        SATMathSolutionOutput,
+        tier,
+    )
 
-from litellm import acompletion
+
+async def _prepare_image(
+    image_base64: Optional[str],
+    image_mime_type: Optional[str],
+    image_bytes: Optional[bytes] = None,
+) -> Optional[PreparedImage]:
+    """Decode/downscale/re-encode off the event loop."""
+    if not image_bytes and not image_base64:
+        return None
+    with stage("image_preprocess"):
+        if image_bytes:
+            return await asyncio.to_thread(prepare_image, image_bytes, image_mime_type)
+        return await asyncio.to_thread(prepare_image_base64, image_base64, image_mime_type)
 
 
 async def solve_sat_problem(
     problem: Optional[str] = None,
     image_base64: Optional[str] = None,
     image_mime_type: Optional[str] = None,
+    mode: Optional[str] = None,
+    image_bytes: Optional[bytes] = None,
+    client: Optional[LLMClient] = None,
+    profile: Optional[str] = None,
 ) -> SATMathSolutionOutput:
     """
     Generate SAT math solution using LLM
@@ -36,17 +378,77 @@ async def solve_sat_problem(
         problem: The SAT math problem text (optional if image provided)
         image_base64: Base64 encoded image (optional)
         image_mime_type: MIME type of image (e.g., "image/png", "image/jpeg")
+        image_bytes: Raw image bytes from a binary upload (instead of image_base64)
+        mode: "single" (one call), "pipeline" (analysis + concurrent paths),
+            "lazy" (analysis + recommended path only, see solve_pending_path) or
+            "vote" (answer-only samples voted on before the full solution, for
+            MATH_VOTE_BANDS problems); defaults to MATH_SOLVE_MODE env var
+        client: Shared LLM client (injected by the app; process default otherwise)
+        profile: "full", "standard" or "quick" (see services/profiles.py);
+            defaults to RESPONSE_PROFILE env var
         
     Returns:
         SATMathSolutionOutput: Complete solution structure
+        (SATMathLazySolution in lazy mode)
     """
-    return await _solve_with_litellm(problem, image_base64, image_mime_type)
+    client = client or get_llm_client()
+    response_profile = get_profile(profile)
+    mode = _math_solve_mode(mode)
+    image = await _prepare_image(image_base64, image_mime_type, image_bytes)
+    # Bài dễ dùng tier nhẹ; tier mạnh hơn chỉ dùng khi output không hợp lệ
+    tiers = get_model_router().route_math(problem, image)
+    cache = get_solution_cache()
+
+    if mode == "lazy":
+        cache_key = _math_cache_key(problem, image, tiers[0], response_profile, kind="math_lazy")
+        cached = await cache.get(cache_key)
+        if cached is not None:
+            return validate_json(SATMathLazySolution, cached)
+
+        async def _generate_lazy() -> SATMathLazySolution:
+            solution = await _solve_with_pipeline(
+                client, tiers, problem, image, response_profile, _lazy_solution_id(cache_key)
+            )
+            await cache.set(cache_key, solution.model_dump_json())
+            return solution
+
+        return await get_single_flight().do(
+            cache_key, _generate_lazy, _cache_loader(cache, cache_key, SATMathLazySolution)
+        )
+
+    cache_key = _math_cache_key(problem, image, tiers[0], response_profile)
+
+    cached = await cache.get(cache_key)
+    if cached is not None:
+        return validate_json(SATMathSolutionOutput, cached)
+
+    store_target = _math_store_target(problem, image, tiers[0], response_profile)
+
+    async def _generate() -> SATMathSolutionOutput:
+        solution = await _load_known(store_target, SATMathSolutionOutput)
+        if solution is None:
+            with track_usage() as usage:
+                if mode == "pipeline":
+                    solution = await _solve_with_pipeline(client, tiers, problem, image, response_profile)
+                elif mode == "vote":
+                    solution = await _solve_with_vote(client, tiers, problem, image, response_profile)
+                else:
+                    solution = await _solve_with_litellm(client, tiers, problem, image, response_profile)
+            await record_solution(store_target.record(solution, usage))
+        await cache.set(cache_key, solution.model_dump_json())
+        return solution
+
+    # Các request giống hệt nhau đang chạy đồng thời dùng chung một lần gọi LLM
+    return await get_single_flight().do(cache_key, _generate, _cache_loader(cache, cache_key, SATMathSolutionOutput))
 
 
 async def _solve_with_litellm(
+    client: LLMClient,
+    tiers: Sequence[ModelTier],
     problem: Optional[str] = None,
-    image_base64: Optional[str] = None,
-    image_mime_type: Optional[str] = None,
+    image: Optional[PreparedImage] = None,
+    profile: Optional[ResponseProfile] = None,
+    answer_hint: Optional[str] = None,
 ) -> SATMathSolutionOutput:
     """
     Solve using LiteLLM (supports multiple providers including OpenAI)
@@ -54,474 +456,1048 @@ async def _solve_with_litellm(
     LiteLLM can use OpenAI models by setting:
     - LITELLM_MODEL=gpt-4 (or gpt-4-turbo-preview, gpt-3.5-turbo, etc.)
     - OPENAI_API_KEY=your-key
-    """
-    
-    system_prompt = """You are an expert SAT Math tutor, curriculum designer, and test-prep strategist.
-
-Your task is to solve SAT Math questions and produce solutions that are:
-- Correct
-- Efficient under SAT time constraints
-- Pedagogically clear
-- Strictly structured
-
-QUAN TRỌNG: Tất cả output phải bằng TIẾNG VIỆT để giải thích cho học sinh Việt Nam.
-
-You MUST output your response in valid JSON that conforms EXACTLY to the provided SATMathSolutionOutput schema.
-
-Hard rules:
-1. Follow the schema EXACTLY.
-   - Do not add extra fields.
-   - Do not remove required fields.
-   - Do not change field names or data types.
-2. Do NOT include any explanation outside the JSON output.
-3. All reasoning must be expressed only through:
-   - summary (bằng tiếng Việt)
-   - planning (bằng tiếng Việt)
-   - solution_paths (bằng tiếng Việt)
-   - steps (bằng tiếng Việt)
-   - conclusion (bằng tiếng Việt)
-4. Use concise, SAT-appropriate language in Vietnamese.
-   - Each solution should be solvable in 1–2 minutes by a test-taker.
-5. Respect SAT constraints strictly:
-   - Calculator vs no-calculator
-   - Multiple-choice vs grid-in
-   - Integer/positive/domain constraints
-   - sat_meta.topic phải là một chủ đề SAT Math cụ thể, ngắn gọn, thường dùng trong giáo trình (ví dụ:
-     "Linear equations", "Systems of equations", "Ratios and proportions", "Quadratic functions").
-     Không được để trống nếu có thể suy ra rõ ràng từ đề bài.
-6. Provide MULTIPLE solution paths - ƯU TIÊN TẠO 3 PATHS theo các hướng sau (theo thứ tự ưu tiên):
-
-   a) Path 1 - HỌC THUẬT CHÍNH XÁC (approach_type: "algebraic" hoặc "formula_based"):
-      - BẮT BUỘC phải có path này
-      - Giải đúng quy trình toán học, từng bước logic và chính xác
-      - Sử dụng công thức, định lý, phương pháp đại số/hình học chuẩn
-      - Phù hợp cho học sinh muốn hiểu sâu và học đúng cách
-      - Đảm bảo tính chính xác và đầy đủ, có thể áp dụng cho mọi trường hợp
-      - title: "Phương Pháp Học Thuật Chính Xác" hoặc "Giải Theo Quy Trình Toán Học"
-   
-   b) Path 2 - TRICK/SHORTCUT DỰA TRÊN ĐÁP ÁN (approach_type: "exam_trick"):
-      - Tạo path này NẾU bài toán có multiple choice với đáp án cho trước
-      - Sử dụng đáp án cho trước để:
-        * Thay số trực tiếp vào phương trình/biểu thức để kiểm tra
-        * Loại trừ các đáp án sai bằng cách thử từng lựa chọn
-        * Dùng tính chất đặc biệt của đáp án để giải nhanh
-      - Phù hợp khi thiếu thời gian hoặc muốn giải nhanh trong kỳ thi
-      - title: "Mẹo Dùng Đáp Án Cho Trước" hoặc "Giải Nhanh Bằng Cách Thử Đáp Án"
-      - Nếu không có multiple choice, có thể bỏ qua path này
-   
-   c) Path 3 - DESMOS/ĐỒ THỊ (approach_type: "desmos_first"):
-      - ƯU TIÊN tạo path này khi bài toán có thể được minh họa hoặc giải nhanh bằng đồ thị:
-        * Tìm nghiệm bằng cách vẽ đồ thị và đếm giao điểm
-        * So sánh giá trị bằng cách nhìn đồ thị
-        * Kiểm tra tính chất hàm số bằng hình ảnh
-        * Quan sát hình học trên hệ trục toạ độ
-      - Dùng Desmos để visualize, kiểm tra nhanh và/hoặc tìm đáp án trực quan.
-      - Phù hợp cho bài toán về hàm số, phương trình, bất phương trình, bất đẳng thức, hệ phương trình, hình học toạ độ,...
-      - title: "Giải Bằng Đồ Thị Desmos" hoặc "Phương Pháp Hình Ảnh".
-      - HÃY CỐ GẮNG sử dụng Desmos NHIỀU NHẤT CÓ THỂ khi nó đem lại:
-        * Trực quan tốt hơn cho học sinh
-        * Cách kiểm tra nhanh kết quả
-        * Cách loại trừ đáp án sai
-      - Nếu Desmos KHÔNG phù hợp hoặc KHÔNG giúp giải nhanh hơn, TUYỆT ĐỐI KHÔNG tạo path `desmos_first`.
-        Thay vào đó:
-        * KHÔNG sinh solution path với `approach_type = "desmos_first"`.
-        * Thêm một ghi chú ngắn gọn trong `summary.constraints` hoặc trong `planning.sat_tips` của path học thuật
-          để giải thích cho học sinh (bằng tiếng Việt) rằng:
-          "Với bài toán này, không nên dùng Desmos/đồ thị vì ... (lý do ngắn gọn)".
-   
-   Lưu ý:
-   - TỐI THIỂU phải có 1 path (Path 1 - Học thuật) - BẮT BUỘC
-   - Nên có 2-3 paths nếu bài toán phù hợp
-   - Mỗi path phải độc lập và có thể giải được bài toán
-   - Path học thuật luôn là nền tảng, các path khác là shortcuts
-
-QUAN TRỌNG VỀ CÔNG THỨC TOÁN HỌC (LaTeX) - PHẢI TUÂN THỦ CHẶT CHẼ:
-7. Tất cả công thức toán học PHẢI được viết bằng LaTeX syntax với cú pháp $...$ hoặc $$...$$.
-8. Sử dụng cú pháp LaTeX đúng:
-   - Inline math: $x^2 + 5x + 6 = 0$ (dùng $...$ cho công thức trong câu)
-   - Block math: $$\\frac{-b \\pm \\sqrt{b^2-4ac}}{2a}$$ (dùng $$...$$ cho công thức lớn, riêng dòng)
-   - Ví dụ: $f(x) = x^2 - 4x + 3$, $(x-1)(x-3) = 0$, $x = 1$ hoặc $x = 3$
-9. Trong formulas array, mỗi công thức phải là LaTeX string với $...$:
-   - ["$x^2 + 5x + 6 = 0$", "$(x+2)(x+3) = 0$", "$x = -2$ hoặc $x = -3$"]
-   - LUÔN wrap công thức bằng $...$ trong formulas array
-10. Trong description, derivation, intermediate_result, và các text fields:
-    - Nếu có công thức toán, BẮT BUỘC dùng $...$ để wrap
-    - Ví dụ: "Giải phương trình $x^2-4x+3=0$ bằng cách phân tích nhân tử"
-    - Ví dụ: "Kết quả: $x=1$ hoặc $x=3$"
-    - Ví dụ: "Thay $x=1$ vào: $f(1)=1-4+3=0$"
-11. Các ký tự đặc biệt trong LaTeX (dùng đúng syntax):
-    - Phân số: $\\frac{a}{b}$ hoặc $\\frac{-b \\pm \\sqrt{b^2-4ac}}{2a}$
-    - Căn bậc hai: $\\sqrt{x}$ hoặc $\\sqrt{x^2+1}$ hoặc $\\sqrt[3]{x}$
-    - Chỉ số trên/dưới: $x^2$, $x_1$, $a_{n}$
-    - Text trong math: $x = 1 \\text{ hoặc } x = 3$ (dùng \\text{})
-    - Dấu nhân: $\\times$ hoặc $\\cdot$
-    - Dấu chia: $\\div$ hoặc $/$
-12. LƯU Ý QUAN TRỌNG:
-    - KHÔNG được viết công thức không có $...$ wrap (ví dụ: x^2-4x+3=0 là SAI)
-    - PHẢI viết: $x^2-4x+3=0$ (có $...$ wrap)
-    - Trong JSON, backslashes sẽ được escape tự động, không cần lo lắng
-
-Desmos usage rules:
-12. Mục tiêu là TẬN DỤNG Desmos NHIỀU NHẤT CÓ THỂ khi phù hợp:
-    - ĐẶC BIỆT, nếu bài toán LIÊN QUAN ĐẾN HÀM SỐ / FUNCTION / GRAPH (các từ khoá như: "function", "f(x)", "g(x)",
-      "graph", "graph of", "rate of change", "slope", "in terms of x", "domain", "range"...), hoặc hình học toạ độ:
-      => BẮT BUỘC phải dùng Desmos ít nhất trong MỘT trong các vị trí sau:
-         * `solution_paths[i].desmos_overview`
-         * hoặc `solution_paths[i].steps[j].desmos`
-      để:
-      * Vẽ đồ thị minh hoạ
-      * Kiểm tra nhanh nghiệm
-      * Đếm giao điểm
-      * So sánh giá trị
-      * Loại trừ đáp án sai
-    - Với các bài toán không có hàm số/đồ thị nhưng vẫn có phương trình, bất phương trình, hệ phương trình,
-      hãy ƯU TIÊN dùng Desmos nếu đồ thị giúp trực quan/kiểm tra nghiệm nhanh.
-13. Khi dùng Desmos:
-    - Embed bằng các object DesmosConfig (ở cấp path.desmos_overview hoặc step.desmos).
-    - Luôn chỉ rõ expressions (LaTeX cho Desmos), ví dụ: ["y=x^2-4x", "y=0"].
-    - Luôn ghi rõ purpose: "visualize", "solve_equation", "count_intersections", "eliminate_choices", "verify_solution".
-14. Cố gắng để:
-    - Ít nhất một solution path có sử dụng Desmos (desmos_overview hoặc step.desmos) nếu bài toán có thể biểu diễn bằng đồ thị.
-    - Có thể dùng Desmos cả trong path học thuật (để kiểm tra/visualize) chứ không chỉ trong path `desmos_first`.
-    - Không ép dùng Desmos cho các bài toán thuần số học rất đơn giản nơi đồ thị không mang lại giá trị thêm.
-
-Solution quality rules:
-15. Clearly state constraints and common SAT traps (bằng tiếng Việt).
-16. Include verification steps for grid-in questions (bằng tiếng Việt).
-17. Prefer strategies that are fast, reliable, and SAT-friendly.
-18. Path prioritization:
-    - Path học thuật (algebraic/formula_based): Đánh dấu là recommended nếu bài toán phức tạp hoặc cần hiểu sâu
-    - Path trick (exam_trick): Đánh dấu là recommended nếu có đáp án cho trước và có thể giải nhanh
-    - Path Desmos (desmos_first): Đánh dấu là recommended nếu đồ thị giúp giải nhanh và trực quan
-    - Mặc định: Ưu tiên path nhanh nhất và an toàn nhất cho SAT
-19. Mỗi path phải có:
-    - title rõ ràng: "Phương Pháp Học Thuật", "Mẹo Dùng Đáp Án", "Giải Bằng Desmos", etc.
-    - pros/cons để học sinh biết khi nào nên dùng
-    - best_when để hướng dẫn áp dụng
-
-Bổ sung về trường localization (dịch đề & từ vựng):
-20. Trường `localization` trong SATMathSolutionOutput có cấu trúc:
-    - `simplified_vi` (string): Dịch/diễn giải lại đề bài sang tiếng Việt đơn giản, rõ ràng, giữ nguyên ý nghĩa toán học.
-      QUAN TRỌNG: Phần này CHỈ được phép diễn giải lại đề bài, KHÔNG được đưa bất kỳ bước giải, gợi ý giải,
-      nhận xét về chiến lược hay đáp án. Không được lộ lời giải ở đây.
-    - `vocab_notes` (array): Danh sách các từ/cụm từ TIẾNG ANH quan trọng trong đề, đặc biệt là thuật ngữ học thuật, từ vựng chuyên ngành, hoặc từ dễ gây hiểu nhầm.
-      Mỗi phần tử gồm:
-        * `term_en`: từ/cụm từ tiếng Anh gốc.
-        * `part_of_speech` (optional): loại từ (noun/verb/adj/phrase...).
-        * `definition_vi`: giải thích ý nghĩa bằng tiếng Việt, rõ ràng, dễ hiểu.
-        * `academic_register` (optional): mức độ học thuật/chuyên ngành (vd: academic, test term...).
-        * `example_en` (optional): một câu ví dụ tiếng Anh ngắn (nếu hữu ích).
-        * `note_vi` (optional): ghi chú thêm, lưu ý bẫy nghĩa cho học sinh Việt.
-21. Chỉ chọn các từ/cụm từ thực sự liên quan đến ngữ cảnh toán học/SAT, KHÔNG liệt kê toàn bộ từ vựng cơ bản.
-22. Toàn bộ nội dung trong `simplified_vi`, `definition_vi`, `note_vi` phải bằng TIẾNG VIỆT.
-
-Do NOT:
-- Explain your reasoning outside the schema.
-- Include raw chain-of-thought.
-- Include commentary or markdown.
-- Include URLs or external references.
-- Output bằng tiếng Anh (TẤT CẢ phải tiếng Việt).
-
-Your output must be directly parsable by a strict JSON validator.
-
-Ví dụ về format đúng:
-- description: "Tìm các điểm giao với trục hoành bằng cách giải phương trình $f(x)=0$"
-- formulas: ["$x^2-4x+3=0$", "$(x-1)(x-3)=0$"]
-- intermediate_result: "Hai nghiệm: $x=1$ và $x=3$"
-- derivation: "Giao với trục hoành nghĩa là $y=0$, nên giải $x^2-4x+3=0$"
-
-Ví dụ về 3 solution paths cho bài toán: "Tìm nghiệm của $x^2-4x+3=0$" (có đáp án: A) 1, B) 3, C) 1 và 3, D) -1):
-
-1. Path 1 (algebraic) - path_id: "path_academic":
-   - approach_type: "algebraic"
-   - title: "Phương Pháp Đại Số Chính Xác"
-   - planning: {
-       strategy: "Phân tích nhân tử phương trình bậc hai",
-       reasoning_flow: ["Phân tích $x^2-4x+3$", "Tìm hai số có tổng -4 và tích 3", "Áp dụng $(x-1)(x-3)=0$"]
-     }
-   - steps: [
-       {
-         description: "Phân tích nhân tử $x^2-4x+3$",
-         formulas: ["$x^2-4x+3=0$", "$(x-1)(x-3)=0$"],
-         derivation: "Tìm hai số có tổng $-4$ và tích $3$: $-1$ và $-3$"
-       }
-     ]
-   - conclusion: { final_answer: "$x=1$ hoặc $x=3$" }
-   - pros: "Chính xác, hiểu rõ bản chất toán học, áp dụng được mọi trường hợp"
-   - best_when: "Khi cần hiểu sâu hoặc bài toán phức tạp"
-
-2. Path 2 (exam_trick) - path_id: "path_trick":
-   - approach_type: "exam_trick"
-   - title: "Mẹo Thay Đáp Án Cho Trước"
-   - planning: {
-       strategy: "Thay từng đáp án vào phương trình để kiểm tra",
-       reasoning_flow: ["Thử $x=1$", "Thử $x=3$", "Loại các đáp án sai"]
-     }
-   - steps: [
-       {
-         description: "Thay $x=1$ vào phương trình",
-         formulas: ["$f(1)=1^2-4(1)+3=0$"],
-         derivation: "Thay trực tiếp để kiểm tra",
-         intermediate_result: "$f(1)=0$ ✓"
-       },
-       {
-         description: "Thay $x=3$ vào phương trình",
-         formulas: ["$f(3)=3^2-4(3)+3=0$"],
-         intermediate_result: "$f(3)=0$ ✓"
-       }
-     ]
-   - conclusion: { final_answer: "C) $x=1$ và $x=3$" }
-   - pros: "Nhanh, không cần tính toán phức tạp, phù hợp khi thiếu thời gian"
-   - best_when: "Khi có đáp án cho trước và muốn giải nhanh trong kỳ thi"
-
-3. Path 3 (desmos_first) - path_id: "path_desmos":
-   - approach_type: "desmos_first"
-   - title: "Giải Bằng Đồ Thị Desmos"
-   - desmos_overview: {
-       expressions: ["y=x^2-4x+3", "y=0"],
-       purpose: "count_intersections",
-       viewport: "x∈[-2,5], y∈[-2,5]"
-     }
-   - planning: {
-       strategy: "Vẽ đồ thị và đếm giao điểm với trục hoành",
-       reasoning_flow: ["Vẽ $y=x^2-4x+3$", "Vẽ $y=0$", "Đếm giao điểm"]
-     }
-   - steps: [
-       {
-         description: "Vẽ đồ thị $y=x^2-4x+3$ và đường thẳng $y=0$",
-         desmos: {
-           expressions: ["y=x^2-4x+3", "y=0"],
-           purpose: "count_intersections"
-         }
-       },
-       {
-         description: "Đếm giao điểm",
-         intermediate_result: "Có 2 giao điểm tại $x=1$ và $x=3$"
-       }
-     ]
-   - conclusion: { final_answer: "$x=1$ và $x=3$" }
-   - pros: "Trực quan, nhanh, dễ kiểm tra, phù hợp khi có máy tính"
-   - best_when: "Khi có máy tính và muốn giải nhanh bằng hình ảnh"
-"""
-    
-    # Build user message with text and/or image
-    user_content: List[Dict[str, Any]] = []
-    
-    # Add image if provided
-    if image_base64:
-        image_url = f"data:{image_mime_type or 'image/jpeg'};base64,{image_base64}"
-        user_content.append({
-            "type": "image_url",
-            "image_url": {
-                "url": image_url,
-                "detail": "high"  # High detail for math problems with diagrams
-            }
-        })
-    
-    # Add text prompt
-    if problem:
-        text_prompt = f"""Giải bài toán SAT sau:
-
-{problem}
 
-Trả về solution đầy đủ bằng JSON theo SATMathSolutionOutput schema. TẤT CẢ giải thích phải bằng TIẾNG VIỆT."""
-    else:
-        text_prompt = """Giải bài toán SAT trong hình ảnh trên.
+    answer_hint: Extra instruction fixing the expected answer (vote mode)
+    """
+    profile = profile or get_profile("full")
+    output_model = profile.output_model(SATMathSolutionOutput)
+    messages = _build_math_messages(
+        problem, image, _full_instruction(profile, answer_hint), output_model
+    )
 
-Trả về solution đầy đủ bằng JSON theo SATMathSolutionOutput schema. TẤT CẢ giải thích phải bằng TIẾNG VIỆT.
-Nếu hình ảnh chứa bài toán với hình vẽ, mô tả chi tiết các thông tin từ hình vẽ trong summary.givens."""
-    
-    user_content.append({
-        "type": "text",
-        "text": text_prompt
-    })
-    
     try:
-        response = await acompletion(
-            model='gpt-5.2',
-            reasoning_effort="medium",
-            messages=[
-                {"role": "developer", "content": system_prompt},
-                {"role": "user", "content": user_content}
-            ],
-            response_format=SATMathSolutionOutput  # Feed Pydantic model directly - LiteLLM will validate
+        solution = await _acompletion_structured(
+            client, messages, output_model, tiers, profile.completion_params()
         )
-        
-        # LiteLLM với Pydantic model sẽ tự động parse và validate
-        # Response có thể là string JSON hoặc đã được parse thành dict
-        content = response.choices[0].message.content
-        
-        # Nếu là string, parse JSON; nếu đã là dict, dùng trực tiếp
-        if isinstance(content, str):
-            solution_dict = json.loads(content)
-            solution = SATMathSolutionOutput(**solution_dict)
-        elif isinstance(content, dict):
-            solution = SATMathSolutionOutput(**content)
-        else:
-            # Nếu LiteLLM đã parse sẵn thành Pydantic model
-            solution = content
-        
-        return solution
-        
     except Exception as e:
-        print(f"Error calling LiteLLM (model: {os.getenv('LITELLM_MODEL', 'gpt-4')}): {e}")
+        print(f"Error calling LiteLLM (model: {tiers[-1].model}): {e}")
         raise
 
+    async def _regenerate(feedback: str) -> Any:
+        return await _acompletion_structured(
+            client, _feedback_messages(messages, solution, feedback), output_model,
+            _retry_tiers(tiers), profile.completion_params(),
+        )
+
+    return await _verified(
+        solution,
+        lambda result: get_verifier().verify_solution(profile.expand(SATMathSolutionOutput, result)),
+        _regenerate,
+        finish=lambda result: profile.expand(SATMathSolutionOutput, result),
+    )
+
+
+def _full_instruction(profile: ResponseProfile, answer_hint: Optional[str] = None) -> str:
+    instruction = profile.instruction(MATH_FULL_SOLUTION_INSTRUCTION)
+    return f"{instruction}\n\n{answer_hint}" if answer_hint else instruction
+
+
+def _retry_tiers(tiers: Sequence[ModelTier]) -> Sequence[ModelTier]:
+    """Regeneration after a failed check starts one tier up the routing chain."""
+    return tiers[1:] or tiers[-1:]
+
+
+def _feedback_messages(messages: List[Dict[str, Any]], previous: Any, feedback: str) -> List[Dict[str, Any]]:
+    return messages + [
+        {"role": "assistant", "content": previous.model_dump_json()},
+        {"role": "user", "content": feedback},
+    ]
+
+
+async def _verified(
+    result: Any,
+    verify: Callable[[Any], Awaitable[VerificationReport]],
+    regenerate: Callable[[str], Awaitable[Any]],
+    finish: Callable[[Any], Any] = lambda result: result,
+) -> Any:
+    """
+    Verify a math result; regenerate once (with the failed checks as
+    feedback) only when a check fails. The regenerated result replaces the
+    original only if it fails fewer checks.
+    """
+    if not verification_enabled():
+        return finish(result)
+    report = await verify(result)
+    if report.passed or not MATH_VERIFY_REGENERATE:
+        return finish(result)
+
+    verifier = get_verifier()
+    verifier.stats.regenerated += 1
+    print(f"Verification failed, regenerating: {[check.detail for check in report.failed]}")
+    try:
+        retry = await regenerate(build_verification_feedback(report))
+        retry_report = await verify(retry)
+    except Exception as e:
+        print(f"Regeneration after failed verification failed: {e}")
+        return finish(result)
+    if len(retry_report.failed) < len(report.failed):
+        if retry_report.passed:
+            verifier.stats.fixed += 1
+        return finish(retry)
+    return finish(result)
+
+
+async def _acompletion_structured(
+    client: LLMClient,
+    messages: List[Dict[str, Any]],
+    output_model: Type[Any],
+    tiers: Sequence[ModelTier],
+    params: Optional[Dict[str, Any]] = None,
+) -> Any:
+    """
+    Call the LLM with a pydantic response_format and return a validated
+    instance. Invalid output is repaired first (deterministically, then with
+    a targeted fix call); only if that fails is the request retried on the
+    next (stronger) tier of the routing chain. Output cut off at the token
+    limit is not repaired: the next tier has a larger reasoning allowance.
+
+    params: extra completion parameters (e.g. the profile's max_completion_tokens,
+    raised per tier by its reasoning allowance)
+    """
+    for attempt, tier in enumerate(tiers):
+        try:
+            try:
+                return await _acompletion_once(client, messages, output_model, tier, params)
+            except OutputValidationError as e:
+                return await _fix_with_llm(client, messages, tier, e)
+        except (ValidationError, json.JSONDecodeError, OutputValidationError, TruncatedOutputError) as e:
+            get_repair_stats().failed += 1
+            if attempt == len(tiers) - 1:
+                raise
+            print(
+                f"Invalid {output_model.__name__} from {tier.model} "
+                f"(effort: {tier.reasoning_effort}), escalating: {e}"
+            )
+            get_model_router().record_escalation()
+    raise ValueError("No model tier to call")
+
+
+def _check_truncated(
+    finish_reason: Optional[str], output_model: Type[Any], model: str, params: Dict[str, Any]
+) -> None:
+    if finish_reason == "length":
+        get_repair_stats().truncated += 1
+        raise TruncatedOutputError(
+            f"{output_model.__name__} from {model} hit the token limit "
+            f"(max_completion_tokens={params.get('max_completion_tokens')})"
+        )
+
+
+async def _acompletion_once(
+    client: LLMClient,
+    messages: List[Dict[str, Any]],
+    output_model: Type[Any],
+    tier: ModelTier,
+    params: Optional[Dict[str, Any]] = None,
+) -> Any:
+    """
+    One validated call on a tier. Slow calls are hedged and failing
+    deployments are skipped (see services/resilience.py).
+    """
+    tier_params = with_reasoning_budget(params, tier.reasoning_effort)
+
+    async def _call(model: str) -> Any:
+        started = time.perf_counter()
+        response = await client.acompletion(
+            model=model,
+            reasoning_effort=tier.reasoning_effort,
+            messages=messages,
+            response_format=output_model,  # Feed Pydantic model directly - LiteLLM will validate
+            **tier_params,
+        )
+
+        record_llm_call(model, time.perf_counter() - started, getattr(response, "usage", None))
+        _check_truncated(getattr(response.choices[0], "finish_reason", None), output_model, model, tier_params)
+
+        # Response có thể là string JSON, dict, hoặc đã được LiteLLM parse
+        # thành Pydantic model; lỗi nhỏ (enum, kiểu dữ liệu) được sửa tại chỗ
+        with stage("validate"):
+            return validate_or_repair(output_model, response.choices[0].message.content)
+
+    async with llm_call_slot():
+        return await get_hedged_executor().run(
+            tier.model, _call, effort=tier.reasoning_effort, kind=output_model.__name__
+        )
+
+
+async def _fix_with_llm(
+    client: LLMClient,
+    messages: List[Dict[str, Any]],
+    tier: ModelTier,
+    error: OutputValidationError,
+) -> Any:
+    """
+    Ask the model to fix only the failing JSON paths. Reuses the static
+    developer message so the call hits the provider prompt cache.
+    """
+    if not LLM_REPAIR_CALL_ENABLED:
+        raise error
+    print(f"Requesting targeted fix from {tier.model}: {error}")
+    fix_messages = [
+        messages[0],
+        {"role": "user", "content": build_fix_instruction(error)},
+    ]
+    response = await _acompletion_once(client, fix_messages, RepairResponse, tier)
+    return apply_fix(error, response)
+
 
 async def solve_sat_english_problem(
     problem: str,
+    client: Optional[LLMClient] = None,
+    profile: Optional[str] = None,
 ) -> SATEnglishSolutionOutput:
     """
     Generate SAT English solution using LLM
 
     Args:
         problem: The SAT English question text
+        client: Shared LLM client (injected by the app; process default otherwise)
+        profile: "full", "standard" or "quick"; defaults to RESPONSE_PROFILE env var
 
     Returns:
         SATEnglishSolutionOutput: Complete solution structure for SAT English
     """
-    system_prompt = """You are an expert SAT English & Reading tutor for the new Digital SAT.
-
-Your task is to solve SAT English questions and produce solutions that are:
-- Logically correct
-- Exactly grounded in the passage/evidence
-- Pedagogically clear for Vietnamese students
-- Strictly structured
-
-QUAN TRỌNG: Tất cả giải thích phải bằng TIẾNG VIỆT (nhưng vẫn có thể trích dẫn câu tiếng Anh gốc khi cần).
-
-You MUST output your response in valid JSON that conforms EXACTLY to the provided SATEnglishSolutionOutput schema.
-
-Hard rules:
-1. Follow the schema EXACTLY.
-   - Không thêm field mới.
-   - Không bỏ field bắt buộc.
-   - Không đổi tên field hoặc kiểu dữ liệu.
-2. KHÔNG được giải thích gì bên ngoài JSON output.
-3. Mọi lập luận/bước suy luận PHẢI nằm trong:
-   - summary (bằng tiếng Việt)
-   - planning (bằng tiếng Việt)
-   - solution_paths.steps (bằng tiếng Việt)
-   - answer_analysis / conclusion (bằng tiếng Việt)
-4. Luôn gắn lập luận với bằng chứng trong đoạn văn:
-   - Dùng `evidence_used` để trích các cụm từ/câu tiếng Anh gốc quan trọng.
-   - Giải thích rõ tại sao bằng chứng đó ủng hộ/loại trừ đáp án.
-
-Về chiến lược giải:
-5. summary.givens:
-   - Tóm tắt ngắn gọn các fact quan trọng được NÊU TRỰC TIẾP trong đoạn văn.
-   - Không phân tích suy luận ở đây, chỉ liệt kê thông tin đã cho.
-6. summary.assumptions:
-   - Nếu câu hỏi liên quan đến kết quả nghiên cứu, giả thuyết, quan điểm tác giả,... liệt kê các giả định/cơ sở xuất phát ban đầu.
-7. summary.goal:
-   - Diễn đạt lại câu hỏi gọn, rõ, đúng bản chất (VD: "Xác định mục đích chính của đoạn", "Chọn đáp án mô tả đúng nhất mối quan hệ giữa A và B",...).
-
-Về solution_paths:
-8. CHỈ TẠO 1 SOLUTION PATH duy nhất - phương pháp giải tốt nhất và rõ ràng nhất cho câu hỏi này.
-   - Không cần tạo nhiều paths hay các phương án loại đáp án bẫy.
-   - Chọn chiến lược phù hợp nhất với loại câu hỏi:
-     * keyword_first: cho câu hỏi main_idea, vocab_in_context
-     * logic_first: cho câu hỏi inference, weaken, strengthen, based_on_findings
-     * elimination_first: khi có thể loại trừ nhanh các đáp án sai
-9. Trong solution path:
-    - planning.strategy: mô tả ngắn gọn chiến lược tổng thể (TIẾNG VIỆT).
-    - planning.reasoning_flow: liệt kê từng bước suy nghĩ chính (TIẾNG VIỆT).
-
-Về steps:
-11. Mỗi EnglishSolutionStep:
-    - description: mô tả bước suy luận (TIẾNG VIỆT).
-    - derivation: giải thích tại sao bước đó hợp lý / tuân thủ logic SAT (TIẾNG VIỆT).
-    - evidence_used: danh sách các trích dẫn/cụm từ tiếng Anh gốc trong bài được dùng làm bằng chứng.
-    - required_knowledge: liệt kê kỹ năng SAT English cần dùng (ví dụ: inference, elimination, vocab in context,...).
-12. common_traps:
-    - Nếu có bẫy SAT điển hình (đáp án quá mạnh, trái nghĩa tinh vi, thêm thông tin ngoài bài,...) hãy ghi rõ bằng TIẾNG VIỆT.
-
-Về answer_analysis:
-13. Mỗi EnglishAnswerChoiceAnalysis:
-    - choice: "A"/"B"/"C"/"D".
-    - summary: tóm tắt ngắn nội dung đáp án (TIẾNG VIỆT).
-    - is_correct: true/false.
-    - error_type (nếu sai): phân loại lỗi chuẩn SAT (contradicts_text, unsupported_inference, irrelevant, too_strong, opposite_meaning).
-    - explanation: giải thích vì sao đúng/sai, có dẫn chứng cụ thể từ đoạn văn (TIẾNG VIỆT, có thể trích câu tiếng Anh).
-
-Về conclusion:
-14. EnglishConclusion:
-    - correct_choice: đáp án đúng.
-    - justification: tóm tắt ngắn (TIẾNG VIỆT) vì sao đáp án đó đúng, dựa trên bằng chứng quan trọng nhất.
-    - why_others_wrong: nếu có, liệt kê lý do chính vì sao các đáp án còn lại sai (TIẾNG VIỆT).
-
-Bổ sung về trường localization (dịch đề & từ vựng):
-15. Trường `localization` trong SATEnglishSolutionOutput có cấu trúc:
-    - `simplified_vi` (string): Dịch/diễn giải lại đề bài và đoạn văn (nếu có) sang tiếng Việt đơn giản, rõ ràng.
-      QUAN TRỌNG: Phần này CHỈ được phép diễn giải lại đề bài/đoạn văn, KHÔNG được đưa bất kỳ bước giải, gợi ý giải,
-      nhận xét về chiến lược hay đáp án. Không được lộ lời giải ở đây.
-    - `vocab_notes` (array): Danh sách các từ/cụm từ TIẾNG ANH quan trọng trong đề/đoạn văn, đặc biệt là:
-      * Thuật ngữ học thuật, từ vựng chuyên ngành
-      * Từ dễ gây hiểu nhầm cho học sinh Việt
-      * Từ khóa quan trọng trong câu hỏi
-      Mỗi phần tử gồm:
-        * `term_en`: từ/cụm từ tiếng Anh gốc.
-        * `term_vi`: từ/cụm từ tiếng Việt tương ứng (nếu có).
-        * `part_of_speech` (optional): loại từ (noun/verb/adj/phrase...).
-        * `definition_vi`: giải thích ý nghĩa bằng tiếng Việt, rõ ràng, dễ hiểu.
-        * `academic_register` (optional): mức độ học thuật/chuyên ngành (vd: academic, test term...).
-        * `example_en` (optional): một câu ví dụ tiếng Anh ngắn (nếu hữu ích).
-        * `note_vi` (optional): ghi chú thêm, lưu ý bẫy nghĩa cho học sinh Việt.
-16. Chỉ chọn các từ/cụm từ thực sự liên quan đến ngữ cảnh SAT English, KHÔNG liệt kê toàn bộ từ vựng cơ bản.
-17. Toàn bộ nội dung trong `simplified_vi`, `definition_vi`, `note_vi` phải bằng TIẾNG VIỆT.
-
-Chất lượng lời giải:
-18. Tuyệt đối không suy diễn ngoài thông tin trong đoạn văn (no outside knowledge).
-19. Không được dựa vào trực giác hoặc kiểu "cảm thấy hợp lý"; phải luôn có bằng chứng text.
-20. Giữ lời giải ngắn gọn, đúng trọng tâm, nhưng rõ ràng cho học sinh Việt Nam.
-
-Do NOT:
-- Explain your reasoning outside the schema.
-- Include raw chain-of-thought.
-- Include commentary or markdown.
-- Include URLs or external references.
-- Output bằng tiếng Anh (trừ những chỗ trích dẫn câu/cụm từ từ đoạn văn trong evidence_used).
-
-Your output must be directly parsable by a strict JSON validator.
-"""
+    client = client or get_llm_client()
+    response_profile = get_profile(profile)
+    tiers = get_model_router().route_english(problem)
+    cache = get_solution_cache()
+    cache_key = _english_cache_key(problem, tiers[0], response_profile)
 
-    user_content: List[Dict[str, Any]] = [
-        {
-            "type": "text",
-            "text": f"""Giải câu hỏi SAT English sau:
+    cached = await cache.get(cache_key)
+    if cached is not None:
+        return validate_json(SATEnglishSolutionOutput, cached)
 
-{problem}
+    store_target = _english_store_target(problem, tiers[0], response_profile)
 
-Trả về lời giải CHỈ dưới dạng JSON đúng theo schema SATEnglishSolutionOutput.
-Mọi giải thích, planning, steps, answer_analysis đều phải bằng TIẾNG VIỆT (ngoại trừ câu/cụm từ tiếng Anh được trích dẫn từ bài).""",
-        }
-    ]
+    async def _generate() -> SATEnglishSolutionOutput:
+        solution = await _load_stored(store_target, SATEnglishSolutionOutput)
+        if solution is None:
+            with track_usage() as usage:
+                solution = await _solve_english_with_litellm(client, tiers, problem, response_profile)
+            await record_solution(store_target.record(solution, usage))
+        await cache.set(cache_key, solution.model_dump_json())
+        return solution
+
+    return await get_single_flight().do(cache_key, _generate, _cache_loader(cache, cache_key, SATEnglishSolutionOutput))
+
+
+async def _solve_english_with_litellm(
+    client: LLMClient,
+    tiers: Sequence[ModelTier],
+    problem: str,
+    profile: Optional[ResponseProfile] = None,
+) -> SATEnglishSolutionOutput:
+    """
+    Solve SAT English question using LiteLLM
+    """
+    profile = profile or get_profile("full")
+    output_model = profile.output_model(SATEnglishSolutionOutput)
+    messages = _build_english_messages(
+        problem, profile.instruction(ENGLISH_SOLUTION_INSTRUCTION), output_model
+    )
 
     try:
-        response = await acompletion(
-            model="gpt-5.2",
-            reasoning_effort="medium",
-            messages=[
-                {"role": "developer", "content": system_prompt},
-                {"role": "user", "content": user_content},
-            ],
-            response_format=SATEnglishSolutionOutput,
+        solution = await _acompletion_structured(
+            client, messages, output_model, tiers, profile.completion_params()
         )
+        return profile.expand(SATEnglishSolutionOutput, solution)
 
-        content = response.choices[0].message.content
+    except Exception as e:
+        print(
+            f"Error calling LiteLLM for SAT English (model: {tiers[-1].model}): {e}"
+        )
+        raise
 
-        if isinstance(content, str):
-            solution_dict = json.loads(content)
-            solution = SATEnglishSolutionOutput(**solution_dict)
-        elif isinstance(content, dict):
-            solution = SATEnglishSolutionOutput(**content)
-        else:
-            solution = content
 
-        return solution
+# ==================================================
+# PIPELINE MODE (analysis -> concurrent paths)
+# ==================================================
+
+PIPELINE_ANALYSIS_INSTRUCTION = """GIAI ĐOẠN 1 - PHÂN TÍCH (chưa viết lời giải chi tiết).
+Trả về JSON theo schema SATMathAnalysis gồm:
+- sat_meta, summary, answer_spec (xác định đáp án đúng, correct_choice nếu là trắc nghiệm)
+- planned_paths: các hướng giải sẽ được viết chi tiết ở bước sau, theo thứ tự ưu tiên và quy tắc chọn path ở trên
+  (path_id, approach_type, title, focus ngắn gọn). KHÔNG viết các bước giải ở đây.
+- recommended_path_id: path_id của hướng giải được khuyến nghị.
+TẤT CẢ nội dung phải bằng TIẾNG VIỆT."""
+
+PIPELINE_PATH_INSTRUCTION = """GIAI ĐOẠN 2 - VIẾT CHI TIẾT MỘT HƯỚNG GIẢI.
+Phân tích đã thống nhất (JSON):
+{analysis}
+
+Chỉ viết DUY NHẤT hướng giải sau, trả về JSON theo schema SolutionPath:
+- path_id: "{path_id}"
+- approach_type: "{approach_type}"
+- title: "{title}"
+- ý chính: {focus}
+Kết luận (conclusion.final_answer) phải khớp với answer_spec ở trên. TẤT CẢ giải thích phải bằng TIẾNG VIỆT."""
+
+PIPELINE_LOCALIZATION_INSTRUCTION = """Chỉ trả về trường localization của đề bài, JSON theo schema ProblemLocalization
+(simplified_vi và vocab_notes theo quy tắc ở trên). KHÔNG đưa bất kỳ bước giải hay đáp án nào."""
 
+
+def _math_solve_mode(mode: Optional[str] = None) -> str:
+    return mode or os.getenv("MATH_SOLVE_MODE", "single")
+
+
+async def _tagged(tag: str, coro: Any) -> Tuple[str, Any, Optional[BaseException]]:
+    try:
+        return tag, await coro, None
     except Exception as e:
-        print(
-            f"Error calling LiteLLM for SAT English (model: {os.getenv('LITELLM_MODEL', 'gpt-4')}): {e}"
+        return tag, None, e
+
+
+async def _pipeline_analysis(
+    client: LLMClient,
+    tiers: Sequence[ModelTier],
+    problem: Optional[str] = None,
+    image: Optional[PreparedImage] = None,
+) -> SATMathAnalysis:
+    analysis: SATMathAnalysis = await _acompletion_structured(
+        client,
+        _build_math_messages(
+            problem, image, PIPELINE_ANALYSIS_INSTRUCTION, SATMathAnalysis
+        ),
+        SATMathAnalysis,
+        tiers,
+    )
+    if not analysis.planned_paths:
+        raise ValueError("Pipeline analysis returned no planned solution paths")
+    return analysis
+
+
+def _path_tiers(analysis: SATMathAnalysis, tiers: Sequence[ModelTier]) -> Sequence[ModelTier]:
+    """Path calls use the tier of the difficulty_band the analysis reports."""
+    if analysis.sat_meta.difficulty_band:
+        return get_model_router().chain(analysis.sat_meta.difficulty_band)
+    return tiers
+
+
+async def _generate_planned_path(
+    client: LLMClient,
+    tiers: Sequence[ModelTier],
+    problem: Optional[str],
+    image: Optional[PreparedImage],
+    analysis: SATMathAnalysis,
+    plan: PlannedPath,
+    profile: ResponseProfile,
+) -> SolutionPath:
+    """Write one planned path in detail, consistent with the shared analysis."""
+    analysis_json = analysis.model_dump_json(include={"sat_meta", "summary", "answer_spec"})
+    instruction = profile.instruction(PIPELINE_PATH_INSTRUCTION.format(
+        analysis=analysis_json,
+        path_id=plan.path_id,
+        approach_type=plan.approach_type,
+        title=plan.title,
+        focus=plan.focus or "-",
+    ), paths=False)
+    path_model = profile.output_model(SolutionPath)
+    messages = _build_math_messages(problem, image, instruction, path_model)
+    result = await _acompletion_structured(
+        client, messages, path_model, tiers, profile.completion_params()
+    )
+
+    def _finish(path: Any) -> SolutionPath:
+        # Giữ đúng id/approach đã lên kế hoạch để recommended_path_id khớp
+        return profile.expand(SolutionPath, path).model_copy(update={
+            "path_id": plan.path_id,
+            "approach_type": plan.approach_type,
+        })
+
+    async def _regenerate(feedback: str) -> Any:
+        return await _acompletion_structured(
+            client, _feedback_messages(messages, result, feedback), path_model,
+            _retry_tiers(tiers), profile.completion_params(),
+        )
+
+    # Chỉ path có check lỗi mới bị sinh lại, các path khác giữ nguyên
+    return await _verified(
+        result,
+        lambda path: get_verifier().verify_path(_finish(path), analysis.answer_spec),
+        _regenerate,
+        finish=_finish,
+    )
+
+
+async def _pipeline_events(
+    client: LLMClient,
+    tiers: Sequence[ModelTier],
+    problem: Optional[str] = None,
+    image: Optional[PreparedImage] = None,
+    profile: Optional[ResponseProfile] = None,
+    solution_id: Optional[str] = None,
+) -> AsyncIterator[StreamEvent]:
+    """
+    Pipeline mode: one fast analysis call, then every SolutionPath and the
+    ProblemLocalization are generated concurrently. The response profile caps
+    the planned paths, slims each path call and may skip localization.
+
+    Yields the analysis fields first, then ("localization", ...) and
+    ("solution_path", {"index", "path"}) in completion order, and finally
+    ("solution", SATMathSolutionOutput) with paths in planned order.
+
+    With solution_id (lazy mode) only the recommended path is generated; the
+    other planned paths are returned as pending_paths stubs and generated on
+    demand by solve_pending_path. The final event is a SATMathLazySolution.
+
+    The analysis runs on the heuristically routed tiers; path calls use the
+    tier of the difficulty_band the analysis reports.
+    """
+    router = get_model_router()
+    profile = profile or get_profile("full")
+    analysis = await _pipeline_analysis(client, tiers, problem, image)
+    planned_paths = analysis.planned_paths[:profile.max_paths or None]
+
+    analysis_dict = analysis.model_dump(mode="json")
+    for key in ("sat_meta", "summary", "answer_spec", "recommended_path_id"):
+        yield (key, analysis_dict[key])
+
+    path_tiers = _path_tiers(analysis, tiers)
+
+    pending_paths: List[PlannedPath] = []
+    if solution_id is not None:
+        recommended = next(
+            (plan for plan in planned_paths if plan.path_id == analysis.recommended_path_id),
+            planned_paths[0],
+        )
+        pending_paths = [plan for plan in planned_paths if plan is not recommended]
+        planned_paths = [recommended]
+        await _save_lazy_context(solution_id, problem, image, analysis, tiers, profile)
+        yield ("solution_id", solution_id)
+        yield ("pending_paths", [plan.model_dump(mode="json") for plan in pending_paths])
+
+    tasks: List["asyncio.Task[Any]"] = []
+    if profile.keeps(SATMathSolutionOutput, "localization"):
+        tasks.append(asyncio.ensure_future(_tagged(
+            "localization",
+            _acompletion_structured(
+                client,
+                _build_math_messages(
+                    problem, image, PIPELINE_LOCALIZATION_INSTRUCTION, ProblemLocalization
+                ),
+                ProblemLocalization,
+                # Chỉ là diễn giải đề bài: tier nhẹ nhất là đủ
+                router.chain("easy"),
+            ),
+        )))
+    for index, plan in enumerate(planned_paths):
+        tasks.append(asyncio.ensure_future(_tagged(
+            f"path:{index}",
+            _generate_planned_path(client, path_tiers, problem, image, analysis, plan, profile),
+        )))
+
+    localization: Optional[ProblemLocalization] = None
+    paths: Dict[int, SolutionPath] = {}
+
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            tag, result, error = await next_done
+            if error is not None:
+                # Một path lỗi không làm hỏng cả lời giải
+                print(f"Pipeline stage {tag} failed (model: {path_tiers[-1].model}): {error}")
+                continue
+            if tag == "localization":
+                localization = result
+                yield ("localization", result.model_dump(mode="json"))
+                continue
+
+            index = int(tag.split(":", 1)[1])
+            paths[index] = result
+            yield ("solution_path", {"index": index, "path": result.model_dump(mode="json")})
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+    if not paths:
+        raise ValueError("Pipeline failed to generate any solution path")
+
+    ordered_paths = [paths[index] for index in sorted(paths)]
+    recommended_path_id = analysis.recommended_path_id
+    if recommended_path_id not in {path.path_id for path in ordered_paths}:
+        recommended_path_id = ordered_paths[0].path_id
+
+    if solution_id is not None:
+        await get_solution_cache().set(
+            _lazy_path_key(solution_id, ordered_paths[0].path_id),
+            ordered_paths[0].model_dump_json(),
+        )
+        yield ("solution", SATMathLazySolution(
+            sat_meta=analysis.sat_meta,
+            summary=analysis.summary,
+            answer_spec=analysis.answer_spec,
+            solution_paths=ordered_paths,
+            recommended_path_id=recommended_path_id,
+            localization=localization,
+            solution_id=solution_id,
+            pending_paths=pending_paths,
+        ))
+        return
+
+    yield ("solution", SATMathSolutionOutput(
+        sat_meta=analysis.sat_meta,
+        summary=analysis.summary,
+        answer_spec=analysis.answer_spec,
+        solution_paths=ordered_paths,
+        recommended_path_id=recommended_path_id,
+        localization=localization,
+    ))
+
+
+async def _solve_with_pipeline(
+    client: LLMClient,
+    tiers: Sequence[ModelTier],
+    problem: Optional[str] = None,
+    image: Optional[PreparedImage] = None,
+    profile: Optional[ResponseProfile] = None,
+    solution_id: Optional[str] = None,
+) -> SATMathSolutionOutput:
+    """
+    Run pipeline mode to completion. Wall-clock latency is roughly
+    analysis + max(path) instead of the sum of all paths.
+    """
+    try:
+        async for event, data in _pipeline_events(
+            client, tiers, problem, image, profile, solution_id
+        ):
+            if event == "solution":
+                return data
+    except Exception as e:
+        print(f"Error in pipeline solve (model: {tiers[0].model}): {e}")
+        raise
+    raise ValueError("Pipeline finished without a solution")
+
+
+# ==================================================
+# VOTE MODE (self-consistency: answer-only samples, then one full solution)
+# ==================================================
+
+MATH_ANSWER_ONLY_INSTRUCTION = """Chỉ trả về đáp án cuối cùng, JSON theo schema SATMathAnswerSample.
+Giải cẩn thận nhưng KHÔNG viết lời giải, các bước hay giải thích.
+Trắc nghiệm: correct_choice là chữ cái (A-D) của lựa chọn đúng; grid-in: final_answer là giá trị nhập vào ô."""
+
+VOTE_ANSWER_HINT = """Đáp án đã được xác định qua nhiều lần giải độc lập: {answer}.
+Viết lời giải đầy đủ dẫn tới đúng đáp án này. Nếu khi giải chi tiết thấy đáp án này sai, trình bày đáp án đúng."""
+
+
+def _vote_answer_text(sample: SATMathAnswerSample) -> str:
+    if not sample.correct_choice:
+        return sample.final_answer
+    answer = (sample.final_answer or "").strip()
+    if answer.startswith(sample.correct_choice) and answer[1:2] in (")", ".", ":"):
+        # "B) 12" đã có cả chữ cái và giá trị
+        return f"lựa chọn {answer}"
+    if answer and answer != sample.correct_choice:
+        return f"lựa chọn {sample.correct_choice} ({answer})"
+    return f"lựa chọn {sample.correct_choice}"
+
+
+def _solution_vote_key(solution: SATMathSolutionOutput) -> Optional[str]:
+    """What the full solution's recommended path would have voted for."""
+    paths = solution.solution_paths
+    path = next((p for p in paths if p.path_id == solution.recommended_path_id), paths[0] if paths else None)
+    if path is None:
+        return None
+    return vote_key(SATMathAnswerSample(
+        question_type=solution.sat_meta.question_type,
+        final_answer=path.conclusion.final_answer,
+        correct_choice=solution.answer_spec.correct_choice,
+    ))
+
+
+async def _vote(
+    client: LLMClient,
+    tiers: Sequence[ModelTier],
+    problem: Optional[str] = None,
+    image: Optional[PreparedImage] = None,
+) -> Optional[Tuple[str, SATMathAnswerSample]]:
+    """
+    Run MATH_VOTE_SAMPLES answer-only samples concurrently and tally them as
+    they finish; the remaining samples are cancelled once MATH_VOTE_QUORUM
+    agree. Without a quorum the plurality answer wins. Returns (vote key,
+    first sample with that answer), or None when no sample answered.
+    """
+    stats = get_vote_stats()
+    samples = vote_samples()
+    ballot = Ballot(vote_quorum(samples))
+    messages = _build_math_messages(problem, image, MATH_ANSWER_ONLY_INSTRUCTION, SATMathAnswerSample)
+    tasks = [
+        asyncio.ensure_future(
+            _acompletion_structured(client, messages, SATMathAnswerSample, tiers, vote_params())
+        )
+        for _ in range(samples)
+    ]
+    stats.votes += 1
+    stats.samples += samples
+    quorum_reached = False
+    try:
+        with stage("vote"):
+            for next_sample in asyncio.as_completed(tasks):
+                try:
+                    sample = await next_sample
+                except Exception as e:
+                    stats.samples_failed += 1
+                    print(f"Vote sample failed (model: {tiers[0].model}): {e}")
+                    continue
+                # answer_value dùng SymPy (import/parse chậm): chạy ngoài event loop
+                if ballot.add(await asyncio.to_thread(vote_key, sample), sample):
+                    quorum_reached = True
+                    break
+    finally:
+        # Đủ quorum: hủy các mẫu còn lại thay vì chờ mẫu chậm nhất
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        stats.samples_cancelled += len(pending)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    winner = ballot.winner()
+    if winner is None:
+        return None
+    if quorum_reached and pending:
+        stats.early_stops += 1
+    elif not quorum_reached:
+        stats.no_quorum += 1
+    record_agreement(ballot.counts[winner], ballot.votes)
+    return winner, ballot.samples[winner]
+
+
+async def _vote_hint(
+    client: LLMClient,
+    tiers: Sequence[ModelTier],
+    problem: Optional[str] = None,
+    image: Optional[PreparedImage] = None,
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    (vote key, answer hint) for the full solution; (None, None) when the
+    problem's band is not voted on or no sample answered (single mode).
+    """
+    stats = get_vote_stats()
+    if tiers[0].band not in vote_bands():
+        stats.skipped_band += 1
+        return None, None
+    voted = await _vote(client, tiers, problem, image)
+    if voted is None:
+        stats.fallbacks += 1
+        return None, None
+    key, sample = voted
+    return key, VOTE_ANSWER_HINT.format(answer=_vote_answer_text(sample))
+
+
+async def _solve_with_vote(
+    client: LLMClient,
+    tiers: Sequence[ModelTier],
+    problem: Optional[str] = None,
+    image: Optional[PreparedImage] = None,
+    profile: Optional[ResponseProfile] = None,
+) -> SATMathSolutionOutput:
+    """
+    Vote on the answer with cheap concurrent samples, then generate the full
+    solution once for the winning answer (verified like single mode).
+    """
+    key, hint = await _vote_hint(client, tiers, problem, image)
+    solution = await _solve_with_litellm(client, tiers, problem, image, profile, hint)
+    if key is not None and await asyncio.to_thread(_solution_vote_key, solution) != key:
+        get_vote_stats().answer_mismatches += 1
+        print(f"Vote mode: full solution disagrees with the voted answer ({key})")
+    return solution
+
+
+# ==================================================
+# LAZY MODE (recommended path first, others on demand)
+# ==================================================
+
+
+class SolutionNotFoundError(LookupError):
+    """Unknown/expired solution_id or path_id for on-demand path expansion."""
+
+
+def _lazy_solution_id(cache_key: str) -> str:
+    # Cùng đề bài (và tier/profile) luôn cho cùng solution_id
+    return cache_key.rsplit(":", 1)[1]
+
+
+def _lazy_context_key(solution_id: str) -> str:
+    return f"math_lazy_ctx:{solution_id}"
+
+
+def _lazy_path_key(solution_id: str, path_id: str) -> str:
+    return f"math_lazy_path:{solution_id}:{path_id}"
+
+
+async def _save_lazy_context(
+    solution_id: str,
+    problem: Optional[str],
+    image: Optional[PreparedImage],
+    analysis: SATMathAnalysis,
+    tiers: Sequence[ModelTier],
+    profile: ResponseProfile,
+) -> None:
+    """
+    Keep what is needed to generate a pending path later (problem, the
+    already preprocessed image, the analysis) in the solution cache.
+    """
+    context = {
+        "problem": problem,
+        "image": None if image is None else {
+            "data": base64.b64encode(image.data).decode("ascii"),
+            "mime_type": image.mime_type,
+            "detail": image.detail,
+            "fingerprint": image.fingerprint,
+            "perceptual_hash": image.perceptual_hash,
+        },
+        "analysis": analysis.model_dump(mode="json"),
+        "band": tiers[0].band,
+        "profile": profile.name,
+    }
+    await get_solution_cache().set(_lazy_context_key(solution_id), json.dumps(context, ensure_ascii=False))
+
+
+async def solve_pending_path(
+    solution_id: str,
+    path_id: str,
+    client: Optional[LLMClient] = None,
+) -> SolutionPath:
+    """
+    Generate (or return cached) one path of a lazy solution when the user
+    expands it.
+
+    Raises:
+        SolutionNotFoundError: solution_id unknown/expired or path_id not planned
+    """
+    cache = get_solution_cache()
+    path_key = _lazy_path_key(solution_id, path_id)
+    cached = await cache.get(path_key)
+    if cached is not None:
+        return validate_json(SolutionPath, cached)
+
+    raw_context = await cache.get(_lazy_context_key(solution_id))
+    if raw_context is None:
+        raise SolutionNotFoundError(f"Solution {solution_id} not found or expired")
+    context = json.loads(raw_context)
+    analysis = SATMathAnalysis.model_validate(context["analysis"])
+    plan = next((plan for plan in analysis.planned_paths if plan.path_id == path_id), None)
+    if plan is None:
+        raise SolutionNotFoundError(f"Path {path_id} is not part of solution {solution_id}")
+
+    image: Optional[PreparedImage] = None
+    if context["image"] is not None:
+        image = PreparedImage(
+            data=base64.b64decode(context["image"]["data"]),
+            mime_type=context["image"]["mime_type"],
+            detail=context["image"]["detail"],
+            fingerprint=context["image"]["fingerprint"],
+            perceptual_hash=context["image"].get("perceptual_hash"),
         )
+    tiers = _path_tiers(analysis, get_model_router().chain(context["band"]))
+
+    async def _generate() -> SolutionPath:
+        path = await _generate_planned_path(
+            client or get_llm_client(),
+            tiers,
+            context["problem"],
+            image,
+            analysis,
+            plan,
+            get_profile(context["profile"]),
+        )
+        await cache.set(path_key, path.model_dump_json())
+        return path
+
+    # Nhiều lần bấm "mở rộng" cùng lúc chỉ sinh path một lần
+    return await get_single_flight().do(path_key, _generate, _cache_loader(cache, path_key, SolutionPath))
+
+
+# ==================================================
+# STREAMING (Server-Sent Events)
+# ==================================================
+
+
+def _events_from_solution(solution_dict: Dict[str, Any]) -> List[StreamEvent]:
+    """
+    Replay a complete solution as the same event sequence a live stream produces.
+    """
+    events: List[StreamEvent] = []
+    for key, value in solution_dict.items():
+        if key == "solution_paths":
+            continue
+        events.append((key, value))
+    for index, path in enumerate(solution_dict.get("solution_paths") or []):
+        events.append(("solution_path", {"index": index, "path": path}))
+    return events
+
+
+async def _litellm_stream_events(
+    client: LLMClient,
+    tiers: Sequence[ModelTier],
+    messages: List[Dict[str, Any]],
+    output_model: Type[Any],
+    params: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[StreamEvent]:
+    """
+    Single streamed call on the first tier; ends with ("solution",
+    <validated output_model>). If the streamed output fails validation, the
+    solution comes from a non-streamed call on the stronger tiers.
+    """
+    parser = IncrementalJSONParser(array_fields=("solution_paths",))
+    tier = tiers[0]
+
+    try:
+        started = time.perf_counter()
+        ttft: Optional[float] = None
+        parse_seconds = 0.0
+        usage = None
+        finish_reason = None
+        tier_params = with_reasoning_budget(params, tier.reasoning_effort)
+        executor = get_hedged_executor()
+
+        async def _open(model: str) -> Any:
+            return await client.acompletion(
+                model=model,
+                reasoning_effort=tier.reasoning_effort,
+                messages=messages,
+                response_format=output_model,
+                stream=True,
+                stream_options={"include_usage": True},
+                **tier_params,
+            )
+
+        async with llm_call_slot():
+            # Cùng circuit breaker / deployment dự phòng với lời gọi không stream
+            deployment, response = await executor.open_stream(tier.model, _open)
+            try:
+                async for chunk in response:
+                    usage = getattr(chunk, "usage", None) or usage
+                    if not chunk.choices:
+                        continue
+                    finish_reason = getattr(chunk.choices[0], "finish_reason", None) or finish_reason
+                    delta = chunk.choices[0].delta.content
+                    if delta and ttft is None:
+                        ttft = time.perf_counter() - started
+                    parse_started = time.perf_counter()
+                    events = parser.feed(delta or "")
+                    parse_seconds += time.perf_counter() - parse_started
+                    for kind, payload in events:
+                        if kind == "item":
+                            yield ("solution_path", {"index": payload["index"], "path": payload["value"]})
+                        else:
+                            yield (payload["name"], payload["value"])
+            except BaseException as e:
+                executor.stream_finished(deployment, e)
+                raise
+            executor.stream_finished(deployment)
+        # Thời gian upstream bao gồm cả lúc client đọc chậm các event ở giữa
+        record_llm_call(deployment, time.perf_counter() - started, usage, ttft)
+        record_stage("stream_parse", parse_seconds)
+
+        try:
+            try:
+                _check_truncated(finish_reason, output_model, tier.model, tier_params)
+                with stage("validate"):
+                    solution = validate_or_repair(output_model, parser.text)
+            except OutputValidationError as e:
+                solution = await _fix_with_llm(client, messages, tier, e)
+        except (ValidationError, json.JSONDecodeError, OutputValidationError, TruncatedOutputError) as e:
+            get_repair_stats().failed += 1
+            if len(tiers) == 1:
+                raise
+            print(f"Invalid streamed {output_model.__name__} from {tier.model}, escalating: {e}")
+            get_model_router().record_escalation()
+            solution = await _acompletion_structured(client, messages, output_model, tiers[1:], params)
+    except Exception as e:
+        print(f"Error streaming from LiteLLM (model: {tier.model}): {e}")
         raise
+
+    yield ("solution", solution)
+
+
+async def _profiled_events(
+    source: AsyncIterator[StreamEvent],
+    profile: ResponseProfile,
+    output_model: Type[Any],
+    path_model: Type[Any],
+) -> AsyncIterator[StreamEvent]:
+    """
+    Bring events of a slim-profile stream to the full shape: paths beyond the
+    cap are dropped, paths and the final solution get the dropped fields back.
+    """
+    async for event, data in source:
+        if event == "solution_path":
+            if profile.max_paths and data["index"] >= profile.max_paths:
+                continue
+            data = {"index": data["index"], "path": profile.fill(path_model, data["path"])}
+        elif event == "solution":
+            data = profile.expand(output_model, data)
+        yield (event, data)
+
+
+async def _stream_verified(solution: Any, verify: bool) -> bool:
+    if not verify or not verification_enabled():
+        return True
+    report = await get_verifier().verify_solution(solution)
+    if not report.passed:
+        print(f"Streamed solution failed verification, not cached: {[check.detail for check in report.failed]}")
+    return report.passed
+
+
+async def _stream_cached(
+    source: AsyncIterator[StreamEvent],
+    output_model: Type[Any],
+    cache_key: str,
+    store_target: Optional[_StoreTarget] = None,
+    verify: bool = False,
+) -> AsyncIterator[StreamEvent]:
+    """
+    Serve from cache (or the solution store / local fast path) when possible, otherwise forward
+    events from source, cache the final solution and record it in the store.
+    The final event payload is JSON-serializable.
+
+    verify: run the SymPy checks on the final SATMathSolutionOutput first; it
+    has already been sent, so a failing solution is only kept out of the
+    cache and the store (the next /solve generates and verifies its own).
+    """
+    cache = get_solution_cache()
+
+    cached = await cache.get(cache_key)
+    solution = validate_json(output_model, cached) if cached is not None else None
+    if solution is None and store_target is not None:
+        solution = await _load_known(store_target, output_model)
+        if solution is not None:
+            await cache.set(cache_key, solution.model_dump_json())
+    if solution is not None:
+        solution_dict = solution.model_dump(mode="json")
+        for event in _events_from_solution(solution_dict):
+            yield event
+        yield ("solution", solution_dict)
+        return
+
+    with track_usage() as usage:
+        async for event, data in source:
+            if event == "solution":
+                if await _stream_verified(data, verify):
+                    await cache.set(cache_key, data.model_dump_json())
+                    if store_target is not None:
+                        await record_solution(store_target.record(data, usage))
+                yield ("solution", data.model_dump(mode="json"))
+            else:
+                yield (event, data)
+
+
+def _single_events(
+    client: LLMClient,
+    tiers: Sequence[ModelTier],
+    problem: Optional[str],
+    image: Optional[PreparedImage],
+    profile: ResponseProfile,
+    answer_hint: Optional[str] = None,
+) -> AsyncIterator[StreamEvent]:
+    slim_model = profile.output_model(SATMathSolutionOutput)
+    return _profiled_events(
+        _litellm_stream_events(
+            client,
+            tiers,
+            _build_math_messages(problem, image, _full_instruction(profile, answer_hint), slim_model),
+            slim_model,
+            profile.completion_params(),
+        ),
+        profile,
+        SATMathSolutionOutput,
+        SolutionPath,
+    )
+
+
+async def _vote_events(
+    client: LLMClient,
+    tiers: Sequence[ModelTier],
+    problem: Optional[str],
+    image: Optional[PreparedImage],
+    profile: ResponseProfile,
+) -> AsyncIterator[StreamEvent]:
+    """Vote first (no events while sampling), then stream the full solution for the winner."""
+    _, hint = await _vote_hint(client, tiers, problem, image)
+    async for event in _single_events(client, tiers, problem, image, profile, hint):
+        yield event
+
+
+async def stream_sat_problem(
+    problem: Optional[str] = None,
+    image_base64: Optional[str] = None,
+    image_mime_type: Optional[str] = None,
+    mode: Optional[str] = None,
+    image_bytes: Optional[bytes] = None,
+    client: Optional[LLMClient] = None,
+    profile: Optional[str] = None,
+) -> AsyncIterator[StreamEvent]:
+    """
+    Stream a SAT Math solution as events.
+
+    Yields ("sat_meta" | "summary" | "answer_spec" | "localization" |
+    "recommended_path_id", value) as soon as each field is complete,
+    ("solution_path", {"index", "path"}) for every finished path, and finally
+    ("solution", <validated SATMathSolutionOutput>). Lazy mode also yields
+    "solution_id" and "pending_paths".
+    """
+    client = client or get_llm_client()
+    response_profile = get_profile(profile)
+    mode = _math_solve_mode(mode)
+    image = await _prepare_image(image_base64, image_mime_type, image_bytes)
+    tiers = get_model_router().route_math(problem, image)
+    output_model: Type[Any] = SATMathSolutionOutput
+    cache_key = _math_cache_key(problem, image, tiers[0], response_profile)
+    store_target: Optional[_StoreTarget] = _math_store_target(problem, image, tiers[0], response_profile)
+    if mode == "lazy":
+        # Lời giải lazy chưa đủ các hướng giải: không lưu vào store
+        output_model = SATMathLazySolution
+        store_target = None
+        cache_key = _math_cache_key(problem, image, tiers[0], response_profile, kind="math_lazy")
+        source = _pipeline_events(
+            client, tiers, problem, image, response_profile, _lazy_solution_id(cache_key)
+        )
+    elif mode == "pipeline":
+        source = _pipeline_events(client, tiers, problem, image, response_profile)
+    elif mode == "vote":
+        source = _vote_events(client, tiers, problem, image, response_profile)
+    else:
+        source = _single_events(client, tiers, problem, image, response_profile)
+
+    # Path của pipeline/lazy đã được kiểm tra (và sinh lại) trong _generate_planned_path
+    async for event in _stream_cached(
+        source, output_model, cache_key, store_target, verify=mode not in ("pipeline", "lazy")
+    ):
+        yield event
+
+
+async def stream_sat_english_problem(
+    problem: str,
+    client: Optional[LLMClient] = None,
+    profile: Optional[str] = None,
+) -> AsyncIterator[StreamEvent]:
+    """
+    Stream a SAT English solution as events (same event shape as stream_sat_problem).
+    """
+    response_profile = get_profile(profile)
+    tiers = get_model_router().route_english(problem)
+    output_model = response_profile.output_model(SATEnglishSolutionOutput)
+    source = _profiled_events(
+        _litellm_stream_events(
+            client or get_llm_client(),
+            tiers,
+            _build_english_messages(
+                problem,
+                response_profile.instruction(ENGLISH_SOLUTION_INSTRUCTION),
+                output_model,
+            ),
+            output_model,
+            response_profile.completion_params(),
+        ),
+        response_profile,
+        SATEnglishSolutionOutput,
+        EnglishSolutionPath,
+    )
+    async for event in _stream_cached(
+        source,
+        SATEnglishSolutionOutput,
+        _english_cache_key(problem, tiers[0], response_profile),
+        _english_store_target(problem, tiers[0], response_profile),
+    ):
+        yield event
@@ -0,0 +1,267 @@
+"""
+In-process LLM usage counters (tokens, prompt-cache hits) and
+Prometheus-style histograms/counters exported by GET /metrics
+"""
+import bisect
+import math
+import sys
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+def _get(obj: Any, name: str) -> Any:
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def usage_tokens(usage: Any) -> Dict[str, int]:
+    """
+    Normalize a LiteLLM usage object into token counts.
+
+    cached_tokens covers OpenAI (prompt_tokens_details.cached_tokens) and
+    Anthropic (cache_read_input_tokens) style reporting.
+    """
+    details = _get(usage, "prompt_tokens_details")
+    cached = _get(details, "cached_tokens") or _get(usage, "cache_read_input_tokens") or 0
+    return {
+        "prompt_tokens": _get(usage, "prompt_tokens") or 0,
+        "completion_tokens": _get(usage, "completion_tokens") or 0,
+        "cached_tokens": cached,
+        "cache_creation_tokens": _get(usage, "cache_creation_input_tokens") or 0,
+    }
+
+
+@dataclass
+class UsageMetrics:
+    calls: int = 0
+    calls_with_cache_hit: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    cache_creation_tokens: int = 0
+
+    def record(self, usage: Any) -> Dict[str, int]:
+        tokens = usage_tokens(usage)
+        self.calls += 1
+        if tokens["cached_tokens"]:
+            self.calls_with_cache_hit += 1
+        self.prompt_tokens += tokens["prompt_tokens"]
+        self.completion_tokens += tokens["completion_tokens"]
+        self.cached_tokens += tokens["cached_tokens"]
+        self.cache_creation_tokens += tokens["cache_creation_tokens"]
+        scope = _usage_scope.get()
+        if scope is not None:
+            scope["calls"] += 1
+            for name in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+                scope[name] += tokens[name]
+        return tokens
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **asdict(self),
+            "prompt_cache_hit_ratio": (
+                self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+            ),
+        }
+
+
+# Usage của request hiện tại (track_usage); task con kế thừa cùng dict
+_usage_scope: ContextVar[Optional[Dict[str, int]]] = ContextVar("usage_scope", default=None)
+
+
+@contextmanager
+def track_usage() -> Iterator[Dict[str, int]]:
+    """Totals of the LLM calls recorded inside the block (and tasks it spawns)."""
+    scope = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+    token = _usage_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        try:
+            _usage_scope.reset(token)
+        except ValueError:
+            # Async generator bị đóng ở context khác
+            pass
+
+
+_usage_metrics: Optional[UsageMetrics] = None
+
+
+def get_usage_metrics() -> UsageMetrics:
+    global _usage_metrics
+    if _usage_metrics is None:
+        _usage_metrics = UsageMetrics()
+    return _usage_metrics
+
+
+def usage_cost(model: str, tokens: Dict[str, int]) -> Optional[float]:
+    """
+    USD cost of a call from LiteLLM's price table, or None when LiteLLM is
+    not loaded or does not know the model.
+    """
+    litellm = sys.modules.get("litellm")
+    cost_per_token = getattr(litellm, "cost_per_token", None)
+    if cost_per_token is None:
+        return None
+    try:
+        prompt_cost, completion_cost = cost_per_token(
+            model=model,
+            prompt_tokens=tokens["prompt_tokens"],
+            completion_tokens=tokens["completion_tokens"],
+        )
+    except Exception:
+        return None
+    return float(prompt_cost) + float(completion_cost)
+
+
+# ==================================================
+# PROMETHEUS EXPOSITION
+# ==================================================
+
+# Giây; phủ từ validate vài ms đến lời giải nhiều path vài phút
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0,
+)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> (số đếm từng bucket, sum, count)
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = ([0] * len(self.buckets), [0.0, 0.0])
+                self._series[key] = series
+            counts, totals = series
+            if index < len(counts):
+                counts[index] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, (counts, (total, count)) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _labels(self.labelnames, key, f'le="{_number(bound)}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {_number(count)}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {_number(count)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> Any:
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+_registry: Optional[MetricsRegistry] = None
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    global _registry
+    if _registry is None:
+        _registry = MetricsRegistry()
+    return _registry
@@ -0,0 +1,243 @@
+"""
+Response profiles: full / standard / quick
+
+Output tokens dominate latency, so lighter profiles ask the model for a
+slimmer schema (derived from the full pydantic models by dropping verbose
+fields), cap the number of paths/steps and bound max output tokens (plus a
+reasoning allowance that grows with the routed tier's effort). The slim
+result is expanded back into the full output model (dropped lists become [],
+dropped text ""), so API consumers always receive the same shape.
+"""
+import copy
+import os
+import typing
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple, Type, Union
+
+from pydantic import BaseModel, create_model
+
+ProfileName = typing.Literal["full", "standard", "quick"]
+PROFILE_NAMES = typing.get_args(ProfileName)
+
+# Field bỏ khỏi schema, theo tên model gốc
+_STANDARD_DROPS: Dict[str, FrozenSet[str]] = {
+    "SolutionStep": frozenset({"required_knowledge", "common_traps"}),
+    "SolutionPath": frozenset({"required_knowledge", "pros", "cons", "best_when"}),
+    "EnglishSolutionStep": frozenset({"required_knowledge", "common_traps"}),
+    "EnglishSolutionPath": frozenset({"required_knowledge", "pros", "cons", "best_when"}),
+}
+
+_QUICK_DROPS: Dict[str, FrozenSet[str]] = {
+    "SATMathSolutionOutput": frozenset({"localization"}),
+    "Summary": frozenset({"constraints", "required_knowledge"}),
+    "Planning": frozenset({"reasoning_flow", "sat_tips"}),
+    "SolutionStep": _STANDARD_DROPS["SolutionStep"] | {"quick_check", "desmos"},
+    "SolutionPath": _STANDARD_DROPS["SolutionPath"] | {"desmos_overview"},
+    "Conclusion": frozenset({"approximation", "answer_spec", "verification", "why_others_wrong"}),
+    "SATEnglishSolutionOutput": frozenset({"localization"}),
+    "EnglishSummary": frozenset({"assumptions", "required_knowledge"}),
+    "EnglishPlanning": frozenset({"reasoning_flow", "sat_tips"}),
+    "EnglishSolutionStep": _STANDARD_DROPS["EnglishSolutionStep"],
+    "EnglishSolutionPath": _STANDARD_DROPS["EnglishSolutionPath"],
+    "EnglishConclusion": frozenset({"why_others_wrong"}),
+}
+
+
+def _unwrap_optional(annotation: Any) -> Tuple[Any, bool]:
+    if typing.get_origin(annotation) is Union:
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0], True
+    return annotation, False
+
+
+@dataclass(frozen=True)
+class ResponseProfile:
+    name: str
+    max_paths: Optional[int] = None
+    max_steps: Optional[int] = None
+    max_output_tokens: Optional[int] = None
+    drops: Dict[str, FrozenSet[str]] = field(default_factory=dict, compare=False, hash=False)
+
+    # ---------- schema ----------
+
+    def output_model(self, model: Type[BaseModel]) -> Type[BaseModel]:
+        """Slim variant of model for this profile (model itself for full)."""
+        if not self.drops:
+            return model
+        return _derive(model, self.name.capitalize(), self.drops)
+
+    def keeps(self, model: Type[BaseModel], field_name: str) -> bool:
+        return field_name not in self.drops.get(model.__name__, ())
+
+    def instruction(self, base: str, paths: bool = True) -> str:
+        """base plus the path/step caps (paths=False for single-path calls)."""
+        limits = []
+        if paths and self.max_paths:
+            limits.append(f"tối đa {self.max_paths} hướng giải (solution_paths)")
+        if self.max_steps:
+            limits.append(f"tối đa {self.max_steps} bước mỗi hướng giải")
+        if not limits:
+            return base
+        return f"{base}\nGiới hạn: {', '.join(limits)}. Viết ngắn gọn, đi thẳng vào ý chính."
+
+    def completion_params(self) -> Dict[str, Any]:
+        """
+        Output-token budget of the profile. Reasoning tokens also count toward
+        max_completion_tokens: the call site adds the tier's allowance with
+        with_reasoning_budget().
+        """
+        if not self.max_output_tokens:
+            return {}
+        return {"max_completion_tokens": self.max_output_tokens}
+
+    # ---------- result ----------
+
+    def fill(self, model: Type[BaseModel], data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Apply path/step caps to a solution or path dict (in place) and add the
+        fields the slim schema dropped, without validating.
+        """
+        paths = data.get("solution_paths")
+        if isinstance(paths, list):
+            if self.max_paths:
+                del paths[self.max_paths:]
+            for path in paths:
+                self._cap_steps(path)
+            path_ids = {path.get("path_id") for path in paths if isinstance(path, dict)}
+            if paths and isinstance(paths[0], dict) and data.get("recommended_path_id") not in path_ids:
+                data["recommended_path_id"] = paths[0].get("path_id")
+        self._cap_steps(data)
+        return _fill_required(model, data)
+
+    def expand(self, model: Type[BaseModel], value: Any) -> Any:
+        """Convert a (slim) result into a validated instance of model."""
+        if isinstance(value, model) and not (self.max_paths or self.max_steps):
+            return value
+        data = value.model_dump(mode="json") if isinstance(value, BaseModel) else dict(value)
+        return model.model_validate(self.fill(model, data))
+
+    def _cap_steps(self, path: Any) -> None:
+        if self.max_steps and isinstance(path, dict) and isinstance(path.get("steps"), list):
+            del path["steps"][self.max_steps:]
+
+
+_derived: Dict[Tuple[str, str], Type[BaseModel]] = {}
+
+
+def _derive_annotation(annotation: Any, suffix: str, drops: Dict[str, FrozenSet[str]]) -> Any:
+    inner, optional = _unwrap_optional(annotation)
+    if typing.get_origin(inner) is list:
+        (item,) = typing.get_args(inner)
+        derived = List[_derive_annotation(item, suffix, drops)]
+    elif isinstance(inner, type) and issubclass(inner, BaseModel):
+        derived = _derive(inner, suffix, drops)
+    else:
+        return annotation
+    return Optional[derived] if optional else derived
+
+
+def _derive(model: Type[BaseModel], suffix: str, drops: Dict[str, FrozenSet[str]]) -> Type[BaseModel]:
+    key = (model.__name__, suffix)
+    cached = _derived.get(key)
+    if cached is not None:
+        return cached
+    dropped = drops.get(model.__name__, frozenset())
+    fields: Dict[str, Any] = {}
+    for name, info in model.model_fields.items():
+        if name in dropped:
+            continue
+        annotation = _derive_annotation(info.annotation, suffix, drops)
+        # create_model ghi annotation mới vào FieldInfo: copy để không sửa model gốc
+        fields[name] = (annotation, copy.copy(info))
+    derived = create_model(f"{model.__name__}{suffix}", __doc__=model.__doc__, **fields)
+    _derived[key] = derived
+    return derived
+
+
+def _fill_required(model: Type[BaseModel], data: Any) -> Any:
+    """Recursively add required list/str fields missing from data."""
+    if not isinstance(data, dict):
+        return data
+    for name, info in model.model_fields.items():
+        inner, _ = _unwrap_optional(info.annotation)
+        if name not in data:
+            if not info.is_required():
+                continue
+            if typing.get_origin(inner) is list:
+                data[name] = []
+            elif inner is str:
+                data[name] = ""
+            elif isinstance(inner, type) and issubclass(inner, BaseModel):
+                data[name] = {}
+            else:
+                continue
+        value = data[name]
+        if isinstance(inner, type) and issubclass(inner, BaseModel):
+            _fill_required(inner, value)
+        elif typing.get_origin(inner) is list:
+            (item,) = typing.get_args(inner)
+            item, _ = _unwrap_optional(item)
+            if isinstance(item, type) and issubclass(item, BaseModel) and isinstance(value, list):
+                for element in value:
+                    _fill_required(item, element)
+    return data
+
+
+def _env_int(name: str, default: Optional[int]) -> Optional[int]:
+    raw = os.getenv(name)
+    if raw is None or raw == "":
+        return default
+    value = int(raw)
+    return value if value > 0 else None
+
+
+# Reasoning tokens dự trù thêm cho mỗi mức reasoning effort (ngoài budget output của profile)
+_REASONING_ALLOWANCE = {"none": 0, "minimal": 0, "low": 4000, "medium": 12000, "high": 32000}
+
+
+def reasoning_allowance(effort: Optional[str]) -> int:
+    """Extra tokens for effort (REASONING_TOKENS_<EFFORT> overrides the default)."""
+    if not effort:
+        return 0
+    default = _REASONING_ALLOWANCE.get(effort, _REASONING_ALLOWANCE["medium"])
+    return _env_int(f"REASONING_TOKENS_{effort.upper()}", default) or 0
+
+
+def with_reasoning_budget(params: Optional[Dict[str, Any]], effort: Optional[str]) -> Dict[str, Any]:
+    """params with max_completion_tokens raised by the reasoning allowance of the tier's effort."""
+    params = params or {}
+    budget = params.get("max_completion_tokens")
+    if not budget:
+        return params
+    return {**params, "max_completion_tokens": budget + reasoning_allowance(effort)}
+
+
+PROFILES: Dict[str, ResponseProfile] = {
+    "full": ResponseProfile(
+        name="full",
+        max_output_tokens=_env_int("PROFILE_FULL_MAX_OUTPUT_TOKENS", None),
+    ),
+    "standard": ResponseProfile(
+        name="standard",
+        max_paths=2,
+        max_steps=6,
+        max_output_tokens=_env_int("PROFILE_STANDARD_MAX_OUTPUT_TOKENS", 12000),
+        drops=_STANDARD_DROPS,
+    ),
+    "quick": ResponseProfile(
+        name="quick",
+        max_paths=1,
+        max_steps=4,
+        max_output_tokens=_env_int("PROFILE_QUICK_MAX_OUTPUT_TOKENS", 4000),
+        drops=_QUICK_DROPS,
+    ),
+}
+
+
+def get_profile(name: Optional[str] = None) -> ResponseProfile:
+    """Profile by name; defaults to RESPONSE_PROFILE env var ("full")."""
+    name = name or os.getenv("RESPONSE_PROFILE", "full")
+    if name not in PROFILES:
+        raise ValueError(f"Unknown response profile: {name}")
+    return PROFILES[name]
@@ -0,0 +1,104 @@
+"""
+Versioned prompt registry
+
+System prompts live in services/prompts/<name>.<version>.txt and are loaded
+once per process. For each (prompt, output schema) pair the registry builds a
+byte-identical static prefix (system prompt + JSON schema) so provider-side
+prompt caching can reuse it across requests; only the user turn varies.
+"""
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+
+
+@dataclass(frozen=True)
+class PromptSpec:
+    name: str
+    version: str
+    text: str
+    sha256: str
+
+    @property
+    def tag(self) -> str:
+        """Stable identifier used in cache keys (changes when the file changes)."""
+        return f"{self.name}:{self.version}:{self.sha256[:12]}"
+
+
+class PromptRegistry:
+    def __init__(self, directory: str = PROMPTS_DIR):
+        self.directory = directory
+        self._prompts: Dict[Tuple[str, str], PromptSpec] = {}
+        self._prefixes: Dict[Tuple[str, str, str], str] = {}
+
+    def get(self, name: str, version: str) -> PromptSpec:
+        key = (name, version)
+        spec = self._prompts.get(key)
+        if spec is None:
+            path = os.path.join(self.directory, f"{name}.{version}.txt")
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+            spec = PromptSpec(
+                name=name,
+                version=version,
+                text=text,
+                sha256=hashlib.sha256(text.encode("utf-8")).hexdigest(),
+            )
+            self._prompts[key] = spec
+        return spec
+
+    def static_prefix(self, spec: PromptSpec, output_model: Optional[Type[Any]] = None) -> str:
+        """
+        System prompt followed by the output JSON schema, serialized
+        deterministically (sorted keys, fixed separators) so the bytes never
+        change between requests.
+        """
+        model_name = output_model.__name__ if output_model is not None else ""
+        key = (spec.name, spec.version, model_name)
+        prefix = self._prefixes.get(key)
+        if prefix is None:
+            prefix = spec.text
+            if output_model is not None:
+                schema = json.dumps(
+                    output_model.model_json_schema(),
+                    sort_keys=True,
+                    ensure_ascii=False,
+                    separators=(",", ":"),
+                )
+                prefix = f"{prefix}\n\nOutput JSON schema ({model_name}):\n{schema}\n"
+            self._prefixes[key] = prefix
+        return prefix
+
+    def system_message(self, spec: PromptSpec, output_model: Optional[Type[Any]] = None) -> Dict[str, Any]:
+        """
+        Developer/system message holding the static prefix. With
+        LLM_PROMPT_CACHE_CONTROL=1 the block is marked for explicit caching
+        (providers such as Anthropic require this; OpenAI caches automatically).
+        """
+        prefix = self.static_prefix(spec, output_model)
+        if os.getenv("LLM_PROMPT_CACHE_CONTROL", "0").lower() in ("1", "true", "yes"):
+            content: Any = [{
+                "type": "text",
+                "text": prefix,
+                "cache_control": {"type": "ephemeral"},
+            }]
+        else:
+            content = prefix
+        return {"role": "developer", "content": content}
+
+    def preload(self, prompts: List[Tuple[str, str]]) -> None:
+        for name, version in prompts:
+            self.get(name, version)
+
+
+_prompt_registry: Optional[PromptRegistry] = None
+
+
+def get_prompt_registry() -> PromptRegistry:
+    global _prompt_registry
+    if _prompt_registry is None:
+        _prompt_registry = PromptRegistry()
+    return _prompt_registry
@@ -0,0 +1,454 @@
+"""
+Repair of structured LLM output that fails schema validation
+
+Instead of discarding an expensive generation because one field is off:
+
+1. Deterministic coercion of near-miss values reported by pydantic
+   (enum/Literal casing and spelling, "120s" -> 120, "y=x" -> ["y=x"], ...)
+2. Dropping invalid optional subtrees (optional fields, items of optional lists)
+3. Last resort (done by the caller): a small follow-up call asking the model
+   to fix only the failing JSON paths, whose patches are applied here.
+
+Missing paths/steps are never filled in: output without solution_paths or
+with an empty steps list is truncated and stays invalid.
+"""
+import copy
+import difflib
+import json
+import re
+import typing
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type, Union
+
+from pydantic import BaseModel, Field, ValidationError
+from pydantic.fields import FieldInfo
+
+from services.serialization import validate_json
+
+Loc = Tuple[Union[str, int], ...]
+
+_MAX_ROUNDS = 20
+_MAX_FIX_ERRORS = 20
+_MAX_FIX_CONTEXT_CHARS = 4000
+_CHOICE_PREFIX = re.compile(r"^\(?(?:choice|option|đáp án)?\s*([A-Da-d])\s*[).:]?(?:\s|$)", re.IGNORECASE)
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+# Lời giải không có path / path không có bước là output bị cắt, không phải lời giải
+_NON_EMPTY_LISTS = ("solution_paths", "steps")
+
+
+class OutputValidationError(ValueError):
+    """Output still invalid after deterministic repair; carries what is left to fix."""
+
+    def __init__(self, output_model: Type[BaseModel], data: Any, errors: List[Dict[str, Any]]):
+        self.output_model = output_model
+        self.data = data
+        self.errors = errors
+        paths = ", ".join(format_loc(error["loc"]) for error in errors[:5])
+        super().__init__(
+            f"{output_model.__name__} failed validation ({len(errors)} errors: {paths})"
+        )
+
+
+class TruncatedOutputError(ValueError):
+    """Output stopped at the token limit (finish_reason "length"); repairing it would keep a cut-off solution."""
+
+
+@dataclass
+class RepairResult:
+    value: Optional[BaseModel]
+    data: Any
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+    actions: List[str] = field(default_factory=list)
+
+
+# ==================================================
+# PATH HELPERS
+# ==================================================
+
+def format_loc(loc: Sequence[Union[str, int]]) -> str:
+    """('solution_paths', 0, 'steps') -> 'solution_paths[0].steps'"""
+    out = ""
+    for part in loc:
+        if isinstance(part, int):
+            out += f"[{part}]"
+        else:
+            out += f".{part}" if out else str(part)
+    return out or "$"
+
+
+def parse_loc(path: str) -> Loc:
+    parts: List[Union[str, int]] = []
+    for token in re.findall(r"\[\d+\]|[^.\[\]]+", path):
+        if token == "$":
+            continue
+        parts.append(int(token[1:-1]) if token.startswith("[") else token)
+    return tuple(parts)
+
+
+def _get(data: Any, loc: Loc) -> Any:
+    for part in loc:
+        if isinstance(part, int) and isinstance(data, list) and -len(data) <= part < len(data):
+            data = data[part]
+        elif isinstance(part, str) and isinstance(data, dict) and part in data:
+            data = data[part]
+        else:
+            raise KeyError(format_loc(loc))
+    return data
+
+
+def _set(data: Any, loc: Loc, value: Any) -> None:
+    parent = data
+    for index, part in enumerate(loc[:-1]):
+        nxt = loc[index + 1]
+        if isinstance(parent, dict):
+            if not isinstance(parent.get(part), (dict, list)):
+                parent[part] = [] if isinstance(nxt, int) else {}
+            parent = parent[part]
+        else:
+            parent = parent[part]
+    last = loc[-1]
+    if isinstance(parent, list) and isinstance(last, int) and last == len(parent):
+        parent.append(value)
+    else:
+        parent[last] = value
+
+
+def _unwrap(annotation: Any) -> Any:
+    """Optional[X] -> X"""
+    if typing.get_origin(annotation) is Union:
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+
+def _field_at(model: Type[BaseModel], loc: Loc) -> Optional[FieldInfo]:
+    """FieldInfo of the last named field on loc (None for list items / unknown)."""
+    current: Any = model
+    info: Optional[FieldInfo] = None
+    for part in loc:
+        current = _unwrap(current)
+        if isinstance(part, int):
+            if typing.get_origin(current) is not list:
+                return None
+            current = typing.get_args(current)[0]
+            info = None
+        else:
+            if not (isinstance(current, type) and issubclass(current, BaseModel)):
+                return None
+            info = current.model_fields.get(part)
+            if info is None:
+                return None
+            current = info.annotation
+    return info
+
+
+# ==================================================
+# DETERMINISTIC REPAIR
+# ==================================================
+
+def _normalize(value: str) -> str:
+    return re.sub(r"[\s\-_/&]+", " ", value).strip().casefold()
+
+
+def _coerce_literal(value: Any, allowed: List[str]) -> Optional[str]:
+    if not isinstance(value, str) or not allowed:
+        return None
+    # "B) 12", "(C)", "Choice D" -> "B" / "C" / "D"
+    if all(len(option) == 1 for option in allowed):
+        match = _CHOICE_PREFIX.match(value.strip())
+        if match and match.group(1).upper() in allowed:
+            return match.group(1).upper()
+    by_norm = {_normalize(option): option for option in allowed}
+    norm = _normalize(value)
+    if norm in by_norm:
+        return by_norm[norm]
+    close = difflib.get_close_matches(norm, list(by_norm), n=1, cutoff=0.8)
+    return by_norm[close[0]] if close else None
+
+
+def _coerce(error: Dict[str, Any]) -> Tuple[bool, Any]:
+    """Return (True, new_value) when the failing value can be fixed in place."""
+    kind = error["type"]
+    value = error.get("input")
+
+    if kind in ("literal_error", "enum"):
+        expected = (error.get("ctx") or {}).get("expected", "")
+        coerced = _coerce_literal(value, re.findall(r"'([^']*)'", expected))
+        return (coerced is not None, coerced)
+    if kind in ("int_parsing", "int_type", "int_from_float"):
+        match = _NUMBER.search(str(value)) if value is not None else None
+        if match:
+            return True, int(round(float(match.group(0))))
+    if kind == "string_type" and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return True, str(value)
+    if kind == "string_type" and isinstance(value, list) and all(isinstance(v, str) for v in value):
+        return True, "; ".join(value)
+    if kind == "list_type" and isinstance(value, str):
+        return True, [value]
+    return False, None
+
+
+def _drop(model: Type[BaseModel], data: Any, loc: Loc) -> Optional[str]:
+    """
+    Remove the smallest optional subtree containing loc: an optional field
+    or an item of an optional list. Items of required lists (paths, steps)
+    are left for the targeted fix call rather than silently lost.
+    """
+    for end in range(len(loc), 0, -1):
+        path = loc[:end]
+        last = path[-1]
+        try:
+            parent = _get(data, path[:-1])
+        except KeyError:
+            continue
+        if isinstance(last, int) and isinstance(parent, list) and last < len(parent):
+            list_field = _field_at(model, path[:-1])
+            if list_field is not None and not list_field.is_required():
+                del parent[last]
+                return f"dropped {format_loc(path)}"
+        elif isinstance(last, str) and isinstance(parent, dict):
+            info = _field_at(model, path)
+            if info is not None and not info.is_required():
+                parent.pop(last, None)
+                return f"dropped {format_loc(path)}"
+    return None
+
+
+def _fill_missing(model: Type[BaseModel], data: Any, loc: Loc) -> Optional[str]:
+    """
+    A required list of plain values that is missing becomes an empty list.
+    Missing lists of objects (paths, steps, knowledge items) and missing
+    nested objects mean truncated output: left for the fix call / escalation.
+    """
+    info = _field_at(model, loc)
+    annotation = _unwrap(info.annotation) if info is not None else None
+    if typing.get_origin(annotation) is list:
+        item = _unwrap(typing.get_args(annotation)[0])
+        if isinstance(item, type) and issubclass(item, BaseModel):
+            return None
+        try:
+            _set(data, loc, [])
+        except (KeyError, IndexError, TypeError):
+            return None
+        return f"filled {format_loc(loc)} = []"
+    return None
+
+
+def _empty_required(value: Any, loc: Loc = ()) -> List[Dict[str, Any]]:
+    """Validation-style errors for empty solution_paths / steps lists in a validated model."""
+    errors: List[Dict[str, Any]] = []
+    if isinstance(value, BaseModel):
+        for name in type(value).model_fields:
+            item = getattr(value, name)
+            if name in _NON_EMPTY_LISTS and isinstance(item, list) and not item:
+                errors.append({
+                    "type": "too_short",
+                    "loc": loc + (name,),
+                    "msg": "List should have at least 1 item",
+                    "input": item,
+                })
+            else:
+                errors.extend(_empty_required(item, loc + (name,)))
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            errors.extend(_empty_required(item, loc + (i,)))
+    return errors
+
+
+def repair(output_model: Type[BaseModel], data: Any, allow_drop: bool = True) -> RepairResult:
+    """
+    Validate data against output_model, coercing and dropping what it can.
+    Never raises ValidationError; check result.value / result.errors.
+    """
+    data = copy.deepcopy(data)
+    actions: List[str] = []
+    errors: List[Dict[str, Any]] = []
+
+    for _ in range(_MAX_ROUNDS):
+        try:
+            value = output_model.model_validate(data)
+        except ValidationError as e:
+            errors = e.errors(include_url=False)
+        else:
+            errors = _empty_required(value)
+            if not errors:
+                return RepairResult(value, data, [], actions)
+            break
+
+        changed = False
+        for error in errors:
+            loc = tuple(error["loc"])
+            if not loc:
+                continue
+            fixed, value = _coerce(error)
+            if fixed:
+                try:
+                    _set(data, loc, value)
+                except (KeyError, IndexError, TypeError):
+                    continue
+                actions.append(f"coerced {format_loc(loc)}: {error.get('input')!r} -> {value!r}")
+                changed = True
+            elif error["type"] == "missing":
+                action = _fill_missing(output_model, data, loc)
+                if action:
+                    actions.append(action)
+                    changed = True
+        if changed:
+            continue
+
+        # Mỗi vòng chỉ bỏ một subtree vì xóa phần tử làm lệch index của các lỗi còn lại
+        action = None
+        if allow_drop:
+            for error in errors:
+                action = _drop(output_model, data, tuple(error["loc"]))
+                if action:
+                    break
+        if not action:
+            break
+        actions.append(action)
+
+    return RepairResult(None, data, errors, actions)
+
+
+def parse_json_payload(content: str) -> Any:
+    """json.loads tolerant of markdown fences and text around the object."""
+    text = content.strip()
+    if text.startswith("```"):
+        text = re.sub(r"^```\w*\s*|\s*```$", "", text)
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        start, end = text.find("{"), text.rfind("}")
+        if start != -1 and end > start:
+            return json.loads(text[start:end + 1])
+        raise
+
+
+def validate_or_repair(output_model: Type[BaseModel], content: Any) -> Any:
+    """
+    Parse and validate model output; run deterministic repair on failure.
+    Raises OutputValidationError (a ValueError) when errors remain.
+    """
+    if isinstance(content, output_model) and not _empty_required(content):
+        return content
+    if isinstance(content, BaseModel):
+        content = content.model_dump(mode="json")
+    if isinstance(content, (str, bytes)):
+        # Đường nhanh: parse + validate một lượt trên raw JSON; chỉ khi lỗi mới json.loads để sửa
+        try:
+            value = validate_json(output_model, content)
+        except ValidationError:
+            pass
+        else:
+            if not _empty_required(value):
+                return value
+        if isinstance(content, bytes):
+            content = content.decode("utf-8")
+    data = parse_json_payload(content) if isinstance(content, str) else content
+    result = repair(output_model, data)
+    if result.value is not None:
+        if result.actions:
+            get_repair_stats().deterministic += 1
+            print(f"Repaired {output_model.__name__}: {'; '.join(result.actions)}")
+        return result.value
+    raise OutputValidationError(output_model, result.data, result.errors)
+
+
+# ==================================================
+# TARGETED FIX CALL
+# ==================================================
+
+class RepairPatch(BaseModel):
+    path: str = Field(..., description="Đường dẫn JSON cần sửa, ví dụ solution_paths[0].steps[1].formulas")
+    value_json: str = Field(..., description="Giá trị mới, dạng JSON (chuỗi JSON hợp lệ)")
+
+
+class RepairResponse(BaseModel):
+    patches: List[RepairPatch]
+
+
+FIX_INSTRUCTION = """Output JSON trước đó ({model}) không hợp lệ với schema ở trên tại các vị trí sau.
+CHỈ sửa đúng các vị trí này, không viết lại toàn bộ lời giải. Trả về JSON theo schema RepairResponse:
+{{"patches": [{{"path": "<đường dẫn>", "value_json": "<giá trị mới dạng JSON>"}}]}}
+Giá trị mới phải khớp schema (đúng enum, đúng kiểu) và giữ nguyên nội dung/ngôn ngữ gốc khi có thể.
+
+Lỗi:
+{errors}
+
+JSON hiện tại ở các vị trí liên quan:
+{context}"""
+
+
+def _context_loc(data: Any, loc: Loc) -> Loc:
+    """Nearest existing ancestor of loc that is an object (gives the model some context)."""
+    for end in range(len(loc), -1, -1):
+        try:
+            value = _get(data, loc[:end])
+        except KeyError:
+            continue
+        if isinstance(value, dict):
+            return loc[:end]
+    return ()
+
+
+def build_fix_instruction(error: OutputValidationError) -> str:
+    lines = []
+    contexts: Dict[Loc, Any] = {}
+    for item in error.errors[:_MAX_FIX_ERRORS]:
+        loc = tuple(item["loc"])
+        lines.append(f"- {format_loc(loc)}: {item['msg']} (hiện tại: {json.dumps(item.get('input'), ensure_ascii=False)[:200]})")
+        context_loc = _context_loc(error.data, loc)
+        if context_loc not in contexts:
+            contexts[context_loc] = _get(error.data, context_loc)
+
+    context_parts = []
+    budget = _MAX_FIX_CONTEXT_CHARS
+    for loc, value in contexts.items():
+        text = json.dumps(value, ensure_ascii=False)
+        if len(text) > budget:
+            text = text[:budget] + "..."
+        context_parts.append(f"{format_loc(loc)} = {text}")
+        budget -= len(text)
+        if budget <= 0:
+            break
+
+    return FIX_INSTRUCTION.format(
+        model=error.output_model.__name__,
+        errors="\n".join(lines),
+        context="\n".join(context_parts),
+    )
+
+
+def apply_fix(error: OutputValidationError, response: RepairResponse) -> Any:
+    """Apply patches from the fix call, then repair/validate again."""
+    data = copy.deepcopy(error.data)
+    for patch in response.patches:
+        try:
+            _set(data, parse_loc(patch.path), json.loads(patch.value_json))
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            print(f"Skipping repair patch {patch.path}: {e}")
+    result = repair(error.output_model, data)
+    if result.value is None:
+        raise OutputValidationError(error.output_model, result.data, result.errors)
+    get_repair_stats().llm += 1
+    return result.value
+
+
+@dataclass
+class RepairStats:
+    deterministic: int = 0
+    llm: int = 0
+    failed: int = 0
+    # Output bị cắt ở giới hạn token: không sửa, escalate lên tier kế tiếp
+    truncated: int = 0
+
+
+_repair_stats: Optional[RepairStats] = None
+
+
+def get_repair_stats() -> RepairStats:
+    global _repair_stats
+    if _repair_stats is None:
+        _repair_stats = RepairStats()
+    return _repair_stats
@@ -0,0 +1,437 @@
+"""
+Tail-latency and failure handling for upstream LLM calls
+
+- Hedging: if the primary call has not finished after roughly the recent p95
+  latency of the same kind of call (deployment, reasoning effort, output
+  schema), a second request is sent to an alternate deployment/provider. The
+  first validated result wins and the other is cancelled. Without an
+  alternate there is no hedge (a duplicate request to the same deployment
+  doubles token spend) unless LLM_HEDGE_SAME_DEPLOYMENT=1.
+- Failover: when the primary call fails, the alternate is tried immediately.
+- Circuit breakers: a deployment whose recent error rate is too high stops
+  receiving traffic for a cool-down period, then gets a single probe call.
+  Streamed calls (open_stream) use the same breakers and failover order, but
+  are not hedged.
+
+Deployments are LiteLLM model strings (e.g. "gpt-5.2", "azure/gpt-5.2").
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(RuntimeError):
+    """Every deployment for a call is currently disabled by its circuit breaker."""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _env_float(name: str, default: float) -> float:
+    raw = os.getenv(name)
+    return float(raw) if raw else default
+
+
+# ==================================================
+# LATENCY TRACKING
+# ==================================================
+
+def latency_key(deployment: str, effort: Optional[str] = None, kind: Optional[str] = None) -> str:
+    """
+    Latency series of one kind of call: a high-effort full solution and an
+    answer-only sample on the same model have very different p95s.
+    """
+    return f"{deployment}|{effort or '-'}|{kind or '-'}"
+
+
+class LatencyTracker:
+    """Recent successful call latencies per key (bounded window), see latency_key."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, deployment: str, seconds: float) -> None:
+        samples = self._samples.get(deployment)
+        if samples is None:
+            samples = self._samples[deployment] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def percentile(self, deployment: str, p: float) -> Optional[float]:
+        samples = self._samples.get(deployment)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def count(self, deployment: str) -> int:
+        return len(self._samples.get(deployment) or ())
+
+    def keys(self) -> List[str]:
+        return list(self._samples)
+
+
+# ==================================================
+# CIRCUIT BREAKER
+# ==================================================
+
+class CircuitBreaker:
+    """
+    closed -> open when at least min_calls of the last `window` calls were
+    recorded and the failure ratio reaches failure_ratio. After open_seconds
+    the breaker is half-open and lets one probe call through; its outcome
+    closes or re-opens the circuit.
+    """
+
+    def __init__(
+        self,
+        failure_ratio: float = 0.5,
+        window: int = 20,
+        min_calls: int = 5,
+        open_seconds: float = 30.0,
+    ):
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.open_seconds:
+            return "half_open"
+        return "open"
+
+    def available(self) -> bool:
+        """Whether allow() would admit a call, without claiming the half-open probe."""
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._probing)
+
+    def allow(self) -> bool:
+        """Admit a call that is about to be dispatched (claims the half-open probe)."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self._outcomes.append(True)
+        if self._opened_at is not None:
+            self._opened_at = None
+            self._probing = False
+            self._outcomes.clear()
+
+    def record_failure(self) -> None:
+        self._outcomes.append(False)
+        if self._opened_at is not None:
+            # Probe thất bại: mở lại circuit
+            self._opened_at = time.monotonic()
+            self._probing = False
+            return
+        failures = self._outcomes.count(False)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_ratio:
+            self._opened_at = time.monotonic()
+            self.opened += 1
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker lets a probe call through."""
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+    def release_probe(self) -> None:
+        """Probe call was cancelled (lost a hedge race); allow another probe."""
+        self._probing = False
+
+
+# ==================================================
+# HEDGED EXECUTION
+# ==================================================
+
+@dataclass
+class ResilienceStats:
+    calls: int = 0
+    hedges: int = 0
+    backup_wins: int = 0
+    failovers: int = 0
+    rejected: int = 0
+
+
+class HedgedExecutor:
+    """
+    Run one logical LLM call with hedging, failover and circuit breakers.
+
+    fn(deployment) performs the call and validates the output. A ValueError
+    (invalid JSON / schema) is a bad answer, not a deployment failure: it does
+    not trip the breaker.
+    """
+
+    def __init__(
+        self,
+        alternates: Optional[Dict[str, List[str]]] = None,
+        fallback_models: Optional[List[str]] = None,
+        hedge_enabled: bool = True,
+        hedge_same_deployment: bool = False,
+        hedge_percentile: float = 95.0,
+        hedge_min_delay: float = 2.0,
+        hedge_max_delay: float = 60.0,
+        hedge_default_delay: float = 30.0,
+        hedge_min_samples: int = 20,
+        breaker_factory: Callable[[], CircuitBreaker] = CircuitBreaker,
+    ):
+        self.alternates = alternates or {}
+        self.fallback_models = fallback_models or []
+        self.hedge_enabled = hedge_enabled
+        self.hedge_same_deployment = hedge_same_deployment
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_delay = hedge_max_delay
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.latency = LatencyTracker()
+        self.stats = ResilienceStats()
+        self._breaker_factory = breaker_factory
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def breaker(self, deployment: str) -> CircuitBreaker:
+        breaker = self._breakers.get(deployment)
+        if breaker is None:
+            breaker = self._breakers[deployment] = self._breaker_factory()
+        return breaker
+
+    def hedge_delay(self, key: str) -> float:
+        """p95 of recent latencies for a latency_key, clamped; a fixed default until warmed up."""
+        if self.latency.count(key) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        p = self.latency.percentile(key, self.hedge_percentile)
+        return min(self.hedge_max_delay, max(self.hedge_min_delay, p))
+
+    def _candidates(self, model: str) -> List[str]:
+        candidates = [model]
+        for alternate in self.alternates.get(model, self.fallback_models):
+            if alternate not in candidates:
+                candidates.append(alternate)
+        return candidates
+
+    async def _attempt(self, deployment: str, fn: Callable[[str], Awaitable[T]], key: str) -> T:
+        breaker = self.breaker(deployment)
+        start = time.monotonic()
+        try:
+            result = await fn(deployment)
+        except asyncio.CancelledError:
+            breaker.release_probe()
+            raise
+        except ValueError:
+            breaker.record_success()  # deployment trả lời được, chỉ là output lỗi
+            raise
+        except Exception:
+            self._record_failure(deployment)
+            raise
+        self.latency.record(key, time.monotonic() - start)
+        breaker.record_success()
+        return result
+
+    def _record_failure(self, deployment: str) -> None:
+        breaker = self.breaker(deployment)
+        opened = breaker.opened
+        breaker.record_failure()
+        if breaker.opened != opened:
+            print(f"Circuit opened for LLM deployment {deployment}")
+
+    async def open_stream(self, model: str, fn: Callable[[str], Awaitable[T]]) -> Tuple[str, T]:
+        """
+        Open a streamed call on the first deployment whose breaker lets it
+        through, failing over to the next one when opening fails. Streams are
+        not hedged (events already sent cannot be swapped for another
+        stream's). Report the end of the stream with stream_finished().
+        """
+        self.stats.calls += 1
+        candidates = self._candidates(model)
+        first_error: Optional[BaseException] = None
+        tried = 0
+        for deployment in candidates:
+            breaker = self.breaker(deployment)
+            if not breaker.allow():
+                continue
+            if tried:
+                self.stats.failovers += 1
+            tried += 1
+            try:
+                return deployment, await fn(deployment)
+            except asyncio.CancelledError:
+                breaker.release_probe()
+                raise
+            except ValueError:
+                breaker.record_success()
+                raise
+            except Exception as e:
+                self._record_failure(deployment)
+                first_error = first_error or e
+        if first_error is not None:
+            raise first_error
+        self.stats.rejected += 1
+        raise CircuitOpenError(
+            f"All LLM deployments for {model} are unavailable (circuit open)",
+            retry_after=min(self.breaker(d).retry_after() for d in candidates),
+        )
+
+    def stream_finished(self, deployment: str, error: Optional[BaseException] = None) -> None:
+        """Outcome of a stream opened with open_stream (a cancelled stream counts as neither)."""
+        if isinstance(error, asyncio.CancelledError):
+            self.breaker(deployment).release_probe()
+        elif error is None or isinstance(error, ValueError):
+            self.breaker(deployment).record_success()
+        else:
+            self._record_failure(deployment)
+
+    async def run(
+        self,
+        model: str,
+        fn: Callable[[str], Awaitable[T]],
+        effort: Optional[str] = None,
+        kind: Optional[str] = None,
+    ) -> T:
+        """
+        effort / kind (reasoning effort, output schema name) select the
+        latency series the hedge delay is computed from.
+        """
+        self.stats.calls += 1
+        candidates = self._candidates(model)
+        # Chỉ lọc (không chiếm probe); allow() gọi đúng lúc gửi request tới deployment đó
+        available = [d for d in candidates if self.breaker(d).available()]
+        if not available:
+            self.stats.rejected += 1
+            raise CircuitOpenError(
+                f"All LLM deployments for {model} are unavailable (circuit open)",
+                retry_after=min(self.breaker(d).retry_after() for d in candidates),
+            )
+
+        primary = available[0]
+        self.breaker(primary).allow()
+        # Không có deployment dự phòng: chỉ hedge tới cùng deployment khi bật rõ ràng
+        backup: Optional[str] = available[1] if len(available) > 1 else (
+            primary if self.hedge_enabled and self.hedge_same_deployment else None
+        )
+
+        primary_task = asyncio.ensure_future(self._attempt(primary, fn, latency_key(primary, effort, kind)))
+        tasks: Dict["asyncio.Task[T]", str] = {primary_task: primary}
+        first_error: Optional[BaseException] = None
+        try:
+            if backup is not None:
+                delay = self.hedge_delay(latency_key(primary, effort, kind)) if self.hedge_enabled else None
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self.breaker(backup).allow():
+                    # Chậm hơn p95: gửi thêm request, lấy kết quả về trước
+                    self.stats.hedges += 1
+                    tasks[asyncio.ensure_future(self._attempt(backup, fn, latency_key(backup, effort, kind)))] = backup
+                elif done:
+                    del tasks[primary_task]
+                    first_error = primary_task.exception()
+                    if first_error is None:
+                        return primary_task.result()
+                    # Lỗi từ deployment (không phải output sai): chuyển sang deployment khác
+                    if (
+                        backup != primary
+                        and not isinstance(first_error, ValueError)
+                        and self.breaker(backup).allow()
+                    ):
+                        self.stats.failovers += 1
+                        tasks[asyncio.ensure_future(self._attempt(backup, fn, latency_key(backup, effort, kind)))] = backup
+
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    del tasks[task]
+                    error = task.exception()
+                    if error is None:
+                        if task is not primary_task:
+                            self.stats.backup_wins += 1
+                        return task.result()
+                    first_error = first_error or error
+            raise first_error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "calls": self.stats.calls,
+            "hedges": self.stats.hedges,
+            "backup_wins": self.stats.backup_wins,
+            "failovers": self.stats.failovers,
+            "rejected": self.stats.rejected,
+            "deployments": {
+                deployment: {
+                    "state": breaker.state,
+                    "times_opened": breaker.opened,
+                }
+                for deployment, breaker in self._breakers.items()
+            },
+            # deployment|effort|kind -> hedge delay theo p95 của đúng loại lời gọi đó
+            "latency": {
+                key: {
+                    "samples": self.latency.count(key),
+                    "hedge_delay_seconds": round(self.hedge_delay(key), 3),
+                    "p95_seconds": self.latency.percentile(key, 95.0),
+                }
+                for key in self.latency.keys()
+            },
+        }
+
+
+_hedged_executor: Optional[HedgedExecutor] = None
+
+
+def get_hedged_executor() -> HedgedExecutor:
+    """
+    Return the process-wide executor, configured from environment:
+
+    - LLM_FALLBACK_MODELS: comma-separated alternate deployments (LiteLLM
+      model strings, other providers allowed) used for hedging and failover
+    - LLM_HEDGE_ENABLED (default "1")
+    - LLM_HEDGE_SAME_DEPLOYMENT (default "0"): hedge with a duplicate request
+      to the same deployment when no alternate is configured
+    - LLM_HEDGE_PERCENTILE (default 95)
+    - LLM_HEDGE_MIN_DELAY / LLM_HEDGE_MAX_DELAY (seconds, default 2 / 60)
+    - LLM_HEDGE_DEFAULT_DELAY (seconds before enough samples, default 30)
+    - LLM_BREAKER_FAILURE_RATIO (default 0.5), LLM_BREAKER_MIN_CALLS (default 5),
+      LLM_BREAKER_OPEN_SECONDS (default 30)
+    """
+    global _hedged_executor
+    if _hedged_executor is None:
+        failure_ratio = _env_float("LLM_BREAKER_FAILURE_RATIO", 0.5)
+        min_calls = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+        open_seconds = _env_float("LLM_BREAKER_OPEN_SECONDS", 30.0)
+        _hedged_executor = HedgedExecutor(
+            fallback_models=[
+                model.strip()
+                for model in os.getenv("LLM_FALLBACK_MODELS", "").split(",")
+                if model.strip()
+            ],
+            hedge_enabled=os.getenv("LLM_HEDGE_ENABLED", "1").lower() not in ("0", "false", "no"),
+            hedge_same_deployment=os.getenv("LLM_HEDGE_SAME_DEPLOYMENT", "0").lower() in ("1", "true", "yes"),
+            hedge_percentile=_env_float("LLM_HEDGE_PERCENTILE", 95.0),
+            hedge_min_delay=_env_float("LLM_HEDGE_MIN_DELAY", 2.0),
+            hedge_max_delay=_env_float("LLM_HEDGE_MAX_DELAY", 60.0),
+            hedge_default_delay=_env_float("LLM_HEDGE_DEFAULT_DELAY", 30.0),
+            breaker_factory=lambda: CircuitBreaker(
+                failure_ratio=failure_ratio,
+                min_calls=min_calls,
+                open_seconds=open_seconds,
+            ),
+        )
+    return _hedged_executor
@@ -0,0 +1,181 @@
+"""
+Model routing by problem difficulty
+
+Incoming problems are classified cheaply (text/image heuristics, no LLM call)
+into the SATMeta.difficulty_band buckets, and each bucket maps to a model /
+reasoning_effort tier. When a tier's output fails schema validation the call
+escalates to the next stronger tier.
+"""
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+DIFFICULTY_BANDS = ("easy", "medium", "hard")
+
+# Model mặc định cho mọi tier (có thể override riêng từng tier)
+DEFAULT_MODEL = os.getenv("LITELLM_MODEL", "gpt-5.2")
+_DEFAULT_EFFORTS = {"easy": "low", "medium": "medium", "hard": "high"}
+
+# Dấu hiệu bài khó: hình học/lượng giác, hàm mũ/bậc hai, thống kê, hệ vô nghiệm...
+_HARD_MARKERS = re.compile(
+    r"\b(circle|radius|radian|arc|sector|inscribed|triangle|similar|congruent|"
+    r"sin|cos|tan|trigonometr\w*|exponential|quadratic|parabola|vertex|"
+    r"discriminant|polynomial|rational|standard deviation|margin of error|"
+    r"probability|infinitely many|no solution|system of)\b|√|π|\\frac|\\sqrt|\^",
+    re.IGNORECASE,
+)
+_TABLE_MARKERS = re.compile(r"\btable\b|\|.+\|", re.IGNORECASE)
+_ENGLISH_GRAMMAR = re.compile(r"conventions of Standard English", re.IGNORECASE)
+_ENGLISH_DUAL_TEXT = re.compile(r"\bText 1\b.*\bText 2\b", re.IGNORECASE | re.DOTALL)
+
+
+@dataclass(frozen=True)
+class ModelTier:
+    band: str
+    model: str
+    reasoning_effort: str
+
+
+def _tier_from_env(band: str) -> ModelTier:
+    key = band.upper()
+    return ModelTier(
+        band=band,
+        model=os.getenv(f"LLM_MODEL_{key}", DEFAULT_MODEL),
+        reasoning_effort=os.getenv(f"LLM_EFFORT_{key}", _DEFAULT_EFFORTS[band]),
+    )
+
+
+def classify_math_difficulty(
+    problem: Optional[str],
+    has_image: bool = False,
+    image_detail: Optional[str] = None,
+) -> str:
+    """
+    Score a math problem from its text and image; returns a difficulty band.
+    """
+    text = problem or ""
+    score = 0
+    if len(text) > 400:
+        score += 1
+    if len(text) > 900:
+        score += 1
+    markers = {m.group(0).lower() for m in _HARD_MARKERS.finditer(text)}
+    score += min(len(markers), 2)
+    if text.count("=") >= 3:
+        score += 1
+    if _TABLE_MARKERS.search(text):
+        score += 1
+    if has_image:
+        score += 1
+        # Chỉ có ảnh lớn (thường là hình vẽ/đồ thị) và không có text
+        if not text and image_detail == "high":
+            score += 1
+
+    if score <= 0:
+        return "easy"
+    if score <= 2:
+        return "medium"
+    return "hard"
+
+
+def classify_english_difficulty(problem: str) -> str:
+    if _ENGLISH_DUAL_TEXT.search(problem) or len(problem) > 1200:
+        return "hard"
+    if _ENGLISH_GRAMMAR.search(problem) and len(problem) < 600:
+        return "easy"
+    return "medium"
+
+
+@dataclass
+class RoutingStats:
+    routed: Dict[str, int] = field(default_factory=lambda: {band: 0 for band in DIFFICULTY_BANDS})
+    escalations: int = 0
+
+
+class ModelRouter:
+    """
+    Maps difficulty bands to tiers and builds escalation chains.
+
+    With routing disabled every request uses the medium tier (previous
+    fixed model/effort behaviour).
+    """
+
+    def __init__(
+        self,
+        tiers: Optional[Dict[str, ModelTier]] = None,
+        enabled: bool = True,
+        max_escalations: int = 1,
+    ):
+        self.tiers = tiers or {band: _tier_from_env(band) for band in DIFFICULTY_BANDS}
+        self.enabled = enabled
+        self.max_escalations = max_escalations
+        self.stats = RoutingStats()
+
+    def chain(self, band: Optional[str]) -> List[ModelTier]:
+        """
+        Tier for band followed by up to max_escalations stronger tiers.
+        Identical consecutive tiers are skipped (e.g. same model and effort).
+        """
+        if not self.enabled or band not in DIFFICULTY_BANDS:
+            band = "medium"
+        start = DIFFICULTY_BANDS.index(band)
+        chain = [self.tiers[band]]
+        for stronger in DIFFICULTY_BANDS[start + 1:]:
+            if len(chain) > self.max_escalations:
+                break
+            tier = self.tiers[stronger]
+            if (tier.model, tier.reasoning_effort) != (chain[-1].model, chain[-1].reasoning_effort):
+                chain.append(tier)
+        return chain
+
+    def route_math(self, problem: Optional[str], image: Any = None) -> List[ModelTier]:
+        chain = self.chain(classify_math_difficulty(
+            problem,
+            has_image=image is not None,
+            image_detail=getattr(image, "detail", None),
+        ))
+        self.stats.routed[chain[0].band] += 1
+        return chain
+
+    def route_english(self, problem: str) -> List[ModelTier]:
+        chain = self.chain(classify_english_difficulty(problem))
+        self.stats.routed[chain[0].band] += 1
+        return chain
+
+    def record_escalation(self) -> None:
+        self.stats.escalations += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "routed": dict(self.stats.routed),
+            "escalations": self.stats.escalations,
+            "tiers": {
+                band: {"model": tier.model, "reasoning_effort": tier.reasoning_effort}
+                for band, tier in self.tiers.items()
+            },
+        }
+
+
+_model_router: Optional[ModelRouter] = None
+
+
+def get_model_router() -> ModelRouter:
+    """
+    Return the process-wide router, configured from environment:
+
+    - LLM_ROUTING_ENABLED (default "1")
+    - LLM_ROUTING_MAX_ESCALATIONS (default 1)
+    - LITELLM_MODEL (default model for every tier, default "gpt-5.2")
+    - LLM_MODEL_EASY / LLM_MODEL_MEDIUM / LLM_MODEL_HARD
+    - LLM_EFFORT_EASY / LLM_EFFORT_MEDIUM / LLM_EFFORT_HARD
+      (default low / medium / high)
+    """
+    global _model_router
+    if _model_router is None:
+        _model_router = ModelRouter(
+            enabled=os.getenv("LLM_ROUTING_ENABLED", "1").lower() not in ("0", "false", "no"),
+            max_escalations=int(os.getenv("LLM_ROUTING_MAX_ESCALATIONS", "1")),
+        )
+    return _model_router
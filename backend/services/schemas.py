@@ -193,16 +193,19 @@ class Conclusion(BaseModel):
 # 10. SOLUTION PATH (one approach)
 # ==================================================
 
+MathApproachType = Literal[
+    "algebraic",
+    "formula_based",
+    "geometric_reasoning",
+    "data_analysis",
+    "exam_trick",
+    "desmos_first"
+]
+
+
 class SolutionPath(BaseModel):
     path_id: str
-    approach_type: Literal[
-        "algebraic",
-        "formula_based",
-        "geometric_reasoning",
-        "data_analysis",
-        "exam_trick",
-        "desmos_first"
-    ]
+    approach_type: MathApproachType
     title: str
 
     planning: Planning
@@ -242,6 +245,55 @@ class SATMathSolutionOutput(BaseModel):
     )
 
 
+# ==================================================
+# 12. PIPELINE ANALYSIS (stage 1 of pipeline mode)
+# ==================================================
+
+class PlannedPath(BaseModel):
+    path_id: str
+    approach_type: MathApproachType
+    title: str
+    focus: Optional[str] = Field(
+        None, description="Ý chính của hướng giải, dùng để sinh chi tiết ở bước sau"
+    )
+
+
+class SATMathAnalysis(BaseModel):
+    sat_meta: SATMeta
+    summary: Summary
+    answer_spec: AnswerSpec
+    planned_paths: List[PlannedPath] = Field(
+        ..., description="Các hướng giải sẽ được sinh chi tiết (theo thứ tự ưu tiên)"
+    )
+    recommended_path_id: Optional[str] = None
+
+
+# ==================================================
+# 13. LAZY SOLUTION (only the recommended path generated)
+# ==================================================
+
+class SATMathLazySolution(SATMathSolutionOutput):
+    solution_id: str = Field(
+        ..., description="Dùng với POST /solve/{solution_id}/paths/{path_id} để sinh path còn lại"
+    )
+    pending_paths: List[PlannedPath] = Field(
+        default_factory=list,
+        description="Các hướng giải chưa sinh chi tiết (chỉ có id, approach_type, title)",
+    )
+
+
+# ==================================================
+# 14. ANSWER SAMPLE (self-consistency vote mode)
+# ==================================================
+
+class SATMathAnswerSample(BaseModel):
+    question_type: Literal["multiple_choice", "grid_in"]
+    final_answer: str = Field(..., description="Đáp án cuối cùng, ngắn gọn (không kèm lời giải)")
+    correct_choice: Optional[Literal["A", "B", "C", "D"]] = Field(
+        None, description="Chữ cái của lựa chọn đúng (chỉ với multiple_choice)"
+    )
+
+
     # sat_english_schema.py
 # ==================================================
 # SAT ENGLISH SOLUTION SCHEMA
@@ -0,0 +1,65 @@
+"""
+JSON serialization for the request hot path
+
+Large multi-path solutions are validated exactly once, straight from the raw
+JSON (cached TypeAdapter.validate_json, no json.loads + dict step), and
+already-validated models are written with pydantic's Rust serializer instead
+of going through FastAPI's response_model revalidation + jsonable_encoder.
+Plain dicts/lists use orjson when it is installed.
+"""
+import json
+from functools import lru_cache
+from typing import Any, Union
+
+from pydantic import BaseModel, TypeAdapter
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+
+    ORJSON_AVAILABLE = True
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+
+@lru_cache(maxsize=None)
+def get_type_adapter(tp: Any) -> TypeAdapter:
+    """One compiled adapter per type (models, List[...], Union[...])."""
+    return TypeAdapter(tp)
+
+
+def validate_json(tp: Any, data: Union[str, bytes]) -> Any:
+    """Parse and validate raw JSON in a single pass."""
+    return get_type_adapter(tp).validate_json(data)
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dump_json(value: Any) -> bytes:
+    """Serialize a validated model or JSON-compatible data to UTF-8 bytes."""
+    if isinstance(value, BaseModel):
+        return value.__pydantic_serializer__.to_json(value)
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def dumps(value: Any) -> str:
+    """dump_json as str (SSE / NDJSON lines)."""
+    return dump_json(value).decode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered by dump_json. Returning it directly from a route
+    skips FastAPI's response_model validation/serialization, so pass only
+    objects that are already validated.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dump_json(content)
@@ -0,0 +1,182 @@
+"""
+State shared between worker processes
+
+With WEB_WORKERS > 1 (python main.py --workers N, or gunicorn/uvicorn
+workers) every process has its own memory, so in-process structures would
+split the server into N independent ones. This module keeps the pieces that
+must be global in one local SQLite file (WAL mode, safe for concurrent
+processes on the same host):
+
+- leases: cross-process single-flight; one process generates a solution
+  while the others wait for it to appear in the shared cache,
+- rate_buckets: per-client token buckets, so a client gets its limit once,
+  not once per worker.
+
+The solution cache itself is shared through its SQLite disk tier
+(SOLUTION_CACHE_DB_PATH, defaulted in multi-worker mode).
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional, Tuple
+
+DEFAULT_SHARED_STATE_PATH = os.path.join(".cache", "shared_state.sqlite3")
+DEFAULT_SHARED_CACHE_PATH = os.path.join(".cache", "solution_cache.sqlite3")
+
+
+def worker_count() -> int:
+    """Number of web worker processes (WEB_WORKERS, set by the launcher)."""
+    try:
+        return max(1, int(os.getenv("WEB_WORKERS", "1")))
+    except ValueError:
+        return 1
+
+
+def shared_state_enabled() -> bool:
+    """Multi-worker mode: WEB_WORKERS > 1, or forced with SHARED_STATE=1."""
+    forced = os.getenv("SHARED_STATE", "").lower()
+    if forced in ("0", "false", "no"):
+        return False
+    return worker_count() > 1 or forced in ("1", "true", "yes")
+
+
+def shared_state_path() -> str:
+    return os.getenv("SHARED_STATE_DB_PATH") or DEFAULT_SHARED_STATE_PATH
+
+
+def connect_shared(path: str) -> sqlite3.Connection:
+    """Connection tuned for several processes writing the same file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+# Mỗi process một owner id duy nhất (pid có thể bị tái sử dụng sau restart)
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class SharedState:
+    """SQLite-backed leases and token buckets; one connection per process."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = connect_shared(path)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS leases (
+                key TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                client TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_rate_buckets_updated ON rate_buckets(updated_at);
+            """
+        )
+        self._takes = 0
+
+    # ---------------- leases ----------------
+
+    def acquire_lease(self, key: str, owner: str, ttl_seconds: float) -> bool:
+        """Take (or renew) the lease on key; False while another live owner holds it."""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at < ?",
+                (key, owner, now + ttl_seconds, now),
+            )
+            return cursor.rowcount == 1
+
+    def lease_holder(self, key: str) -> Optional[str]:
+        """Owner of a live lease on key, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT owner FROM leases WHERE key = ? AND expires_at >= ?",
+                (key, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def release_lease(self, key: str, owner: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner))
+
+    # ---------------- token buckets ----------------
+
+    def take_tokens(self, client: str, rate: float, burst: float, cost: float) -> float:
+        """
+        Shared TokenBucket.take: 0 on success, else seconds until cost tokens
+        are available. Read-modify-write runs under BEGIN IMMEDIATE.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT tokens, updated_at FROM rate_buckets WHERE client = ?", (client,)
+                ).fetchone()
+                tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+                wait = 0.0
+                if tokens >= cost:
+                    tokens -= cost
+                else:
+                    wait = (cost - tokens) / rate
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rate_buckets (client, tokens, updated_at) VALUES (?, ?, ?)",
+                    (client, tokens, now),
+                )
+                self._takes += 1
+                if self._takes % 1000 == 0:
+                    # Bucket không dùng lâu hơn thời gian hồi đầy thì tương đương bucket mới
+                    self._conn.execute(
+                        "DELETE FROM rate_buckets WHERE updated_at < ?", (now - burst / rate,)
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    def counts(self) -> Tuple[int, int]:
+        with self._lock:
+            (leases,) = self._conn.execute(
+                "SELECT COUNT(*) FROM leases WHERE expires_at >= ?", (time.time(),)
+            ).fetchone()
+            (clients,) = self._conn.execute("SELECT COUNT(*) FROM rate_buckets").fetchone()
+        return leases, clients
+
+    def snapshot(self) -> dict:
+        leases, clients = self.counts()
+        return {
+            "path": self.path,
+            "process": PROCESS_ID,
+            "workers": worker_count(),
+            "active_leases": leases,
+            "rate_limited_clients": clients,
+        }
+
+
+_shared_state: Optional[SharedState] = None
+_shared_state_lock = threading.Lock()
+
+
+def get_shared_state() -> Optional[SharedState]:
+    """Process-wide SharedState in multi-worker mode, None otherwise."""
+    global _shared_state
+    if not shared_state_enabled():
+        return None
+    with _shared_state_lock:
+        if _shared_state is None:
+            _shared_state = SharedState(shared_state_path())
+    return _shared_state
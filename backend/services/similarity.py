@@ -0,0 +1,397 @@
+"""
+Near-duplicate problem matching
+
+The exact cache/store key misses the same question re-sent with different
+whitespace, LaTeX spacing, OCR noise or shuffled answer choices. Problems are
+normalized (math tokens, numbers, choice order), embedded locally as hashed
+character n-gram vectors and searched in a flat in-memory index over the
+solution store. A candidate only counts as a match when the cosine score
+passes the threshold AND the stem is the same question: its math (numbers,
+operators, relations and variable symbols) and its prose words, both in
+order, are identical, as is the set of answer choices. "2x+3=7" never
+matches "2x+3=8", "2x-3=7" or "2y+3=7", and "sum of the solutions" never
+matches "product of the solutions". Only whitespace, punctuation, LaTeX
+spacing and common OCR confusions (rn/m, vv/w) are tolerated; the embedding
+just narrows the candidates. The stored solution's choice letters are then
+re-mapped to the new choice order.
+"""
+import math
+import os
+import re
+import threading
+import unicodedata
+import zlib
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+CHOICE_LETTERS = ("A", "B", "C", "D")
+
+# Số chiều vector (feature hashing)
+_DIM = 1024
+_NGRAM = 3
+
+# ==================================================
+# NORMALIZATION
+# ==================================================
+
+_LATEX_NOISE_RE = re.compile(r"\\(?:left|right|displaystyle|quad|qquad|[,;:! ])|\$")
+_LATEX_FRAC_RE = re.compile(r"\\[dt]frac")
+_THOUSANDS_RE = re.compile(r"(?<=\d),(?=\d{3}(?!\d))")
+_DECIMAL_RE = re.compile(r"(\d+)\.(\d*?)0+(?!\d)")
+_OPERATOR_SPACE_RE = re.compile(r"\s*([=+\-*/^(){}\[\],<>≤≥])\s*")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+_CHOICE_MARKER_RE = re.compile(r"(?:^|(?<=\s))\(?([A-D])[\).:]\s*")
+# Token có chữ số, toán tử / quan hệ hoặc lệnh LaTeX là phần toán của đề
+_MATH_TOKEN_RE = re.compile(r"[\d=+\-*/^(){}\[\]<>≤≥\\_|%]")
+_TOKEN_PUNCTUATION = ".,;:?!\"'"
+# Chữ cái đứng riêng là biến (x, y, k...), trừ mạo từ / đại từ tiếng Anh
+_PROSE_LETTERS = ("a", "i")
+# Lỗi OCR hay gặp trong chữ: gộp về cùng một dạng ở cả hai phía khi so sánh
+_OCR_FOLDS = (("rn", "m"), ("vv", "w"))
+
+_SYMBOLS = str.maketrans({
+    "−": "-", "–": "-", "—": "-",
+    "×": "*", "·": "*", "⋅": "*",
+    "÷": "/",
+    "’": "'", "‘": "'", "“": '"', "”": '"',
+})
+
+
+def normalize_math_text(text: Optional[str]) -> str:
+    """Canonical form of problem text: case, unicode, LaTeX spacing, numbers, operator spacing."""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text).translate(_SYMBOLS).lower()
+    text = _LATEX_FRAC_RE.sub(r"\\frac", text)
+    text = _LATEX_NOISE_RE.sub(" ", text)
+    text = _THOUSANDS_RE.sub("", text)
+    # 3.50 -> 3.5, 4.0 -> 4
+    text = _DECIMAL_RE.sub(lambda m: f"{m.group(1)}.{m.group(2)}" if m.group(2) else m.group(1), text)
+    text = " ".join(text.split())
+    text = _OPERATOR_SPACE_RE.sub(r"\1", text)
+    return text.strip(" .?:")
+
+
+def split_choices(text: Optional[str]) -> Tuple[str, List[str]]:
+    """
+    Split raw problem text into (stem, [choice A, B, C, D]). Choices are only
+    recognized as a full A-D run of markers ("A) ..", "(B) ..", "C. ..").
+    """
+    if not text:
+        return "", []
+    markers = list(_CHOICE_MARKER_RE.finditer(text))
+    # Lấy dãy A, B, C, D liên tiếp cuối cùng (tránh "Point A." trong đề)
+    for start in range(len(markers) - len(CHOICE_LETTERS), -1, -1):
+        run = markers[start:start + len(CHOICE_LETTERS)]
+        if tuple(m.group(1) for m in run) != CHOICE_LETTERS:
+            continue
+        bounds = [m.end() for m in run]
+        ends = [m.start() for m in run[1:]] + [len(text)]
+        choices = [text[b:e].strip() for b, e in zip(bounds, ends)]
+        return text[:run[0].start()].strip(), choices
+    return text.strip(), []
+
+
+@dataclass(frozen=True)
+class ProblemSignature:
+    stem: str
+    choices: Tuple[str, ...]  # normalized, in original A-D order
+    numbers: Tuple[str, ...]  # sorted, from stem and choices
+    math: Tuple[str, ...] = ()  # math tokens of the stem, in order
+    prose: Tuple[str, ...] = ()  # prose words of the stem, in order (OCR-folded)
+
+    @property
+    def canonical(self) -> str:
+        """Order-independent text used for the embedding."""
+        return " | ".join((self.stem, *sorted(self.choices)))
+
+
+def _tokens(normalized: str) -> List[Tuple[str, bool]]:
+    """(token, is_math) pairs of normalized text, punctuation stripped."""
+    tokens = []
+    # Dấu phẩy dính vào token khi bỏ khoảng trắng quanh toán tử ("11,what")
+    for token in re.split(r"[\s,]+", normalized):
+        token = token.strip(_TOKEN_PUNCTUATION)
+        if not token:
+            continue
+        is_math = bool(_MATH_TOKEN_RE.search(token)) or (
+            len(token) == 1 and token.isalpha() and token not in _PROSE_LETTERS
+        )
+        tokens.append((token, is_math))
+    return tokens
+
+
+def math_tokens(normalized: str) -> Tuple[str, ...]:
+    """
+    Math parts of normalized text, in order: "if 2x+3=11, what is the value
+    of x" -> ("2x+3=11", "x"). Prose words are dropped.
+    """
+    return tuple(token for token, is_math in _tokens(normalized) if is_math)
+
+
+def prose_words(normalized: str) -> Tuple[str, ...]:
+    """
+    Prose parts of normalized text, in order and OCR-folded: "if 2x+3=11,
+    what is the value of x" -> ("if", "what", "is", "the", "value", "of").
+    """
+    words = []
+    for token, is_math in _tokens(normalized):
+        if is_math:
+            continue
+        word = token.replace("'", "")
+        for noisy, clean in _OCR_FOLDS:
+            word = word.replace(noisy, clean)
+        words.append(word)
+    return tuple(words)
+
+
+def problem_signature(problem: Optional[str]) -> ProblemSignature:
+    stem, choices = split_choices(problem)
+    stem = normalize_math_text(stem)
+    normalized = tuple(normalize_math_text(choice) for choice in choices)
+    numbers = sorted(_NUMBER_RE.findall(" ".join((stem, *normalized))))
+    return ProblemSignature(
+        stem=stem,
+        choices=normalized,
+        numbers=tuple(numbers),
+        math=math_tokens(stem),
+        prose=prose_words(stem),
+    )
+
+
+def embed(text: str) -> Dict[int, float]:
+    """L2-normalized hashed character n-gram + token vector (sparse)."""
+    counts: Dict[int, float] = {}
+    padded = f" {text} "
+    for i in range(len(padded) - _NGRAM + 1):
+        bucket = zlib.crc32(padded[i:i + _NGRAM].encode("utf-8")) % _DIM
+        counts[bucket] = counts.get(bucket, 0.0) + 1.0
+    for token in text.split():
+        bucket = zlib.crc32(f"w:{token}".encode("utf-8")) % _DIM
+        counts[bucket] = counts.get(bucket, 0.0) + 1.0
+    norm = math.sqrt(sum(value * value for value in counts.values())) or 1.0
+    return {bucket: value / norm for bucket, value in counts.items()}
+
+
+def choice_mapping(stored: ProblemSignature, incoming: ProblemSignature) -> Optional[Dict[str, str]]:
+    """Stored choice letter -> incoming letter, or None if the choice sets differ."""
+    if len(stored.choices) != len(incoming.choices):
+        return None
+    if sorted(stored.choices) != sorted(incoming.choices):
+        return None
+    if len(set(incoming.choices)) != len(incoming.choices):
+        # Lựa chọn trùng nhau: không xác định được mapping
+        return None if stored.choices != incoming.choices else {}
+    position = {choice: CHOICE_LETTERS[i] for i, choice in enumerate(incoming.choices)}
+    return {
+        CHOICE_LETTERS[i]: position[choice]
+        for i, choice in enumerate(stored.choices)
+        if position[choice] != CHOICE_LETTERS[i]
+    }
+
+
+# ==================================================
+# CHOICE REMAPPING
+# ==================================================
+
+# Ký tự đáp án trong văn bản: "A", "(B)", "C) ...", "đáp án D", "choice A"
+_LETTER_IN_TEXT_RE = re.compile(
+    r"^\(?(?P<whole>[A-D])\)?$"
+    r"|^(?P<lead>\(?)(?P<lead_letter>[A-D])(?=[\).:]\s|[\).:]$|\)\S)"
+    r"|\((?P<paren>[A-D])\)"
+    r"|(?P<kw>\b(?:[Cc]hoice|[Oo]ption|[Aa]nswer|[Đđ]áp án|[Ll]ựa chọn|[Pp]hương án|[Cc]họn)\s+\(?)(?P<kw_letter>[A-D])\b"
+)
+
+
+def _remap_text(text: str, mapping: Dict[str, str]) -> str:
+    def _sub(match: "re.Match[str]") -> str:
+        for group in ("whole", "lead_letter", "paren", "kw_letter"):
+            letter = match.group(group)
+            if letter is None:
+                continue
+            start, end = match.span(group)
+            offset = match.start()
+            value = match.group(0)
+            return value[:start - offset] + mapping.get(letter, letter) + value[end - offset:]
+        return match.group(0)
+
+    return _LETTER_IN_TEXT_RE.sub(_sub, text)
+
+
+def remap_choices(data: Any, mapping: Dict[str, str]) -> Any:
+    """
+    Rewrite choice letters in a solution dict for a new choice order:
+    correct_choice / choice fields, AnswerSpec.choices order, and letter
+    references in text.
+    """
+    if not mapping:
+        return data
+    if isinstance(data, dict):
+        result = {}
+        for key, value in data.items():
+            if key in ("correct_choice", "choice") and isinstance(value, str) and value in CHOICE_LETTERS:
+                result[key] = mapping.get(value, value)
+            elif key == "choices" and isinstance(value, list) and len(value) == len(CHOICE_LETTERS):
+                reordered: List[Any] = [None] * len(value)
+                for i, item in enumerate(value):
+                    reordered[CHOICE_LETTERS.index(mapping.get(CHOICE_LETTERS[i], CHOICE_LETTERS[i]))] = item
+                result[key] = [remap_choices(item, mapping) for item in reordered]
+            else:
+                result[key] = remap_choices(value, mapping)
+        return result
+    if isinstance(data, list):
+        return [remap_choices(item, mapping) for item in data]
+    if isinstance(data, str):
+        return _remap_text(data, mapping)
+    return data
+
+
+# ==================================================
+# INDEX
+# ==================================================
+
+@dataclass
+class SimilarityStats:
+    lookups: int = 0
+    hits: int = 0
+    remapped: int = 0
+    # Điểm cosine đủ nhưng phần toán (số, toán tử, biến), lời đề hoặc lựa chọn khác nhau
+    rejected: int = 0
+
+
+@dataclass(frozen=True)
+class SimilarMatch:
+    solution_id: int
+    score: float
+    choice_map: Dict[str, str] = field(default_factory=dict, hash=False)
+
+
+@dataclass(frozen=True)
+class _Entry:
+    solution_id: int
+    kind: str
+    prompt_version: Optional[str]
+    signature: ProblemSignature
+
+
+class SimilarityIndex:
+    """
+    Flat cosine index over stored problems. Uses a numpy matrix when numpy
+    is installed, otherwise sparse dot products in pure Python.
+    """
+
+    def __init__(self, threshold: float = 0.9, top_k: int = 5):
+        self.threshold = threshold
+        self.top_k = top_k
+        self.stats = SimilarityStats()
+        self._lock = threading.Lock()
+        self._entries: List[_Entry] = []
+        self._ids: Dict[int, int] = {}
+        self._sparse: List[Dict[int, float]] = []
+        self._matrix: Any = None  # numpy: hàng = vector của _entries
+        self._pending: List[Dict[int, float]] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, solution_id: int, kind: str, prompt_version: Optional[str], problem: Optional[str]) -> None:
+        if not problem:
+            return
+        signature = problem_signature(problem)
+        vector = embed(signature.canonical)
+        entry = _Entry(solution_id, kind, prompt_version, signature)
+        with self._lock:
+            row = self._ids.get(solution_id)
+            if row is not None:
+                # Upsert cùng id: đề không đổi
+                self._entries[row] = entry
+                return
+            self._ids[solution_id] = len(self._entries)
+            self._entries.append(entry)
+            if np is None:
+                self._sparse.append(vector)
+            else:
+                self._pending.append(vector)
+
+    def _scores(self, vector: Dict[int, float]) -> List[float]:
+        if np is None:
+            return [
+                sum(value * row.get(bucket, 0.0) for bucket, value in vector.items())
+                for row in self._sparse
+            ]
+        if self._pending:
+            block = np.zeros((len(self._pending), _DIM), dtype=np.float32)
+            for i, pending in enumerate(self._pending):
+                block[i, list(pending)] = list(pending.values())
+            self._matrix = block if self._matrix is None else np.vstack((self._matrix, block))
+            self._pending = []
+        if self._matrix is None:
+            return []
+        query = np.zeros(_DIM, dtype=np.float32)
+        query[list(vector)] = list(vector.values())
+        return (self._matrix @ query).tolist()
+
+    def search(self, problem: Optional[str], kind: str, prompt_version: Optional[str]) -> Optional[SimilarMatch]:
+        """Best verified match for problem among entries of the same kind/prompt version."""
+        if not problem:
+            return None
+        signature = problem_signature(problem)
+        vector = embed(signature.canonical)
+        with self._lock:
+            self.stats.lookups += 1
+            scores = self._scores(vector)
+            ranked = sorted(
+                (
+                    (score, i) for i, score in enumerate(scores)
+                    if score >= self.threshold
+                    and self._entries[i].kind == kind
+                    and self._entries[i].prompt_version == prompt_version
+                ),
+                reverse=True,
+            )[:self.top_k]
+            for score, i in ranked:
+                entry = self._entries[i]
+                mapping = None
+                if (
+                    entry.signature.numbers == signature.numbers
+                    and entry.signature.math == signature.math
+                    and entry.signature.prose == signature.prose
+                ):
+                    mapping = choice_mapping(entry.signature, signature)
+                if mapping is None:
+                    self.stats.rejected += 1
+                    continue
+                self.stats.hits += 1
+                if mapping:
+                    self.stats.remapped += 1
+                return SimilarMatch(entry.solution_id, min(score, 1.0), mapping)
+        return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "threshold": self.threshold,
+            "backend": "numpy" if np is not None else "python",
+            **asdict(self.stats),
+        }
+
+
+def build_index(rows: Sequence[Tuple[int, str, Optional[str], Optional[str]]], threshold: float = 0.9) -> SimilarityIndex:
+    """Index from (solution_id, kind, prompt_version, problem) rows."""
+    index = SimilarityIndex(threshold=threshold)
+    for solution_id, kind, prompt_version, problem in rows:
+        index.add(solution_id, kind, prompt_version, problem)
+    return index
+
+
+def similarity_enabled() -> bool:
+    return os.getenv("SIMILARITY_ENABLED", "1").lower() not in ("0", "false", "no")
+
+
+def similarity_threshold() -> float:
+    return float(os.getenv("SIMILARITY_THRESHOLD", "0.9"))
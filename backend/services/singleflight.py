@@ -0,0 +1,153 @@
+"""
+Single-flight coalescing of concurrent identical solve requests
+"""
+import asyncio
+import os
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, TypeVar, Any
+
+from services.shared_state import PROCESS_ID, SharedState, get_shared_state
+
+T = TypeVar("T")
+
+
+@dataclass
+class _InFlightCall:
+    task: "asyncio.Task[Any]"
+    waiters: int = 0
+
+
+class SingleFlight:
+    """
+    Run at most one coroutine per key at a time; concurrent callers with the
+    same key await the same underlying task.
+
+    Semantics:
+    - Result and exceptions of the shared task are delivered to every waiter.
+    - A waiter that is cancelled (e.g. client disconnected) only detaches
+      itself; the shared task keeps running for the remaining waiters.
+    - When the last waiter detaches, the shared task is cancelled so we stop
+      paying for a generation nobody is waiting for.
+
+    With a SharedState (multi-worker mode) the local leader also takes a
+    cross-process lease on the key. When another process holds it, the leader
+    waits for that lease to go away and then calls load() (a shared cache
+    read) instead of generating; only if nothing was stored (the other
+    process failed or crashed and its lease expired) does it run fn itself.
+    """
+
+    def __init__(
+        self,
+        shared: Optional[SharedState] = None,
+        lease_seconds: float = 120.0,
+        poll_interval: float = 0.25,
+    ):
+        self._calls: Dict[str, _InFlightCall] = {}
+        self.shared = shared
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.leaders = 0
+        self.followers = 0
+        self.abandoned = 0
+        self.remote_waits = 0
+        self.remote_hits = 0
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[T]],
+        load: Optional[Callable[[], Awaitable[Optional[T]]]] = None,
+    ) -> T:
+        call = self._calls.get(key)
+        if call is None:
+            if self.shared is not None and load is not None:
+                task = asyncio.ensure_future(self._run_shared(key, fn, load))
+            else:
+                task = asyncio.ensure_future(fn())
+            call = _InFlightCall(task=task)
+            self._calls[key] = call
+            task.add_done_callback(lambda _t, key=key, call=call: self._forget(key, call))
+            self.leaders += 1
+        else:
+            self.followers += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                self.abandoned += 1
+                call.task.cancel()
+
+    async def _run_shared(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[T]],
+        load: Callable[[], Awaitable[Optional[T]]],
+    ) -> T:
+        shared = self.shared
+        while True:
+            if await asyncio.to_thread(shared.acquire_lease, key, PROCESS_ID, self.lease_seconds):
+                try:
+                    return await self._run_with_lease(key, fn)
+                finally:
+                    await asyncio.to_thread(shared.release_lease, key, PROCESS_ID)
+
+            # Process khác đang sinh lời giải này: chờ lease kết thúc rồi đọc cache chung
+            self.remote_waits += 1
+            while await asyncio.to_thread(shared.lease_holder, key) not in (None, PROCESS_ID):
+                await asyncio.sleep(self.poll_interval)
+            value = await load()
+            if value is not None:
+                self.remote_hits += 1
+                return value
+
+    async def _run_with_lease(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run fn, renewing the lease so a long generation is not taken over."""
+        task = asyncio.ensure_future(fn())
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=self.lease_seconds / 3)
+                if done:
+                    return task.result()
+                await asyncio.to_thread(self.shared.acquire_lease, key, PROCESS_ID, self.lease_seconds)
+        finally:
+            if not task.done():
+                task.cancel()
+
+    def _forget(self, key: str, call: _InFlightCall) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "in_flight": self.in_flight(),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "abandoned": self.abandoned,
+            "shared": self.shared is not None,
+            "remote_waits": self.remote_waits,
+            "remote_hits": self.remote_hits,
+        }
+
+
+_single_flight: Optional[SingleFlight] = None
+
+
+def get_single_flight() -> SingleFlight:
+    """
+    Return the process-wide SingleFlight group used by the solve functions.
+    In multi-worker mode it coordinates with the other processes through
+    SharedState (lease length: SINGLE_FLIGHT_LEASE_SECONDS, default 120).
+    """
+    global _single_flight
+    if _single_flight is None:
+        _single_flight = SingleFlight(
+            shared=get_shared_state(),
+            lease_seconds=float(os.getenv("SINGLE_FLIGHT_LEASE_SECONDS", "120")),
+        )
+    return _single_flight
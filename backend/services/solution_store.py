@@ -0,0 +1,412 @@
+"""
+Persistent solution store
+
+Every validated solution produced by the LLM is recorded with its problem
+fingerprint, SAT metadata, model and token usage. Unlike the solution cache
+(bounded, TTL, keyed by model/effort) the store keeps one row per problem,
+kind, model and prompt version, and is queryable by metadata.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.cache import normalize_problem_text
+from services.similarity import SimilarityIndex, SimilarMatch, build_index, similarity_enabled, similarity_threshold
+
+# Cột có thể lọc qua /solutions (đều có index)
+FILTER_FIELDS = (
+    "subject",
+    "kind",
+    "fingerprint",
+    "skill_domain",
+    "topic",
+    "difficulty_band",
+    "question_type",
+    "model",
+)
+
+_DEFAULT_DB_PATH = ".cache/solution_store.sqlite3"
+
+
+def problem_fingerprint(problem: Optional[str], image_fingerprint: Optional[str] = None) -> str:
+    """Identity of a question independent of model/prompt (normalized text + image hash)."""
+    payload = json.dumps(
+        {"problem": normalize_problem_text(problem), "image": image_fingerprint or ""},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class StoredSolution:
+    subject: str  # "math" | "english"
+    kind: str  # cache kind, e.g. "math", "math:quick", "english"
+    fingerprint: str
+    solution_json: str
+    problem: Optional[str] = None
+    skill_domain: Optional[str] = None
+    topic: Optional[str] = None
+    difficulty_band: Optional[str] = None
+    question_type: Optional[str] = None
+    model: Optional[str] = None
+    reasoning_effort: Optional[str] = None
+    prompt_version: Optional[str] = None
+    usage: Dict[str, int] = field(default_factory=dict)
+    id: Optional[int] = None
+    created_at: Optional[float] = None
+
+    def summary(self) -> Dict[str, Any]:
+        """Row without the solution body (list views)."""
+        data = asdict(self)
+        del data["solution_json"]
+        return data
+
+
+# ==================================================
+# BACKENDS
+# ==================================================
+
+class SolutionStore:
+    """
+    Interface for a solution store backend. Implementations are synchronous;
+    callers in async code run them in a worker thread (see record / lookup).
+    """
+
+    def save(self, record: StoredSolution) -> int:
+        """Insert or update (same fingerprint/kind/model/prompt_version); return row id."""
+        raise NotImplementedError
+
+    def get(self, solution_id: int) -> Optional[StoredSolution]:
+        raise NotImplementedError
+
+    def find(
+        self,
+        fingerprint: str,
+        kind: str,
+        prompt_version: Optional[str] = None,
+    ) -> Optional[StoredSolution]:
+        """Most recent solution for a question."""
+        raise NotImplementedError
+
+    def query(
+        self,
+        filters: Dict[str, Any],
+        limit: int = 20,
+        offset: int = 0,
+    ) -> Tuple[List[StoredSolution], int]:
+        """Page of solutions (newest first) and the total number of matches."""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def problems(self) -> List[Tuple[int, str, Optional[str], str, str]]:
+        """(id, kind, prompt_version, fingerprint, problem) of rows with problem text."""
+        raise NotImplementedError
+
+
+class NullSolutionStore(SolutionStore):
+    """Store that records nothing (SOLUTION_STORE_BACKEND=none)."""
+
+    def save(self, record: StoredSolution) -> int:
+        return 0
+
+    def get(self, solution_id: int) -> Optional[StoredSolution]:
+        return None
+
+    def find(self, fingerprint: str, kind: str, prompt_version: Optional[str] = None) -> Optional[StoredSolution]:
+        return None
+
+    def query(self, filters: Dict[str, Any], limit: int = 20, offset: int = 0) -> Tuple[List[StoredSolution], int]:
+        return [], 0
+
+    def count(self) -> int:
+        return 0
+
+    def problems(self) -> List[Tuple[int, str, Optional[str], str, str]]:
+        return []
+
+
+_COLUMNS = (
+    "id, subject, kind, fingerprint, problem, skill_domain, topic, difficulty_band, "
+    "question_type, model, reasoning_effort, prompt_version, usage, solution, created_at"
+)
+
+
+class SQLiteSolutionStore(SolutionStore):
+    """SQLite backend with indexes on fingerprint and SATMeta fields."""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        # WAL: các worker process cùng ghi một store
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS solutions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                subject TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                problem TEXT,
+                skill_domain TEXT,
+                topic TEXT COLLATE NOCASE,
+                difficulty_band TEXT,
+                question_type TEXT,
+                model TEXT NOT NULL DEFAULT '',
+                reasoning_effort TEXT,
+                prompt_version TEXT NOT NULL DEFAULT '',
+                usage TEXT,
+                solution TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                UNIQUE (fingerprint, kind, model, prompt_version)
+            );
+            CREATE INDEX IF NOT EXISTS idx_solutions_fingerprint ON solutions(fingerprint, kind, created_at);
+            CREATE INDEX IF NOT EXISTS idx_solutions_skill_domain ON solutions(skill_domain, created_at);
+            CREATE INDEX IF NOT EXISTS idx_solutions_topic ON solutions(topic, created_at);
+            CREATE INDEX IF NOT EXISTS idx_solutions_difficulty ON solutions(difficulty_band, created_at);
+            CREATE INDEX IF NOT EXISTS idx_solutions_question_type ON solutions(question_type, created_at);
+            CREATE INDEX IF NOT EXISTS idx_solutions_subject ON solutions(subject, created_at);
+            CREATE INDEX IF NOT EXISTS idx_solutions_created ON solutions(created_at);
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _row(row: Tuple[Any, ...]) -> StoredSolution:
+        (
+            solution_id, subject, kind, fingerprint, problem, skill_domain, topic,
+            difficulty_band, question_type, model, reasoning_effort, prompt_version,
+            usage, solution, created_at,
+        ) = row
+        return StoredSolution(
+            id=solution_id,
+            subject=subject,
+            kind=kind,
+            fingerprint=fingerprint,
+            problem=problem,
+            skill_domain=skill_domain,
+            topic=topic,
+            difficulty_band=difficulty_band,
+            question_type=question_type,
+            model=model or None,
+            reasoning_effort=reasoning_effort,
+            prompt_version=prompt_version or None,
+            usage=json.loads(usage) if usage else {},
+            solution_json=solution,
+            created_at=created_at,
+        )
+
+    def save(self, record: StoredSolution) -> int:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO solutions (
+                    subject, kind, fingerprint, problem, skill_domain, topic, difficulty_band,
+                    question_type, model, reasoning_effort, prompt_version, usage, solution, created_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (fingerprint, kind, model, prompt_version) DO UPDATE SET
+                    problem = excluded.problem,
+                    skill_domain = excluded.skill_domain,
+                    topic = excluded.topic,
+                    difficulty_band = excluded.difficulty_band,
+                    question_type = excluded.question_type,
+                    reasoning_effort = excluded.reasoning_effort,
+                    usage = excluded.usage,
+                    solution = excluded.solution,
+                    created_at = excluded.created_at
+                """,
+                (
+                    record.subject,
+                    record.kind,
+                    record.fingerprint,
+                    record.problem,
+                    record.skill_domain,
+                    record.topic,
+                    record.difficulty_band,
+                    record.question_type,
+                    record.model or "",
+                    record.reasoning_effort,
+                    record.prompt_version or "",
+                    json.dumps(record.usage),
+                    record.solution_json,
+                    now,
+                ),
+            )
+            (solution_id,) = self._conn.execute(
+                "SELECT id FROM solutions "
+                "WHERE fingerprint = ? AND kind = ? AND model = ? AND prompt_version = ?",
+                (record.fingerprint, record.kind, record.model or "", record.prompt_version or ""),
+            ).fetchone()
+            self._conn.commit()
+            return solution_id
+
+    def get(self, solution_id: int) -> Optional[StoredSolution]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM solutions WHERE id = ?", (solution_id,)
+            ).fetchone()
+        return self._row(row) if row else None
+
+    def find(self, fingerprint: str, kind: str, prompt_version: Optional[str] = None) -> Optional[StoredSolution]:
+        sql = f"SELECT {_COLUMNS} FROM solutions WHERE fingerprint = ? AND kind = ?"
+        params: List[Any] = [fingerprint, kind]
+        if prompt_version is not None:
+            sql += " AND prompt_version = ?"
+            params.append(prompt_version)
+        sql += " ORDER BY created_at DESC LIMIT 1"
+        with self._lock:
+            row = self._conn.execute(sql, params).fetchone()
+        return self._row(row) if row else None
+
+    def query(self, filters: Dict[str, Any], limit: int = 20, offset: int = 0) -> Tuple[List[StoredSolution], int]:
+        clauses = []
+        params: List[Any] = []
+        for name in FILTER_FIELDS:
+            value = filters.get(name)
+            if value is not None:
+                clauses.append(f"{name} = ?")
+                params.append(value)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            (total,) = self._conn.execute(f"SELECT COUNT(*) FROM solutions{where}", params).fetchone()
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM solutions{where} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+                [*params, limit, offset],
+            ).fetchall()
+        return [self._row(row) for row in rows], total
+
+    def count(self) -> int:
+        with self._lock:
+            (total,) = self._conn.execute("SELECT COUNT(*) FROM solutions").fetchone()
+            return total
+
+    def problems(self) -> List[Tuple[int, str, Optional[str], str, str]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, kind, prompt_version, fingerprint, problem FROM solutions "
+                "WHERE problem IS NOT NULL AND problem != '' ORDER BY id"
+            ).fetchall()
+        return [
+            (solution_id, kind, prompt_version or None, fingerprint, problem)
+            for solution_id, kind, prompt_version, fingerprint, problem in rows
+        ]
+
+
+# ==================================================
+# ASYNC HELPERS
+# ==================================================
+
+def _text_only(fingerprint: str, problem: Optional[str]) -> bool:
+    # Đề có ảnh không so khớp gần đúng (ảnh có thể khác dù text giống)
+    return bool(problem) and fingerprint == problem_fingerprint(problem)
+
+
+async def record_solution(record: StoredSolution) -> Optional[int]:
+    """Persist a solution off the event loop; storage errors never fail the request."""
+    try:
+        solution_id = await asyncio.to_thread(get_solution_store().save, record)
+    except sqlite3.Error as e:
+        print(f"Solution store write failed: {e}")
+        return None
+    if _similarity_index is not None and solution_id and _text_only(record.fingerprint, record.problem):
+        _similarity_index.add(solution_id, record.kind, record.prompt_version, record.problem)
+    return solution_id
+
+
+async def lookup_solution(fingerprint: str, kind: str, prompt_version: Optional[str] = None) -> Optional[StoredSolution]:
+    try:
+        return await asyncio.to_thread(get_solution_store().find, fingerprint, kind, prompt_version)
+    except sqlite3.Error as e:
+        print(f"Solution store read failed: {e}")
+        return None
+
+
+async def load_solution(solution_id: int) -> Optional[StoredSolution]:
+    try:
+        return await asyncio.to_thread(get_solution_store().get, solution_id)
+    except sqlite3.Error as e:
+        print(f"Solution store read failed: {e}")
+        return None
+
+
+async def find_similar(
+    problem: Optional[str],
+    kind: str,
+    prompt_version: Optional[str] = None,
+) -> Optional[Tuple[StoredSolution, SimilarMatch]]:
+    """
+    Near-duplicate of a text-only problem in the store (see services/similarity.py),
+    with the stored -> incoming choice letter mapping.
+    """
+    if not problem or not similarity_enabled():
+        return None
+    try:
+        index = await asyncio.to_thread(get_similarity_index)
+    except sqlite3.Error as e:
+        print(f"Similarity index build failed: {e}")
+        return None
+    match = await asyncio.to_thread(index.search, problem, kind, prompt_version)
+    if match is None:
+        return None
+    stored = await load_solution(match.solution_id)
+    return (stored, match) if stored is not None else None
+
+
+_solution_store: Optional[SolutionStore] = None
+_similarity_index: Optional[SimilarityIndex] = None
+_similarity_lock = threading.Lock()
+
+
+def get_solution_store() -> SolutionStore:
+    """
+    Return the process-wide store, configured from environment:
+
+    - SOLUTION_STORE_BACKEND ("sqlite" default, "none" disables recording)
+    - SOLUTION_STORE_DB_PATH (default .cache/solution_store.sqlite3)
+    """
+    global _solution_store
+    if _solution_store is None:
+        backend = os.getenv("SOLUTION_STORE_BACKEND", "sqlite").lower()
+        if backend in ("none", "0", "false", "no"):
+            _solution_store = NullSolutionStore()
+        elif backend == "sqlite":
+            _solution_store = SQLiteSolutionStore(os.getenv("SOLUTION_STORE_DB_PATH") or _DEFAULT_DB_PATH)
+        else:
+            raise ValueError(f"Unknown SOLUTION_STORE_BACKEND: {backend}")
+    return _solution_store
+
+
+def set_solution_store(store: SolutionStore) -> None:
+    """Install a custom backend (call before the app starts serving)."""
+    global _solution_store, _similarity_index
+    _solution_store = store
+    _similarity_index = None
+
+
+def get_similarity_index() -> SimilarityIndex:
+    """
+    Process-wide near-duplicate index, built from the store on first use and
+    kept up to date by record_solution. SIMILARITY_THRESHOLD sets the cosine cutoff.
+    """
+    global _similarity_index
+    with _similarity_lock:
+        if _similarity_index is None:
+            rows = [
+                (solution_id, kind, prompt_version, problem)
+                for solution_id, kind, prompt_version, fingerprint, problem in get_solution_store().problems()
+                if _text_only(fingerprint, problem)
+            ]
+            _similarity_index = build_index(rows, threshold=similarity_threshold())
+        return _similarity_index
@@ -0,0 +1,160 @@
+"""
+Incremental JSON parsing for streamed LLM output
+
+The model streams one top-level JSON object. IncrementalJSONParser scans the
+text as it arrives and reports each top-level field as soon as its value is
+complete, and each element of selected array fields (e.g. solution_paths)
+as soon as that element is complete, so the API can forward them as
+Server-Sent Events before the whole response is generated.
+"""
+import json
+from typing import Any, Iterable, List, Optional, Tuple
+
+# (event, payload)
+#   ("field", {"name": <key>, "value": <value>})
+#   ("item", {"name": <array key>, "index": <i>, "value": <element>})
+ParseEvent = Tuple[str, dict]
+
+_WHITESPACE = " \t\r\n"
+
+
+class IncrementalJSONParser:
+    """
+    Streaming scanner for a single top-level JSON object.
+
+    Only structural characters are tracked (depth, strings, escapes); values
+    are decoded with json.loads once their extent is known, so the cost is a
+    single pass over the text plus one decode per emitted value.
+    """
+
+    def __init__(self, array_fields: Iterable[str] = ()):
+        self.array_fields = set(array_fields)
+        self._buffer = ""
+        self._pos = 0
+
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+        # State at depth 1 (inside the top-level object)
+        self._expect_key = True
+        self._key_start: Optional[int] = None
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+
+        # State at depth 2 inside an array field
+        self._in_array = False
+        self._item_start: Optional[int] = None
+        self._item_index = 0
+
+    @property
+    def text(self) -> str:
+        """Full text received so far."""
+        return self._buffer
+
+    def feed(self, chunk: str) -> List[ParseEvent]:
+        """Append a chunk and return the events completed by it."""
+        if not chunk:
+            return []
+        self._buffer += chunk
+        events: List[ParseEvent] = []
+        buf = self._buffer
+
+        for i in range(self._pos, len(buf)):
+            c = buf[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect_key and self._key_start is not None:
+                        self._key = json.loads(buf[self._key_start:i + 1])
+                        self._key_start = None
+                continue
+
+            if c in _WHITESPACE:
+                continue
+
+            if c == '"':
+                self._in_string = True
+                self._mark_value_start(i)
+                if self._depth == 1 and self._expect_key:
+                    self._key_start = i
+                continue
+
+            if c in "{[":
+                self._mark_value_start(i)
+                if (
+                    self._depth == 1
+                    and c == "["
+                    and self._value_start == i
+                    and self._key in self.array_fields
+                ):
+                    self._in_array = True
+                    self._item_index = 0
+                self._depth += 1
+                continue
+
+            if c in "}]":
+                if self._in_array and self._depth == 2 and c == "]":
+                    self._emit_item(i, events)
+                    self._in_array = False
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit_field(i, events)
+                continue
+
+            if c == ":":
+                if self._depth == 1:
+                    self._expect_key = False
+                continue
+
+            if c == ",":
+                if self._depth == 1:
+                    self._emit_field(i, events)
+                elif self._depth == 2 and self._in_array:
+                    self._emit_item(i, events)
+                continue
+
+            # Scalar literal (number, true, false, null)
+            self._mark_value_start(i)
+
+        self._pos = len(buf)
+        return events
+
+    def _mark_value_start(self, i: int) -> None:
+        if self._depth == 1 and not self._expect_key and self._value_start is None:
+            self._value_start = i
+        elif self._depth == 2 and self._in_array and self._item_start is None:
+            self._item_start = i
+
+    def _emit_item(self, end: int, events: List[ParseEvent]) -> None:
+        if self._item_start is None:
+            return
+        raw = self._buffer[self._item_start:end]
+        self._item_start = None
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            return
+        events.append(("item", {"name": self._key, "index": self._item_index, "value": value}))
+        self._item_index += 1
+
+    def _emit_field(self, end: int, events: List[ParseEvent]) -> None:
+        key, start = self._key, self._value_start
+        self._expect_key = True
+        self._key = None
+        self._value_start = None
+        if key is None or start is None:
+            return
+        # Elements were already reported one by one
+        if key in self.array_fields:
+            return
+        try:
+            value = json.loads(self._buffer[start:end])
+        except json.JSONDecodeError:
+            return
+        events.append(("field", {"name": key, "value": value}))
@@ -0,0 +1,236 @@
+"""
+Per-request tracing
+
+Every HTTP request gets a RequestTrace (ASGI middleware) that the service
+layer fills in through a context variable: time spent in each stage (queue
+wait, image preprocessing, prompt build, JSON parse + validation) and every
+upstream LLM call (model, total time, time to first token, tokens, cost).
+Stages and calls feed the Prometheus histograms served by GET /metrics; with
+REQUEST_TRACE_LOG=1 each finished request is also printed as one JSON line.
+"""
+import functools
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+from services.metrics import get_metrics_registry, get_usage_metrics, usage_cost
+from services.serialization import dumps
+
+T = TypeVar("T")
+
+REQUEST_TRACE_LOG = os.getenv("REQUEST_TRACE_LOG", "0").lower() in ("1", "true", "yes")
+
+# Endpoint của công việc chạy ngoài HTTP request (precompute, task nền)
+INTERNAL_ENDPOINT = "internal"
+
+_registry = get_metrics_registry()
+REQUEST_SECONDS = _registry.histogram(
+    "sat_request_duration_seconds",
+    "End-to-end request time, including streamed bodies",
+    ("endpoint", "method", "status"),
+)
+STAGE_SECONDS = _registry.histogram(
+    "sat_stage_duration_seconds",
+    "Time spent in a server-side stage of a request",
+    ("endpoint", "stage"),
+)
+LLM_CALL_SECONDS = _registry.histogram(
+    "sat_llm_call_duration_seconds",
+    "Upstream LLM call time (until the last chunk for streamed calls)",
+    ("endpoint", "model"),
+)
+LLM_TTFT_SECONDS = _registry.histogram(
+    "sat_llm_time_to_first_token_seconds",
+    "Upstream time to first streamed token",
+    ("endpoint", "model"),
+)
+LLM_TOKENS = _registry.counter(
+    "sat_llm_tokens_total",
+    "LLM tokens by type (prompt, completion, cached)",
+    ("endpoint", "model", "type"),
+)
+LLM_COST = _registry.counter(
+    "sat_llm_cost_usd_total",
+    "Estimated LLM cost in USD (LiteLLM price table)",
+    ("endpoint", "model"),
+)
+
+
+@dataclass
+class LLMCallTrace:
+    model: str
+    seconds: float
+    ttft_seconds: Optional[float] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    cost_usd: Optional[float] = None
+
+
+@dataclass
+class RequestTrace:
+    request_id: str
+    endpoint: str
+    method: str = ""
+    started: float = field(default_factory=time.monotonic)
+    status: Optional[int] = None
+    duration_seconds: Optional[float] = None
+    # Tổng thời gian theo stage (một stage có thể chạy nhiều lần, ví dụ pipeline)
+    stages: Dict[str, float] = field(default_factory=dict)
+    llm_calls: List[LLMCallTrace] = field(default_factory=list)
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def finish(self, status: int) -> None:
+        self.status = status
+        self.duration_seconds = time.monotonic() - self.started
+        REQUEST_SECONDS.observe(
+            self.duration_seconds, endpoint=self.endpoint, method=self.method, status=str(status)
+        )
+        if REQUEST_TRACE_LOG:
+            print(dumps({"trace": asdict(self)}))
+
+    def server_timing(self) -> str:
+        """Server-Timing header value (ms) for the stages recorded so far."""
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        upstream = sum(call.seconds for call in self.llm_calls)
+        if self.llm_calls:
+            parts.append(f"llm;dur={upstream * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def _endpoint() -> str:
+    trace = _current_trace.get()
+    return trace.endpoint if trace is not None else INTERNAL_ENDPOINT
+
+
+def record_stage(name: str, seconds: float) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_stage(name, seconds)
+    STAGE_SECONDS.observe(seconds, endpoint=_endpoint(), stage=name)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a block as a named stage of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def traced_stage(name: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """Decorator form of stage() for synchronous functions."""
+    def decorator(fn: Callable[..., T]) -> Callable[..., T]:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> T:
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_llm_call(
+    model: str,
+    seconds: float,
+    usage: Any,
+    ttft_seconds: Optional[float] = None,
+) -> Dict[str, int]:
+    """
+    Record one upstream call: usage counters (see UsageMetrics), Prometheus
+    histograms/counters and the current request trace. Returns token counts.
+    """
+    tokens = get_usage_metrics().record(usage)
+    cost = usage_cost(model, tokens) if usage is not None else None
+    endpoint = _endpoint()
+    LLM_CALL_SECONDS.observe(seconds, endpoint=endpoint, model=model)
+    if ttft_seconds is not None:
+        LLM_TTFT_SECONDS.observe(ttft_seconds, endpoint=endpoint, model=model)
+    for kind in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+        if tokens[kind]:
+            LLM_TOKENS.inc(tokens[kind], endpoint=endpoint, model=model, type=kind[: -len("_tokens")])
+    if cost:
+        LLM_COST.inc(cost, endpoint=endpoint, model=model)
+
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.llm_calls.append(
+            LLMCallTrace(
+                model=model,
+                seconds=seconds,
+                ttft_seconds=ttft_seconds,
+                prompt_tokens=tokens["prompt_tokens"],
+                completion_tokens=tokens["completion_tokens"],
+                cached_tokens=tokens["cached_tokens"],
+                cost_usd=cost,
+            )
+        )
+    return tokens
+
+
+class TracingMiddleware:
+    """
+    Pure ASGI middleware (BaseHTTPMiddleware would stop timing before a
+    streamed body ends). The endpoint label is the matched route template,
+    e.g. /solve/{solution_id}/paths/{path_id}, to keep label cardinality low.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    @staticmethod
+    def _route_path(scope: Dict[str, Any]) -> str:
+        from starlette.routing import Match
+
+        app = scope.get("app")
+        for route in getattr(getattr(app, "router", None), "routes", ()):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", scope["path"])
+        return "unmatched"
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = dict(scope.get("headers") or ()).get(b"x-request-id", b"").decode("latin-1")
+        trace = RequestTrace(
+            request_id=request_id or uuid.uuid4().hex,
+            endpoint=self._route_path(scope),
+            method=scope.get("method", ""),
+        )
+        token = _current_trace.set(trace)
+        status = 500
+
+        async def _send(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers") or [])
+                headers.append((b"x-request-id", trace.request_id.encode("latin-1")))
+                timing = trace.server_timing()
+                if timing:
+                    headers.append((b"server-timing", timing.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            trace.finish(status)
+            _current_trace.reset(token)
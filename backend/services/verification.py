@@ -0,0 +1,700 @@
+"""
+Deterministic answer verification for SAT Math solutions
+
+The model's conclusion is checked locally with SymPy before a solution is
+cached or stored:
+
+- arithmetic: formulas, intermediate results and Desmos expressions with no
+  unknowns must evaluate to equal sides (≈ within the precision written),
+- substitution: values the path assigns (x = 4 in a step or the final
+  answer) must satisfy the path's equations in those unknowns,
+- answer: final_answer follows answer_spec (answer_format, rounding,
+  max_chars) and agrees with correct_choice / the correct choice's value,
+- agreement: all paths reach the same answer.
+
+Checks are conservative: anything that cannot be parsed (prose, inequalities,
+±, intervals) is skipped, never failed. Each check group runs in a process
+pool with its own timeout so a pathological expression cannot stall the
+event loop; a timeout counts as skipped. Only failed checks trigger a
+regeneration (see llm_service).
+
+SymPy is optional: without it verification is disabled.
+"""
+import asyncio
+import importlib.util
+import itertools
+import math
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from services.tracing import stage
+
+PASSED = "passed"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+CHOICE_LETTERS = ("A", "B", "C", "D")
+
+
+@dataclass
+class CheckResult:
+    check: str
+    status: str
+    detail: str = ""
+    path_id: Optional[str] = None
+    step_id: Optional[int] = None
+
+
+@dataclass
+class VerificationReport:
+    checks: List[CheckResult] = field(default_factory=list)
+
+    @property
+    def failed(self) -> List[CheckResult]:
+        return [check for check in self.checks if check.status == FAILED]
+
+    @property
+    def passed(self) -> bool:
+        return not self.failed
+
+    def count(self, status: str) -> int:
+        return sum(1 for check in self.checks if check.status == status)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "passed": self.count(PASSED),
+            "failed": [asdict(check) for check in self.failed],
+            "skipped": self.count(SKIPPED),
+        }
+
+
+# ==================================================
+# LATEX -> SYMPY (chạy trong worker process)
+# ==================================================
+
+class _Unsupported(ValueError):
+    """Text that is not a checkable formula (prose, inequality, set, ...)."""
+
+
+_FUNCTIONS = ("sin", "cos", "tan", "ln", "log", "exp")
+_ALLOWED_NAMES = set(_FUNCTIONS) | {"sqrt", "root", "pi"}
+_DROPPED_COMMANDS = {"left", "right", "displaystyle", "quad", "qquad", "limits"}
+_TEXT_COMMANDS = {"text", "mathrm", "textrm", "mbox", "textbf", "mathbf", "operatorname"}
+_UNICODE = {
+    "−": "-", "–": "-", "×": "*", "·": "*", "÷": "/", "π": "\\pi ",
+    "²": "^2", "³": "^3", "≈": "\\approx ", "\u00a0": " ",
+}
+_THOUSANDS = re.compile(r"(?<=\d),(?=\d{3}(?!\d))")
+_NAME = re.compile(r"[A-Za-z]+")
+_DECIMAL_LITERAL = re.compile(r"^\s*-?\d+\.(\d+)\s*$")
+# Tiền tố lựa chọn "B)", "(B)", "B.", "B:"
+_CHOICE_PREFIX = re.compile(r"^\s*\(?([A-D])(?:\)|\.|:)\s*")
+_CHOICE_LETTER = re.compile(r"(?<![A-Za-z])([A-D])(?![A-Za-z])")
+_MAX_FORMULA_CHARS = 300
+_RELATION_COMMAND = re.compile(r"\\(?:pm|mp|le|leq|ge|geq|lt|gt|ne|neq|in|notin|subset|cup|cap)(?![A-Za-z])")
+
+
+def _read_group(text: str, i: int) -> Tuple[str, int]:
+    """Read a {...} group (or one character) starting at text[i]."""
+    while i < len(text) and text[i] == " ":
+        i += 1
+    if i >= len(text):
+        raise _Unsupported("missing argument")
+    if text[i] != "{":
+        if text[i] == "\\":
+            match = re.match(r"\\[A-Za-z]+", text[i:])
+            if match:
+                return match.group(0), i + len(match.group(0))
+        return text[i], i + 1
+    depth = 0
+    for j in range(i, len(text)):
+        if text[j] == "{":
+            depth += 1
+        elif text[j] == "}":
+            depth -= 1
+            if depth == 0:
+                return text[i + 1:j], j + 1
+    raise _Unsupported("unbalanced braces")
+
+
+def latex_to_expression(text: str) -> str:
+    """Convert SAT-style LaTeX to a SymPy-parsable string (relations kept as '=' / '≈')."""
+    out: List[str] = []
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == "\\":
+            match = re.match(r"\\([A-Za-z]+)", text[i:])
+            if match is None:
+                symbol = text[i + 1:i + 2]
+                i += 2
+                if symbol == "%":
+                    out.append("*(1/100)")
+                elif symbol in ("{", "}"):
+                    out.append("(" if symbol == "{" else ")")
+                elif symbol not in (",", ";", "!", " ", ":"):
+                    raise _Unsupported(f"\\{symbol}")
+                continue
+            name = match.group(1)
+            i += len(match.group(0))
+            if name in ("frac", "dfrac", "tfrac"):
+                numerator, i = _read_group(text, i)
+                denominator, i = _read_group(text, i)
+                out.append(f"(({latex_to_expression(numerator)})/({latex_to_expression(denominator)}))")
+            elif name == "sqrt":
+                degree = None
+                if text[i:i + 1] == "[":
+                    end = text.find("]", i)
+                    if end < 0:
+                        raise _Unsupported("unbalanced sqrt")
+                    degree, i = text[i + 1:end], end + 1
+                radicand, i = _read_group(text, i)
+                if degree is None:
+                    out.append(f"sqrt({latex_to_expression(radicand)})")
+                else:
+                    out.append(f"root({latex_to_expression(radicand)}, {latex_to_expression(degree)})")
+            elif name in _FUNCTIONS:
+                out.append(f" {name}")
+            elif name == "pi":
+                out.append(" pi ")
+            elif name in ("cdot", "times"):
+                out.append("*")
+            elif name == "div":
+                out.append("/")
+            elif name == "approx":
+                out.append("≈")
+            elif name in _DROPPED_COMMANDS:
+                continue
+            elif name in _TEXT_COMMANDS:
+                # Đơn vị / chú thích trong \text{...} không tham gia tính toán
+                _, i = _read_group(text, i)
+                out.append(" ")
+            else:
+                raise _Unsupported(f"\\{name}")
+        elif char == "{":
+            out.append("(")
+            i += 1
+        elif char == "}":
+            out.append(")")
+            i += 1
+        elif char == "^":
+            out.append("**")
+            i += 1
+        elif char == "_":
+            subscript, i = _read_group(text, i + 1)
+            if not subscript.isalnum():
+                raise _Unsupported("subscript")
+            out.append("_" + subscript)
+        elif char == "%":
+            out.append("*(1/100)")
+            i += 1
+        else:
+            out.append(char)
+            i += 1
+    return "".join(out)
+
+
+def _sympy() -> Any:
+    import sympy
+
+    return sympy
+
+
+_PARSE_CONTEXT: Optional[Tuple[Any, Dict[str, Any]]] = None
+
+
+def _parse_context() -> Tuple[Any, Dict[str, Any]]:
+    global _PARSE_CONTEXT
+    if _PARSE_CONTEXT is None:
+        sympy = _sympy()
+        from sympy.parsing.sympy_parser import (
+            convert_xor,
+            implicit_multiplication_application,
+            standard_transformations,
+        )
+
+        transformations = standard_transformations + (implicit_multiplication_application, convert_xor)
+        # E, I, N, S, Q, O là hằng/hàm của SymPy; trong đề bài chúng là biến
+        local_dict: Dict[str, Any] = {name: sympy.Symbol(name) for name in "EINSQOC"}
+        local_dict.update({"e": sympy.Symbol("e"), "pi": sympy.pi, "ln": sympy.log})
+        _PARSE_CONTEXT = (transformations, local_dict)
+    return _PARSE_CONTEXT
+
+
+def parse_side(expression: str) -> Any:
+    from sympy.parsing.sympy_parser import parse_expr
+
+    expression = expression.strip()
+    if not expression:
+        raise _Unsupported("empty side")
+    for name in _NAME.findall(expression):
+        # Chữ dài hơn 2 ký tự không phải hàm đã biết: đây là câu chữ, không phải công thức
+        if len(name) > 2 and name not in _ALLOWED_NAMES:
+            raise _Unsupported(f"word {name!r}")
+    transformations, local_dict = _parse_context()
+    try:
+        return parse_expr(expression, local_dict=dict(local_dict), transformations=transformations, evaluate=True)
+    except Exception as e:
+        raise _Unsupported(f"parse error: {e}") from None
+
+
+def parse_relation(text: str) -> Tuple[List[Any], List[str], List[str]]:
+    """
+    Parse 'a = b ≈ c' into ([a, b, c], ['=', '≈'], [raw a, raw b, raw c]).
+    Raises _Unsupported for anything that is not a chain of equalities.
+    """
+    if not text or len(text) > _MAX_FORMULA_CHARS:
+        raise _Unsupported("empty or too long")
+    for source, target in _UNICODE.items():
+        text = text.replace(source, target)
+    text = text.strip().strip("$").replace("\\(", "").replace("\\)", "").replace("\\[", "").replace("\\]", "")
+    text = _THOUSANDS.sub("", text)
+    if any(mark in text for mark in (",", "<", ">", "≤", "≥", "≠", "|", "→", "⇒")) or _RELATION_COMMAND.search(text):
+        raise _Unsupported("not an equality")
+    expression = latex_to_expression(text)
+    if re.search(r"[^\x00-\x7f≈]", expression):
+        raise _Unsupported("non-ASCII text")
+    if re.search(r"[<>!]|==", expression):
+        raise _Unsupported("not an equality")
+    parts = re.split(r"(=|≈)", expression)
+    raw_sides = parts[0::2]
+    relations = parts[1::2]
+    return [parse_side(side) for side in raw_sides], relations, raw_sides
+
+
+def _number(expr: Any) -> Optional[float]:
+    """Real value of a closed expression, None when it has unknowns or is not real."""
+    if expr.free_symbols:
+        return None
+    try:
+        value = complex(_sympy().N(expr, 20))
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    if math.isnan(value.real) or math.isinf(value.real) or abs(value.imag) > 1e-9:
+        return None
+    return value.real
+
+
+def _decimals(raw: str) -> Optional[int]:
+    match = _DECIMAL_LITERAL.match(raw)
+    return len(match.group(1)) if match else None
+
+
+def _within_rounding(a: float, b: float, places: int) -> bool:
+    """b is a rounded to places decimals (either half-way convention)."""
+    return abs(a - b) <= 0.5 * 10 ** (-places) * 1.001 + 1e-12
+
+
+def _close(a: float, b: float, relation: str, raw_sides: Sequence[str]) -> bool:
+    if math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9):
+        return True
+    # "≈ 3.14" (hoặc viết "= 0.33" cho 1/3): đúng nếu sai số không quá nửa đơn vị chữ số cuối
+    places = [d for d in (_decimals(raw) for raw in raw_sides) if d is not None]
+    if places:
+        return _within_rounding(a, b, min(places))
+    return relation == "≈" and math.isclose(a, b, rel_tol=1e-2, abs_tol=1e-2)
+
+
+# ==================================================
+# CHECKS (chạy trong worker process, input là dict JSON)
+# ==================================================
+
+def _path_formulas(path: Dict[str, Any]) -> List[Tuple[Optional[int], str]]:
+    """(step_id, text) for every formula, intermediate result and Desmos expression of a path."""
+    items: List[Tuple[Optional[int], str]] = []
+    for step in path.get("steps") or []:
+        step_id = step.get("step_id")
+        items.extend((step_id, formula) for formula in step.get("formulas") or [])
+        if step.get("intermediate_result"):
+            items.append((step_id, step["intermediate_result"]))
+        desmos = step.get("desmos") or {}
+        items.extend((step_id, expression) for expression in desmos.get("expressions") or [])
+    overview = path.get("desmos_overview") or {}
+    items.extend((None, expression) for expression in overview.get("expressions") or [])
+    return items
+
+
+def check_arithmetic(path: Dict[str, Any]) -> List[CheckResult]:
+    """Relations without unknowns must hold numerically."""
+    results: List[CheckResult] = []
+    for step_id, text in _path_formulas(path):
+        try:
+            sides, relations, raw_sides = parse_relation(text)
+        except _Unsupported:
+            continue
+        if len(sides) < 2:
+            continue
+        values = [_number(side) for side in sides]
+        if any(value is None for value in values):
+            continue
+        for index, relation in enumerate(relations):
+            a, b = values[index], values[index + 1]
+            if not _close(a, b, relation, raw_sides[index:index + 2]):
+                results.append(CheckResult(
+                    "arithmetic", FAILED, f"`{text}`: {a:g} ≠ {b:g}", path.get("path_id"), step_id,
+                ))
+                break
+        else:
+            results.append(CheckResult("arithmetic", PASSED, text, path.get("path_id"), step_id))
+    return results
+
+
+def _assignment(sides: List[Any], relations: List[str]) -> Optional[Tuple[Any, float]]:
+    """'x = 4' (either order) -> (x, 4.0)."""
+    if len(sides) != 2 or relations != ["="]:
+        return None
+    sympy = _sympy()
+    for symbol, value in ((sides[0], sides[1]), (sides[1], sides[0])):
+        if isinstance(symbol, sympy.Symbol):
+            number = _number(value)
+            if number is not None:
+                return symbol, number
+    return None
+
+
+def check_substitution(path: Dict[str, Any]) -> List[CheckResult]:
+    """Values the path assigns to unknowns must satisfy its equations in those unknowns."""
+    relations_list: List[Tuple[Optional[int], str, List[Any], List[str]]] = []
+    assigned: Dict[Any, List[float]] = {}
+    final_answer = (path.get("conclusion") or {}).get("final_answer") or ""
+    for step_id, text in _path_formulas(path) + [(None, final_answer)]:
+        try:
+            sides, relations, _ = parse_relation(text)
+        except _Unsupported:
+            continue
+        assignment = _assignment(sides, relations)
+        if assignment is not None:
+            symbol, value = assignment
+            values = assigned.setdefault(symbol, [])
+            if not any(math.isclose(value, known, rel_tol=1e-9, abs_tol=1e-9) for known in values):
+                values.append(value)
+            continue
+        if len(sides) >= 2 and "≈" not in relations:
+            relations_list.append((step_id, text, sides, relations))
+
+    results: List[CheckResult] = []
+    for step_id, text, sides, relations in relations_list:
+        symbols = set().union(*(side.free_symbols for side in sides))
+        if not symbols or not symbols.issubset(assigned):
+            continue
+        ordered = sorted(symbols, key=str)
+        combinations = list(itertools.islice(itertools.product(*(assigned[s] for s in ordered)), 32))
+        satisfied = False
+        for combination in combinations:
+            substitution = dict(zip(ordered, combination))
+            values = [_number(side.subs(substitution)) for side in sides]
+            if any(value is None for value in values):
+                satisfied = True  # không tính được (chia 0, số phức): không kết luận
+                break
+            if all(math.isclose(a, b, rel_tol=1e-6, abs_tol=1e-6) for a, b in zip(values, values[1:])):
+                satisfied = True
+                break
+        if satisfied:
+            results.append(CheckResult("substitution", PASSED, text, path.get("path_id"), step_id))
+        else:
+            shown = ", ".join(f"{s} = {', '.join(f'{v:g}' for v in assigned[s])}" for s in ordered)
+            results.append(CheckResult(
+                "substitution", FAILED, f"`{text}` does not hold for {shown}", path.get("path_id"), step_id,
+            ))
+    return results
+
+
+def _strip_answer(text: str, units: Optional[str] = None) -> str:
+    text = (text or "").strip().strip("$").strip()
+    text = re.sub(r"\\(?:text|mathrm|textrm|mbox)\{[^{}]*\}", " ", text)
+    if units:
+        text = text.replace(units, " ")
+    return text.strip().rstrip(".").strip()
+
+
+def answer_value(text: str, units: Optional[str] = None) -> Tuple[Optional[str], str, Optional[float]]:
+    """
+    Split a final answer / choice text into (choice letter, value text, value):
+    "B) 12" -> ("B", "12", 12.0); "x = \\frac{7}{2}" -> (None, "\\frac{7}{2}", 3.5).
+    """
+    text = _strip_answer(text, units)
+    letter = None
+    prefix = _CHOICE_PREFIX.match(text)
+    if prefix:
+        letter, text = prefix.group(1), text[prefix.end():]
+    elif text in CHOICE_LETTERS:
+        return text, "", None
+    raw = text.split("=")[-1].strip() if "=" in text else text
+    try:
+        sides, _, _ = parse_relation(raw)
+        value = _number(sides[-1]) if len(sides) == 1 else None
+    except _Unsupported:
+        value = None
+    return letter, raw, value
+
+
+def _grid_in_text(raw: str) -> str:
+    """How the answer would be typed in the grid: \\frac{7}{2} -> 7/2."""
+    match = re.fullmatch(r"(-?)\s*\\[dt]?frac\{(\d+)\}\{(\d+)\}", raw)
+    if match:
+        return f"{match.group(1)}{match.group(2)}/{match.group(3)}"
+    return raw.replace(" ", "")
+
+
+def check_answer(path: Dict[str, Any], spec: Dict[str, Any]) -> List[CheckResult]:
+    """final_answer against answer_spec: format, rounding, max_chars and correct choice."""
+    path_id = path.get("path_id")
+    conclusion = path.get("conclusion") or {}
+    final_answer = conclusion.get("final_answer") or ""
+    results: List[CheckResult] = []
+
+    def _result(check: str, ok: bool, detail: str) -> None:
+        results.append(CheckResult(check, PASSED if ok else FAILED, detail, path_id))
+
+    letter, raw, value = answer_value(final_answer, spec.get("units"))
+    grid = _grid_in_text(raw)
+    simple_grid = re.fullmatch(r"-?\d*\.?\d+(?:/\d+)?", grid) is not None
+
+    answer_format = spec.get("answer_format")
+    if answer_format and value is not None and simple_grid:
+        if answer_format == "integer":
+            _result("answer_format", "/" not in grid and float(value).is_integer(),
+                    f"final answer {raw!r} should be an integer")
+        elif answer_format == "fraction":
+            _result("answer_format", "." not in grid, f"final answer {raw!r} should be a fraction")
+        elif answer_format == "decimal":
+            _result("answer_format", "/" not in grid or float(value).is_integer(),
+                    f"final answer {raw!r} should be a decimal")
+
+    max_chars = spec.get("max_chars")
+    if max_chars and simple_grid:
+        _result("max_chars", len(grid) <= max_chars, f"final answer {grid!r} is longer than {max_chars} characters")
+
+    rounding = spec.get("rounding")
+    places = {"nearest_tenth": 1, "nearest_hundredth": 2}.get(rounding or "")
+    if places is not None:
+        decimals = _decimals(grid)
+        if decimals is not None:
+            _result("rounding", decimals <= places, f"final answer {raw!r} is not rounded to {rounding}")
+        approximation = conclusion.get("approximation")
+        if approximation and value is not None:
+            _, _, approx_value = answer_value(approximation, spec.get("units"))
+            if approx_value is not None:
+                _result(
+                    "rounding",
+                    _within_rounding(value, approx_value, places),
+                    f"approximation {approximation!r} is not {value:g} rounded to {rounding}",
+                )
+
+    correct_choice = spec.get("correct_choice")
+    path_spec = conclusion.get("answer_spec") or {}
+    if correct_choice and path_spec.get("correct_choice") and path_spec["correct_choice"] != correct_choice:
+        _result("choice", False, f"conclusion answer_spec picks {path_spec['correct_choice']}, expected {correct_choice}")
+    if correct_choice:
+        if letter is None:
+            found = set(_CHOICE_LETTER.findall(_strip_answer(final_answer)))
+            letter = found.pop() if len(found) == 1 and len(_strip_answer(final_answer)) <= 3 else None
+        if letter is not None:
+            _result("choice", letter == correct_choice, f"final answer picks {letter}, answer_spec says {correct_choice}")
+        choices = spec.get("choices") or []
+        if value is not None and len(choices) == len(CHOICE_LETTERS):
+            choice_values = [answer_value(choice, spec.get("units"))[2] for choice in choices]
+            if all(choice_value is not None for choice_value in choice_values):
+                matching = [
+                    CHOICE_LETTERS[index] for index, choice_value in enumerate(choice_values)
+                    if math.isclose(choice_value, value, rel_tol=1e-6, abs_tol=1e-9)
+                ]
+                _result(
+                    "choice",
+                    correct_choice in matching,
+                    f"final answer {raw!r} matches choice(s) {matching or 'none'}, answer_spec says {correct_choice}",
+                )
+    return results
+
+
+def check_agreement(paths: List[Dict[str, Any]], spec: Dict[str, Any]) -> List[CheckResult]:
+    """All paths of a solution must reach the same answer."""
+    answers: Dict[str, Any] = {}
+    for path in paths:
+        letter, _, value = answer_value((path.get("conclusion") or {}).get("final_answer") or "", spec.get("units"))
+        key = value if value is not None else letter
+        if key is not None:
+            answers[path.get("path_id")] = key
+    if len(answers) < 2:
+        return []
+    values = list(answers.values())
+    numeric = all(isinstance(value, float) for value in values)
+    agree = all(
+        math.isclose(a, values[0], rel_tol=1e-6, abs_tol=1e-9) if numeric else a == values[0]
+        for a in values
+    )
+    shown = ", ".join(f"{path_id}: {value:g}" if isinstance(value, float) else f"{path_id}: {value}"
+                      for path_id, value in answers.items())
+    return [CheckResult("agreement", PASSED if agree else FAILED, f"paths disagree ({shown})" if not agree else shown)]
+
+
+def _warm_up() -> None:
+    # Import SymPy một lần khi worker khởi động để check đầu tiên không bị timeout
+    _parse_context()
+    parse_relation("\\frac{1}{2}x = 1")
+
+
+# ==================================================
+# PROCESS POOL + ASYNC API
+# ==================================================
+
+@dataclass
+class VerificationStats:
+    verified: int = 0
+    passed: int = 0
+    failed: int = 0
+    timeouts: int = 0
+    regenerated: int = 0
+    fixed: int = 0
+
+
+def sympy_available() -> bool:
+    return importlib.util.find_spec("sympy") is not None
+
+
+def verification_enabled() -> bool:
+    """MATH_VERIFY (default 1) and SymPy installed."""
+    return os.getenv("MATH_VERIFY", "1").lower() not in ("0", "false", "no") and sympy_available()
+
+
+class Verifier:
+    """
+    Runs check groups in a process pool. A group that exceeds timeout is
+    reported as skipped and the pool is recycled (its worker may be stuck in
+    SymPy and cannot be interrupted otherwise).
+    """
+
+    def __init__(self, workers: int = 2, timeout: float = 2.0, start_method: str = "spawn"):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.start_method = start_method
+        self.stats = VerificationStats()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._ready: Optional["asyncio.Future[Any]"] = None
+
+    async def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+            )
+            loop = asyncio.get_running_loop()
+            self._ready = asyncio.gather(*(
+                loop.run_in_executor(self._pool, _warm_up) for _ in range(self.workers)
+            ))
+        pool, ready = self._pool, self._ready
+        await asyncio.shield(ready)
+        return pool
+
+    def _recycle(self, pool: Optional[ProcessPoolExecutor]) -> None:
+        if pool is None or self._pool is not pool:
+            return
+        self._pool = None
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _run_group(self, name: str, fn: Callable[..., List[CheckResult]], *args: Any) -> List[CheckResult]:
+        pool: Optional[ProcessPoolExecutor] = None
+        try:
+            pool = await self._executor()
+            loop = asyncio.get_running_loop()
+            return await asyncio.wait_for(loop.run_in_executor(pool, fn, *args), self.timeout)
+        except asyncio.TimeoutError:
+            self.stats.timeouts += 1
+            self._recycle(pool)
+            return [CheckResult(name, SKIPPED, f"timed out after {self.timeout:g}s")]
+        except BrokenProcessPool:
+            self._recycle(pool or self._pool)
+            return [CheckResult(name, SKIPPED, "verification worker restarted")]
+
+    async def run(self, groups: List[Tuple[str, Callable[..., List[CheckResult]], Tuple[Any, ...]]]) -> VerificationReport:
+        with stage("verify"):
+            results = await asyncio.gather(*(self._run_group(name, fn, *args) for name, fn, args in groups))
+        report = VerificationReport([check for group in results for check in group])
+        self.stats.verified += 1
+        if report.passed:
+            self.stats.passed += 1
+        else:
+            self.stats.failed += 1
+        return report
+
+    async def verify_solution(self, solution: Any) -> VerificationReport:
+        """Verify every path of a SATMathSolutionOutput and their agreement."""
+        data = solution.model_dump(mode="json")
+        spec = data.get("answer_spec") or {}
+        groups = self._path_groups(data.get("solution_paths") or [], spec)
+        groups.append(("agreement", check_agreement, (data.get("solution_paths") or [], spec)))
+        return await self.run(groups)
+
+    async def verify_path(self, path: Any, answer_spec: Any) -> VerificationReport:
+        """Verify one SolutionPath against the shared answer_spec (pipeline mode)."""
+        return await self.run(self._path_groups([path.model_dump(mode="json")], answer_spec.model_dump(mode="json")))
+
+    @staticmethod
+    def _path_groups(paths: List[Dict[str, Any]], spec: Dict[str, Any]) -> List[Tuple[str, Callable[..., List[CheckResult]], Tuple[Any, ...]]]:
+        groups: List[Tuple[str, Callable[..., List[CheckResult]], Tuple[Any, ...]]] = []
+        for path in paths:
+            groups.append(("arithmetic", check_arithmetic, (path,)))
+            groups.append(("substitution", check_substitution, (path,)))
+            groups.append(("answer", check_answer, (path, spec)))
+        return groups
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": verification_enabled(),
+            "workers": self.workers,
+            "check_timeout_seconds": self.timeout,
+            **asdict(self.stats),
+        }
+
+
+def build_verification_feedback(report: VerificationReport) -> str:
+    """User message asking the model to fix exactly the failed checks."""
+    lines = []
+    for check in report.failed:
+        where = " / ".join(
+            part for part in (
+                f"path {check.path_id}" if check.path_id else "",
+                f"bước {check.step_id}" if check.step_id is not None else "",
+            ) if part
+        )
+        lines.append(f"- [{check.check}] {where + ': ' if where else ''}{check.detail}")
+    return (
+        "Kiểm tra tự động (SymPy) phát hiện lỗi trong lời giải trên:\n"
+        + "\n".join(lines)
+        + "\nHãy kiểm tra lại phép tính, sửa các lỗi này (và các bước/kết luận liên quan) "
+        "rồi trả về lại TOÀN BỘ JSON theo đúng schema."
+    )
+
+
+_verifier: Optional[Verifier] = None
+
+
+def get_verifier() -> Verifier:
+    """
+    Process-wide verifier configured from environment:
+
+    - MATH_VERIFY (default 1; needs SymPy)
+    - VERIFY_WORKERS (process pool size, default 2)
+    - VERIFY_CHECK_TIMEOUT_SECONDS (per check group, default 2)
+    - VERIFY_START_METHOD (multiprocessing start method, default spawn)
+    """
+    global _verifier
+    if _verifier is None:
+        _verifier = Verifier(
+            workers=int(os.getenv("VERIFY_WORKERS", "2")),
+            timeout=float(os.getenv("VERIFY_CHECK_TIMEOUT_SECONDS", "2")),
+            start_method=os.getenv("VERIFY_START_METHOD", "spawn"),
+        )
+    return _verifier
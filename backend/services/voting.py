@@ -0,0 +1,148 @@
+"""
+Self-consistency voting for hard SAT Math problems
+
+One sample of a hard problem is sometimes wrong, and solving again one call
+at a time multiplies latency. Vote mode instead runs k compact answer-only
+samples (SATMathAnswerSample) concurrently, tallies them as they finish and
+stops as soon as a quorum agrees; the full explanation is then generated
+once, for the winning answer (see llm_service._solve_with_vote).
+
+Answers are compared by choice letter for multiple choice, by numeric value
+when the answer parses (SymPy, optional: "x = 7/2" and "3.5" are the same
+vote), and by normalized text otherwise.
+"""
+import os
+import re
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from services.schemas import SATMathAnswerSample
+from services.verification import CHOICE_LETTERS, answer_value, sympy_available
+
+# Đáp án dài hơn thì không parse giá trị (không phải một số / biểu thức ngắn)
+_MAX_PARSED_CHARS = 64
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def vote_samples() -> int:
+    """Samples per vote (MATH_VOTE_SAMPLES, default 5)."""
+    return _env_int("MATH_VOTE_SAMPLES", 5)
+
+
+def vote_quorum(samples: int) -> int:
+    """Agreeing samples that end the vote early (MATH_VOTE_QUORUM, default a majority of samples)."""
+    quorum = _env_int("MATH_VOTE_QUORUM", samples // 2 + 1)
+    return min(quorum, samples)
+
+
+def vote_bands() -> List[str]:
+    """Difficulty bands that are voted on (MATH_VOTE_BANDS, default "hard"); others run single mode."""
+    return [band.strip() for band in os.getenv("MATH_VOTE_BANDS", "hard").split(",") if band.strip()]
+
+
+def vote_params() -> Dict[str, Any]:
+    """Completion params for samples; MATH_VOTE_TEMPERATURE only if set (reasoning models reject it)."""
+    temperature = os.getenv("MATH_VOTE_TEMPERATURE")
+    return {"temperature": float(temperature)} if temperature else {}
+
+
+def _text_key(text: str) -> str:
+    text = (text or "").strip().strip("$")
+    text = re.sub(r"\\(?:text|mathrm|textrm|mbox)\{([^{}]*)\}", r"\1", text)
+    return re.sub(r"\s+", "", text).rstrip(".").lower()
+
+
+def vote_key(sample: SATMathAnswerSample) -> Optional[str]:
+    """
+    What a sample votes for: "choice:B", "value:3.5" or "text:...";
+    None for an empty answer (the sample does not vote).
+    """
+    if sample.correct_choice:
+        return f"choice:{sample.correct_choice}"
+    text = (sample.final_answer or "").strip()
+    if not text:
+        return None
+    if text in CHOICE_LETTERS:
+        return f"choice:{text}"
+    if sympy_available() and len(text) <= _MAX_PARSED_CHARS:
+        try:
+            letter, raw, value = answer_value(text)
+        except Exception:
+            letter, raw, value = None, text, None
+        if letter:
+            return f"choice:{letter}"
+        if value is not None:
+            return f"value:{value:.9g}"
+        text = raw or text
+    key = _text_key(text)
+    return f"text:{key}" if key else None
+
+
+class Ballot:
+    """Tally of sample answers; add() reports when one answer reaches the quorum."""
+
+    def __init__(self, quorum: int):
+        self.quorum = quorum
+        self.counts: Dict[str, int] = {}
+        # Mẫu đầu tiên của mỗi đáp án (dùng làm đáp án gợi ý khi sinh lời giải)
+        self.samples: Dict[str, SATMathAnswerSample] = {}
+
+    def add(self, key: Optional[str], sample: SATMathAnswerSample) -> bool:
+        if key is None:
+            return False
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.samples.setdefault(key, sample)
+        return self.counts[key] >= self.quorum
+
+    @property
+    def votes(self) -> int:
+        return sum(self.counts.values())
+
+    def winner(self) -> Optional[str]:
+        """Answer with the most votes; ties go to the answer that arrived first."""
+        if not self.counts:
+            return None
+        return max(self.counts, key=lambda key: self.counts[key])
+
+
+@dataclass
+class VoteStats:
+    votes: int = 0
+    skipped_band: int = 0
+    samples: int = 0
+    samples_failed: int = 0
+    samples_cancelled: int = 0
+    early_stops: int = 0
+    no_quorum: int = 0
+    fallbacks: int = 0
+    # Lời giải đầy đủ ra đáp án khác đáp án thắng
+    answer_mismatches: int = 0
+    agreement: Dict[str, int] = field(default_factory=dict)
+
+
+_stats = VoteStats()
+
+
+def get_vote_stats() -> VoteStats:
+    return _stats
+
+
+def record_agreement(count: int, total: int) -> None:
+    bucket = f"{count}/{total}"
+    _stats.agreement[bucket] = _stats.agreement.get(bucket, 0) + 1
+
+
+def vote_snapshot() -> Dict[str, Any]:
+    samples = vote_samples()
+    return {
+        "samples_per_vote": samples,
+        "quorum": vote_quorum(samples),
+        "bands": vote_bands(),
+        **asdict(_stats),
+    }
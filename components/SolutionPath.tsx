@@ -1,12 +1,19 @@
 'use client';
 
-import { SolutionPath as SolutionPathType } from '@/types/schemas';
+import { useState } from 'react';
+import {
+  PlannedPath,
+  SolutionPath as SolutionPathType,
+} from '@/types/schemas';
 import SolutionStep from './SolutionStep';
 import DesmosCalculator from './DesmosCalculator';
 import LatexRenderer from './LatexRenderer';
 
 interface SolutionPathProps {
-  path: SolutionPathType;
+  path?: SolutionPathType;
+  /** Lazy mode: hướng giải chưa được sinh, chỉ có stub + nút mở rộng */
+  stub?: PlannedPath;
+  solutionId?: string;
   isRecommended?: boolean;
 }
 
@@ -25,16 +32,77 @@ function formatApproachTypeLabel(approachType: string): string {
   }
 }
 
-function getDisplayTitle(path: SolutionPathType): string {
+function getDisplayTitle(path: Pick<SolutionPathType, 'approach_type' | 'title'>): string {
   // Override UI title for specific approach types (without changing backend output)
   if (path.approach_type === 'exam_trick') return 'Thử đáp án cho trước';
   return path.title;
 }
 
 export default function SolutionPath({
-  path,
+  path: initialPath,
+  stub,
+  solutionId,
   isRecommended = false,
 }: SolutionPathProps) {
+  const [loadedPath, setLoadedPath] = useState<SolutionPathType | null>(null);
+  const [expanding, setExpanding] = useState(false);
+  const [expandError, setExpandError] = useState<string | null>(null);
+  const path = initialPath ?? loadedPath;
+
+  const handleExpand = async () => {
+    if (!stub || !solutionId) return;
+    setExpanding(true);
+    setExpandError(null);
+    try {
+      // Path chỉ được sinh (và cache) khi người dùng mở
+      const response = await fetch(
+        `/api/solve/${encodeURIComponent(solutionId)}/paths/${encodeURIComponent(stub.path_id)}`,
+        { method: 'POST' },
+      );
+      if (!response.ok) {
+        const errorData = await response.json().catch(() => ({}));
+        throw new Error(errorData.error || 'Không thể tạo hướng giải này');
+      }
+      setLoadedPath(await response.json());
+    } catch (err) {
+      setExpandError(err instanceof Error ? err.message : 'Đã xảy ra lỗi');
+    } finally {
+      setExpanding(false);
+    }
+  };
+
+  if (!path) {
+    if (!stub) return null;
+    return (
+      <div className="mb-8 p-6 border-2 border-dashed border-gray-300 rounded-lg bg-white">
+        <h2 className="text-2xl font-bold mb-2">
+          <LatexRenderer content={getDisplayTitle(stub)} />
+        </h2>
+        <div className="flex items-center gap-2 mb-4">
+          <span className="px-2 py-1 text-xs rounded bg-gray-200 text-gray-700">
+            {formatApproachTypeLabel(stub.approach_type)}
+          </span>
+        </div>
+        {stub.focus && (
+          <p className="text-gray-700 mb-4">
+            <LatexRenderer content={stub.focus} />
+          </p>
+        )}
+        <button
+          type="button"
+          onClick={handleExpand}
+          disabled={expanding || !solutionId}
+          className="px-4 py-2 text-sm font-medium rounded-lg bg-blue-600 text-white hover:bg-blue-700 disabled:bg-gray-400"
+        >
+          {expanding ? 'Đang tạo lời giải...' : 'Xem lời giải theo cách này'}
+        </button>
+        {expandError && (
+          <p className="mt-2 text-sm text-red-600">{expandError}</p>
+        )}
+      </div>
+    );
+  }
+
   return (
     <div
       className={`mb-8 p-6 border-2 rounded-lg ${
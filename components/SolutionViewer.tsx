@@ -7,6 +7,8 @@ import LatexRenderer from './LatexRenderer';
 interface SolutionViewerProps {
   solution: SATMathSolutionOutput;
   originalProblem?: string;
+  /** Lời giải đang được stream, các phương pháp còn lại sẽ xuất hiện dần */
+  streaming?: boolean;
 }
 
 function getAggregatedAnswer(solution: SATMathSolutionOutput): string | null {
@@ -48,6 +50,7 @@ function getAggregatedAnswer(solution: SATMathSolutionOutput): string | null {
 export default function SolutionViewer({
   solution,
   originalProblem,
+  streaming = false,
 }: SolutionViewerProps) {
   const aggregatedAnswer = getAggregatedAnswer(solution);
 
@@ -333,6 +336,18 @@ export default function SolutionViewer({
             isRecommended={solution.recommended_path_id === path.path_id}
           />
         ))}
+        {solution.pending_paths?.map((stub) => (
+          <SolutionPath
+            key={stub.path_id}
+            stub={stub}
+            solutionId={solution.solution_id}
+          />
+        ))}
+        {streaming && (
+          <div className="p-4 border-2 border-dashed border-gray-300 rounded-lg text-center text-gray-500 animate-pulse">
+            Đang tạo thêm phương pháp giải...
+          </div>
+        )}
       </div>
     </div>
   );
@@ -0,0 +1,29 @@
+// Helpers shared by the API routes that proxy to the FastAPI backend
+import { NextRequest, NextResponse } from 'next/server';
+
+// Backend rate limit theo client: chuyển IP gốc / API key thay vì IP của proxy
+export function clientHeaders(request: NextRequest): Record<string, string> {
+  const headers: Record<string, string> = {};
+  const forwardedFor = request.headers.get('x-forwarded-for') || request.ip;
+  if (forwardedFor) headers['X-Forwarded-For'] = forwardedFor;
+  const apiKey = request.headers.get('x-api-key');
+  if (apiKey) headers['X-API-Key'] = apiKey;
+  return headers;
+}
+
+// 429 (vượt rate limit) / 503 (quá tải): trả nguyên status + Retry-After, không fallback sang mock
+export function overloadResponse(response: Response): NextResponse | null {
+  if (response.status !== 429 && response.status !== 503) return null;
+  return NextResponse.json(
+    {
+      error:
+        response.status === 429
+          ? 'Bạn gửi quá nhiều yêu cầu, vui lòng thử lại sau ít phút.'
+          : 'Hệ thống đang quá tải, vui lòng thử lại sau.',
+    },
+    {
+      status: response.status,
+      headers: { 'Retry-After': response.headers.get('retry-after') || '5' },
+    },
+  );
+}
@@ -0,0 +1,47 @@
+// Solve through the async job API: create a job, then poll until it finishes
+
+export type JobStatus = 'queued' | 'running' | 'succeeded' | 'failed';
+
+export interface JobState<T> {
+  id: string;
+  status: JobStatus;
+  result?: T | null;
+  error?: string | null;
+}
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+export async function solveWithJob<T>(
+  body: Record<string, unknown>,
+  { pollMs = 1000, maxPollMs = 5000, timeoutMs = 5 * 60 * 1000 } = {},
+): Promise<T> {
+  const created = await fetch('/api/jobs', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body),
+  });
+  const job = await created.json();
+  if (!created.ok) {
+    throw new Error(job.error || 'Không thể giải bài toán');
+  }
+
+  const deadline = Date.now() + timeoutMs;
+  let delay = pollMs;
+  while (Date.now() < deadline) {
+    await sleep(delay);
+    // Giãn dần chu kỳ poll để không dồn request khi job chạy lâu
+    delay = Math.min(delay * 1.5, maxPollMs);
+    const response = await fetch(`/api/jobs/${job.job_id}`);
+    const state: JobState<T> = await response.json();
+    if (!response.ok) {
+      throw new Error((state as { error?: string }).error || 'Không thể giải bài toán');
+    }
+    if (state.status === 'succeeded' && state.result) {
+      return state.result;
+    }
+    if (state.status === 'failed') {
+      throw new Error(state.error || 'Không thể giải bài toán');
+    }
+  }
+  throw new Error('Quá thời gian chờ lời giải');
+}
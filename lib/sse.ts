@@ -0,0 +1,47 @@
+// Minimal Server-Sent Events reader for fetch() responses (POST + stream)
+
+export type SSEHandler = (event: string, data: unknown) => void;
+
+export async function readSSE(
+  response: Response,
+  onEvent: SSEHandler,
+): Promise<void> {
+  if (!response.body) {
+    throw new Error('Response has no body to stream');
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  const dispatch = (block: string) => {
+    let event = 'message';
+    const dataLines: string[] = [];
+    for (const line of block.split('\n')) {
+      if (line.startsWith('event:')) {
+        event = line.slice(6).trim();
+      } else if (line.startsWith('data:')) {
+        dataLines.push(line.slice(5).trimStart());
+      }
+    }
+    if (dataLines.length === 0) return;
+    onEvent(event, JSON.parse(dataLines.join('\n')));
+  };
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true }).replace(/\r\n/g, '\n');
+
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      dispatch(buffer.slice(0, boundary));
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+    }
+  }
+
+  if (buffer.trim()) {
+    dispatch(buffer);
+  }
+}
@@ -136,6 +136,16 @@ export interface SATMathSolutionOutput {
   solution_paths: SolutionPath[];
   recommended_path_id?: string;
   localization?: ProblemLocalization;
+  // Lazy mode: các path còn lại chỉ có stub, sinh khi người dùng mở
+  solution_id?: string;
+  pending_paths?: PlannedPath[];
+}
+
+export interface PlannedPath {
+  path_id: string;
+  approach_type: ApproachType;
+  title: string;
+  focus?: string;
 }
 
 // =========================